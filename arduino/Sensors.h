@@ -6,6 +6,21 @@
 #include <SparkFun_VL53L1X.h>
 #include "Logger.h"
 
+// Set to 1 to start every line with "T (ms): <millis()>" so the host can
+// timestamp readings with the board's clock instead of their USB arrival time
+#ifndef LOG_MILLIS
+#define LOG_MILLIS 0
+#endif
+
+// Set to 1 to send fixed-size binary frames instead of text lines (set
+// serial_protocol: binary in config.yaml). Frame layout, little-endian:
+// sync 0xA5 0x5A, sequence uint16, millis() uint32, online mask uint8,
+// one uint16 distance per sensor (0xFFFF = no reading), CRC-16/CCITT-FALSE
+// uint16 over everything between the sync word and the CRC.
+#ifndef BINARY_FRAMES
+#define BINARY_FRAMES 0
+#endif
+
 class Sensors {
 public:
     Sensors();
@@ -15,6 +30,9 @@ public:
 
 private:
     static const int numSensors = 8;
+    static const int frameSize = 2 + 2 + 4 + 1 + 2 * numSensors + 2;
+    static const uint16_t noReading = 0xFFFF;
+    uint16_t frameSequence = 0;
     QWIICMUX mux;
     SFEVL53L1X distanceSensors[numSensors];
     bool sensorOnline[numSensors];
@@ -23,6 +41,8 @@ private:
     int failureCount[numSensors] = {0};
 
     void initSensor(int channel);
+    int readDistance(int channel);
+    void sendFrame();
 };
 
 #endif
\ No newline at end of file
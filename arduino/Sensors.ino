@@ -34,28 +34,83 @@ void Sensors::initSensor(int channel) {
     }
 }
 
+// Distance in mm, or -1 if the sensor is offline or has no new reading
+int Sensors::readDistance(int channel) {
+    if (!sensorOnline[channel]) {
+        return -1;
+    }
+    mux.setPort(channel);
+    if (distanceSensors[channel].checkForDataReady()) {
+        int distance = distanceSensors[channel].getDistance();
+        distanceSensors[channel].clearInterrupt();
+        failureCount[channel] = 0;
+        return distance;
+    }
+    if (++failureCount[channel] >= failureThreshold) {
+        sensorOnline[channel] = false;
+    }
+    return -1;
+}
+
 void Sensors::logReadings() {
+#if BINARY_FRAMES
+    sendFrame();
+#else
     String line;
+#if LOG_MILLIS
+    line += "T (ms): " + String(millis()) + " ";
+#endif
     for (int i = 0; i < numSensors; i++) {
-        if (sensorOnline[i]) {
-            mux.setPort(i);
-            if (distanceSensors[i].checkForDataReady()) {
-                int distance = distanceSensors[i].getDistance();
-                distanceSensors[i].clearInterrupt();
-                line += "D" + String(i) + " (mm): " + String(distance) + " ";
-                failureCount[i] = 0;
-            } else {
-                line += "D" + String(i) + " (mm): null ";
-                if (++failureCount[i] >= failureThreshold) {
-                    sensorOnline[i] = false;
-                }
-            }
+        int distance = readDistance(i);
+        if (distance >= 0) {
+            line += "D" + String(i) + " (mm): " + String(distance) + " ";
         } else {
             line += "D" + String(i) + " (mm): null ";
         }
     }
     line.trim(); // Remove trailing space
     logger.mainOutput(line);
+#endif
+}
+
+static void putUint16(uint8_t* out, uint16_t value) {
+    out[0] = value & 0xFF;
+    out[1] = value >> 8;
+}
+
+static void putUint32(uint8_t* out, uint32_t value) {
+    putUint16(out, value & 0xFFFF);
+    putUint16(out + 2, value >> 16);
+}
+
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), the same as Python's binascii.crc_hqx(data, 0xFFFF)
+static uint16_t crc16(const uint8_t* data, int length) {
+    uint16_t crc = 0xFFFF;
+    while (length--) {
+        crc ^= (uint16_t)(*data++) << 8;
+        for (int bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+void Sensors::sendFrame() {
+    uint8_t frame[frameSize];
+    frame[0] = 0xA5;
+    frame[1] = 0x5A;
+    putUint16(frame + 2, frameSequence++);
+    putUint32(frame + 4, millis());
+    uint8_t online = 0;
+    for (int i = 0; i < numSensors; i++) {
+        // Online as of this reading; readDistance may take the sensor offline
+        if (sensorOnline[i]) online |= 1 << i;
+        int distance = readDistance(i);
+        putUint16(frame + 9 + 2 * i, distance >= 0 ? distance : noReading);
+    }
+    frame[8] = online;
+    putUint16(frame + frameSize - 2, crc16(frame + 2, frameSize - 4));
+    Serial.write(frame, frameSize);
 }
 
 void Sensors::reinitializeOfflineSensors() {
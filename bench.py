@@ -0,0 +1,599 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from calibration import apply_calibration, mm_to_inches
+import capturefile
+import pyramid
+from serialreader import SerialLineReader
+from serialframes import FrameDecoder, check_decoder, encode_frame
+from simserial import SimulatedSerial, format_line, synthetic_passes
+
+# Calibration used by the benchmarks, same shape as config.yaml's calibration_map
+CALIBRATION_MAP = {0: -1, 1: -1, 2: -1, 3: -1}
+
+def timed(func, *args, repeat=3):
+    """Run func several times and return the best wall time in seconds and its last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def synthetic_frame(rows, num_sensors=8, seed=0):
+    """A capture-shaped frame with the same columns the loggers write."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Timestamp (PST)': 1_700_000_000_000 + np.arange(rows, dtype=np.int64) * 125 // num_sensors,
+        'Sensor Number': np.tile(np.arange(num_sensors), rows // num_sensors + 1)[:rows],
+        'Measurement': rng.integers(20, 4000, size=rows),
+    })
+
+def legacy_calibration(df):
+    """The per-row df.apply that plot.process_and_plot used before calibration.py."""
+    active_sensors = df['Sensor Number'].unique()
+
+    def apply_row(measurement, sensor_id):
+        if sensor_id in active_sensors:
+            measurement = measurement + CALIBRATION_MAP.get(sensor_id, 0)
+        return round(measurement / 25.4 * 8) / 8
+
+    return df.apply(lambda row: apply_row(row['Measurement'], row['Sensor Number']), axis=1)
+
+def vectorized_calibration(df):
+    return mm_to_inches(apply_calibration(df['Measurement'], df['Sensor Number'], CALIBRATION_MAP))
+
+def bench_calibration(rows, legacy_rows):
+    df = synthetic_frame(rows)
+    vectorized_time, result = timed(vectorized_calibration, df)
+
+    # The row-wise version is far too slow to run on the full frame, so time it
+    # on a slice and scale the per-row cost up to the full size.
+    sample = df.iloc[:legacy_rows]
+    legacy_time, legacy_result = timed(legacy_calibration, sample, repeat=1)
+    if not np.array_equal(legacy_result.to_numpy(), result[:legacy_rows]):
+        raise AssertionError("Vectorized calibration does not match the row-wise result")
+    legacy_estimate = legacy_time * rows / legacy_rows
+
+    print(f"calibration: {rows:,} rows")
+    print(f"  vectorized: {vectorized_time:.3f} s ({rows / vectorized_time:,.0f} rows/s)")
+    print(f"  row-wise:   {legacy_estimate:.1f} s estimated from {legacy_rows:,} rows ({legacy_rows / legacy_time:,.0f} rows/s)")
+    print(f"  speedup:    {legacy_estimate / vectorized_time:,.0f}x")
+
+def synthetic_lines(count, num_sensors=8, seed=0):
+    """Lines in the exact format Sensors::logReadings sends, with an occasional null reading."""
+    rng = np.random.default_rng(seed)
+    values = rng.integers(20, 4000, size=(count, num_sensors))
+    nulls = rng.random((count, num_sensors)) < 0.02
+    lines = []
+    for row, null_row in zip(values.tolist(), nulls.tolist()):
+        fields = [f"D{i} (mm): {'null' if is_null else value}" for i, (value, is_null) in enumerate(zip(row, null_row))]
+        lines.append(("[MAIN] " + " ".join(fields) + "\r\n").encode('ascii'))
+    return lines
+
+class PacedPort:
+    """Minimal serial.Serial stand-in that releases lines at a fixed rate.
+
+    With lines_per_second=None every line is available immediately, which
+    measures raw parsing throughput.
+    """
+    def __init__(self, lines, lines_per_second=None, timeout=1):
+        self.data = b''.join(lines)
+        self.ends = np.cumsum([len(line) for line in lines])
+        self.lines_per_second = lines_per_second
+        self.timeout = timeout
+        self.start = time.perf_counter()
+        self.position = 0
+
+    def available_end(self):
+        if self.lines_per_second is None:
+            return len(self.data)
+        released = min(int((time.perf_counter() - self.start) * self.lines_per_second), len(self.ends))
+        return int(self.ends[released - 1]) if released else 0
+
+    @property
+    def in_waiting(self):
+        return self.available_end() - self.position
+
+    @property
+    def exhausted(self):
+        return self.position >= len(self.data)
+
+    def read(self, size=1):
+        deadline = time.perf_counter() + self.timeout
+        while self.in_waiting == 0 and not self.exhausted and time.perf_counter() < deadline:
+            # Block like the serial driver does until the next line is due
+            next_line = int((time.perf_counter() - self.start) * self.lines_per_second) + 1
+            time.sleep(max(0, min(deadline, self.start + next_line / self.lines_per_second) - time.perf_counter()))
+        end = min(self.position + size, self.available_end())
+        data = self.data[self.position:end]
+        self.position = end
+        return data
+
+    def readline(self):
+        end = self.data.find(b'\n', self.position) + 1 or len(self.data)
+        data = self.data[self.position:end]
+        self.position = end
+        return data
+
+def legacy_serial_loop(port):
+    """The gather.log_sensor_readings loop before serialreader.py: poll, readline, decode, regex."""
+    count = 0
+    while not port.exhausted:
+        if port.in_waiting:
+            line = port.readline().decode('utf-8', errors='ignore').strip()
+            pattern = re.compile(r'D(\d)\s*\(mm\):\s*(\d+)')
+            matches = re.findall(pattern, line)
+            timestamp = int(time.time() * 1000)
+            for hit in matches:
+                sensor_id = int(hit[0])
+                data_value = int(hit[1])
+                count += 1
+    return count
+
+def reader_serial_loop(port):
+    reader = SerialLineReader(port)
+    count = 0
+    while not port.exhausted or reader.buffer:
+        count += len(reader.read_samples())
+    return count
+
+def measure_loop(loop, port):
+    """Run a reader loop to completion and return (samples, wall seconds, CPU percent)."""
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    samples = loop(port)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return samples, wall, 100 * cpu / wall
+
+def bench_serial(lines, rate, paced_seconds):
+    data = synthetic_lines(lines)
+    print(f"serial parsing: {lines:,} lines of 8 sensors")
+    for name, loop in [('readline+regex', legacy_serial_loop), ('SerialLineReader', reader_serial_loop)]:
+        samples, wall, _ = measure_loop(loop, PacedPort(data))
+        print(f"  {name:17s} throughput: {lines / wall:,.0f} lines/s ({samples:,} samples)")
+
+    paced_lines = int(rate * paced_seconds)
+    print(f"serial CPU at {rate:g} lines/s for {paced_seconds:g} s")
+    for name, loop in [('readline+regex', legacy_serial_loop), ('SerialLineReader', reader_serial_loop)]:
+        _, wall, cpu_percent = measure_loop(loop, PacedPort(data[:paced_lines], lines_per_second=rate))
+        print(f"  {name:17s} CPU: {cpu_percent:.1f}%")
+
+def bench_frames(frames, corrupt_probability, drop_probability, seed=0):
+    """Binary frame decoding: throughput, and whether damaged and dropped frames are all accounted for."""
+    check_decoder()
+    rng = np.random.default_rng(seed)
+    values = rng.integers(20, 4000, size=(frames, 8)).tolist()
+    stream = bytearray(b'Online sensors: 8\r\n')  # Text the firmware prints at startup
+    dropped = damaged = 0
+    last_intact = -1  # Frames missing after the last intact one can't show up in the sequence numbers
+    for sequence, row in enumerate(values):
+        if rng.random() < drop_probability:
+            dropped += 1
+            continue
+        frame = bytearray(encode_frame(sequence, sequence * 125, 0xFF, row))
+        if rng.random() < corrupt_probability:
+            frame[rng.integers(len(frame))] ^= 1 << int(rng.integers(8))
+            damaged += 1
+        else:
+            last_intact = sequence
+        stream += frame
+    lines = synthetic_lines(frames)
+    print(f"binary frames: {frames:,} frames, {len(stream) / frames:.1f} bytes/frame "
+          f"vs {sum(map(len, lines)) / frames:.1f} bytes/line as text")
+
+    # Feed the decoder in serial-sized pieces
+    decoder = FrameDecoder()
+    start = time.perf_counter()
+    decoded = []
+    for offset in range(0, len(stream), 4096):
+        decoded += decoder.feed(bytes(stream[offset:offset + 4096]))
+    samples = decoder.samples(decoded, lambda millis: millis)
+    wall = time.perf_counter() - start
+    print(f"  decode throughput: {len(decoded) / wall:,.0f} frames/s ({len(samples):,} samples)")
+    print(f"  decoded {len(decoded):,} of {frames:,}; lost frames counted: {decoder.lost_frames:,} "
+          f"(dropped {dropped:,} + damaged {damaged:,} = {dropped + damaged:,}), "
+          f"CRC errors {decoder.crc_errors:,}, skipped bytes {decoder.skipped_bytes:,}")
+    assert decoder.lost_frames == last_intact + 1 - len(decoded), "lost frames don't add up to the dropped and damaged ones"
+
+    start = time.perf_counter()
+    samples, _, _ = measure_loop(reader_serial_loop, PacedPort(lines))
+    print(f"  text parsing of the same readings: {frames / (time.perf_counter() - start):,.0f} lines/s")
+
+def bench_simulated_rates(rates, seconds):
+    """Feed SerialLineReader from a simulated Arduino at increasing line rates and count what gets lost."""
+    print(f"simulated capture, {seconds:g} s per rate")
+    for rate in rates:
+        port = SimulatedSerial(synthetic_passes(rate=rate, duration=seconds, null_probability=0.01), timeout=0.1)
+        reader = SerialLineReader(port)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        samples = 0
+        while not port.exhausted or port.buffer:
+            samples += len(reader.read_samples())
+        wall = time.perf_counter() - wall_start
+        cpu_percent = 100 * (time.process_time() - cpu_start) / wall
+        total = port.lines_sent + port.dropped_lines
+        print(f"  {rate:>8,.0f} Hz: {reader.lines_read / wall:>9,.0f} lines/s read, "
+              f"{port.dropped_lines:,} of {total:,} lines dropped, CPU {cpu_percent:.1f}%")
+
+def legacy_event_window(df):
+    """The single window plot.py trimmed every capture to before passes: first to last reading below the threshold."""
+    import plot
+    below = df.loc[df['Measurement'] < plot.THRESHOLD_INCHES, 'Timestamp (PST)']
+    if below.empty:
+        return None
+    return below.iloc[0], below.iloc[-1]
+
+def seaborn_render_plot(grouped, grouping_frequency_words, output_filename):
+    """The seaborn/pyplot renderer plot.py drew its PNGs with before PlotRenderer, as a baseline."""
+    import warnings
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import plot
+    _, mdates = plot.matplotlib_modules()
+    plt.figure(figsize=(16, 9))
+    with warnings.catch_warnings():
+        # seaborn's own FutureWarnings, which plot.py used to silence for the whole process
+        warnings.simplefilter(action='ignore', category=FutureWarning)
+        lines = sns.lineplot(data=grouped, x='Timestamp (PST)', y='Measurement', hue='Sensor Number', palette='tab10')
+
+    plt.title(f'Minimum Measurement per Sensor (Grouped every {grouping_frequency_words})')
+    plt.xlabel('Timestamp')
+    plt.ylabel('Measurement (inches)')
+    plt.legend(title='Sensor Number')
+    plt.grid(True)
+    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M:%S'))
+    plt.gcf().autofmt_xdate()
+
+    plt.yscale('log')
+    plt.autoscale(enable=True, axis='y')
+
+    for y_value, color, label in plot.REFERENCE_LINES:
+        plt.axhline(y=y_value, color=color, linestyle='--')
+        plt.text(grouped['Timestamp (PST)'].iloc[-1], y_value, f'  {label}', verticalalignment='center', color=color)
+
+    # Label only the lowest point of each sensor
+    for sensor in grouped['Sensor Number'].unique():
+        sensor_data = grouped[grouped['Sensor Number'] == sensor]
+        min_row = sensor_data.loc[sensor_data['Measurement'].idxmin()]
+        plt.text(min_row['Timestamp (PST)'], min_row['Measurement'] - 0.5, plot.min_label(min_row['Measurement']),
+                 color=lines.get_lines()[sensor].get_color(), fontsize=9, verticalalignment='top')
+
+    plt.savefig(output_filename)
+    plt.close()
+
+def bench_render(figures, seconds):
+    """Figures per second for the seaborn/pyplot renderer and the reusable Agg renderer."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import plot
+
+    workdir = tempfile.mkdtemp(prefix='sensors-bench-')
+    try:
+        csv_path = os.path.join(workdir, 'capture.csv')
+        write_capture_csv(synthetic_capture(seconds), csv_path)
+        _, _, df = plot.load_passes(csv_path)[0]
+        frequency = plot.determine_grouping_frequency(df['Timestamp (PST)'].min(), df['Timestamp (PST)'].max())
+        grouped = plot.group_minimums(df, frequency)
+        words = plot.convert_frequency_to_words(frequency)
+        print(f"PNG rendering: {figures} figures of {len(grouped):,} points")
+        for name, render in [('seaborn', seaborn_render_plot), ('PlotRenderer', plot.fast_render_plot)]:
+            start = time.perf_counter()
+            for i in range(figures):
+                render(grouped, words, os.path.join(workdir, f'{name}_{i}.png'))
+            wall = time.perf_counter() - start
+            print(f"  {name:12s} {figures / wall:6.2f} figures/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_startup(repeat, seconds):
+    """Wall time of fresh interpreters running each plot.py entry point on a small capture.
+
+    Every run is a new process, so this is what a user waits for at the
+    command line: interpreter start, imports, config and the work itself.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix='sensors-bench-')
+    results = []
+    try:
+        csv_path = os.path.join(workdir, 'capture.csv')
+        write_capture_csv(synthetic_capture(seconds), csv_path)
+        commands = [
+            ('python', ['-c', 'pass']),
+            ('import_plot', ['-c', 'import plot']),
+            ('closest', ['closest.py', csv_path]),
+            ('plot_summary', ['plot.py', '--summary', csv_path]),
+            ('plot_png', ['plot.py', csv_path]),
+        ]
+        env = dict(os.environ, MPLBACKEND='Agg')
+        print(f"Startup, best of {repeat} fresh processes ({seconds:g} s capture)")
+        for name, command in commands:
+            seconds_taken, _ = timed(lambda: subprocess.run([sys.executable] + command, cwd=repo, env=env, check=True,
+                                                            stdout=subprocess.DEVNULL), repeat=repeat)
+            results.append({'stage': 'startup', 'dataset': name, 'rows': 0, 'seconds': seconds_taken, 'rows_per_second': None})
+            print(f"  {name:14s} {seconds_taken * 1000:8.0f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+# Dataset sizes for the suite, as seconds of capture
+DATASETS = {'1s': 1, '1min': 60, '1h': 3600, '24h': 86400}
+SUITE_STAGES = ['parse', 'csv_write', 'csv_load', 'calibration', 'event_detection', 'segmentation',
+                'groupby_min', 'pyramid_build', 'pyramid_query', 'png_render', 'png_render_fast', 'process_directory']
+
+def synthetic_capture(seconds, rate=8, num_sensors=8, seed=0, passes=1):
+    """Raw capture frame (epoch ms, sensor, mm) for one line per 1/rate seconds on every sensor.
+
+    A single tug pass dips every sensor below the event threshold in the
+    middle of the capture, like a real per-door recording; with passes > 1
+    the dips are spread evenly over it, like a session past several doors.
+    """
+    rng = np.random.default_rng(seed)
+    lines = max(1, int(seconds * rate))
+    line_times = np.arange(lines) / rate
+    pass_width = min(10, seconds / 4)
+    centers = seconds * np.arange(1, passes + 1) / (passes + 1)
+    distance = 1500 - 1350 * np.exp(-((line_times[:, None] - centers) / max(pass_width / 4, 1e-3)) ** 2).sum(axis=1)
+    readings = distance[:, None] + np.arange(num_sensors) * 20 + rng.normal(0, 5, (lines, num_sensors))
+    return pd.DataFrame({
+        'Timestamp (PST)': np.repeat(1_700_000_000_000 + (line_times * 1000).astype(np.int64), num_sensors),
+        'Sensor Number': np.tile(np.arange(num_sensors), lines),
+        'Measurement': np.clip(readings, 0, None).astype(np.int64).ravel(),
+    })
+
+def capture_lines(df, num_sensors=8):
+    """The serial lines the Arduino would have sent for a synthetic capture."""
+    values = df['Measurement'].to_numpy().reshape(-1, num_sensors)
+    return [format_line(row) for row in values.tolist()]
+
+def write_capture_csv(df, path):
+    """Write a capture one row at a time through csv.writer, like the loggers do."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Timestamp (PST)', 'Sensor Number', 'Measurement'])
+        for row in zip(*(df[column].tolist() for column in df.columns)):
+            writer.writerow(row)
+
+def run_suite(sizes, stages, files, jobs, repeat):
+    """Time each pipeline stage on each dataset size and return one result dict per measurement."""
+    import plot  # Loads config.yaml and the plotting stack, so only when the suite runs
+
+    results = []
+
+    def record(stage, dataset, rows, seconds):
+        results.append({'stage': stage, 'dataset': dataset, 'rows': rows, 'seconds': seconds,
+                        'rows_per_second': rows / seconds if seconds else None})
+        print(f"  {stage:18s} {dataset:>5s} {rows:>12,} rows {seconds:10.4f} s")
+
+    workdir = tempfile.mkdtemp(prefix='sensors-bench-')
+    try:
+        for dataset in sizes:
+            raw = synthetic_capture(DATASETS[dataset])
+            rows = len(raw)
+            csv_path = os.path.join(workdir, f'{dataset}.csv')
+
+            if 'parse' in stages:
+                lines = capture_lines(raw)
+                seconds, _ = timed(lambda: reader_serial_loop(PacedPort(lines)), repeat=repeat)
+                record('parse', dataset, rows, seconds)
+            if 'csv_write' in stages or any(stage in stages for stage in SUITE_STAGES[2:11]):
+                seconds, _ = timed(write_capture_csv, raw, csv_path, repeat=1)
+                if 'csv_write' in stages:
+                    record('csv_write', dataset, rows, seconds)
+            if 'csv_load' in stages:
+                seconds, _ = timed(pd.read_csv, csv_path, repeat=repeat)
+                record('csv_load', dataset, rows, seconds)
+
+            df = pd.read_csv(csv_path)
+            if 'calibration' in stages:
+                seconds, _ = timed(lambda: mm_to_inches(apply_calibration(df['Measurement'], df['Sensor Number'], plot.calibration_map)), repeat=repeat)
+                record('calibration', dataset, rows, seconds)
+
+            prepared = plot.prepare_capture(df.copy(), csv_path)
+            if 'event_detection' in stages:
+                seconds, _ = timed(lambda: plot.trim_to_event(prepared, *legacy_event_window(prepared)), repeat=repeat)
+                record('event_detection', dataset, rows, seconds)
+            if 'segmentation' in stages:
+                seconds, _ = timed(lambda: [plot.slice_pass(prepared, *window) for window in plot.find_event_passes(prepared)],
+                                   repeat=repeat)
+                record('segmentation', dataset, rows, seconds)
+
+            window = legacy_event_window(prepared)
+            trimmed = plot.trim_to_event(prepared, *window) if window else prepared
+            frequency = plot.determine_grouping_frequency(trimmed['Timestamp (PST)'].min(), trimmed['Timestamp (PST)'].max())
+            if 'groupby_min' in stages:
+                seconds, _ = timed(plot.group_minimums, trimmed, frequency, repeat=repeat)
+                record('groupby_min', dataset, len(trimmed), seconds)
+            if 'pyramid_build' in stages:
+                columns = [df[column].to_numpy() for column in ['Timestamp (PST)', 'Sensor Number', 'Measurement']]
+                seconds, _ = timed(lambda: pyramid.write_sidecar(csv_path, pyramid.build_pyramid(*columns), False, columns[0]),
+                                   repeat=repeat)
+                record('pyramid_build', dataset, rows, seconds)
+            if 'pyramid_query' in stages:
+                start, end = trimmed['Timestamp (PST)'].min(), trimmed['Timestamp (PST)'].max()
+                pyramid.load_pyramid(csv_path)
+                seconds, _ = timed(plot.pyramid_minimums, csv_path, start, end, frequency, repeat=repeat)
+                record('pyramid_query', dataset, len(trimmed), seconds)
+            grouped = plot.group_minimums(trimmed, frequency)
+            png_path = os.path.join(workdir, f'{dataset}.png')
+            for stage, render in [('png_render', seaborn_render_plot), ('png_render_fast', plot.fast_render_plot)]:
+                if stage in stages:
+                    seconds, _ = timed(render, grouped, plot.convert_frequency_to_words(frequency), png_path, repeat=repeat)
+                    record(stage, dataset, len(grouped), seconds)
+            os.remove(csv_path)
+            if os.path.exists(pyramid.sidecar_path(csv_path)):
+                os.remove(pyramid.sidecar_path(csv_path))
+
+        if 'process_directory' in stages:
+            directory = os.path.join(workdir, 'batch')
+            os.makedirs(directory)
+            raw = synthetic_capture(DATASETS['1min'])
+            write_capture_csv(raw, os.path.join(directory, 'run_0.csv'))
+            for i in range(1, files):
+                shutil.copy(os.path.join(directory, 'run_0.csv'), os.path.join(directory, f'run_{i}.csv'))
+            seconds, _ = timed(plot.process_directory, directory, jobs, False, repeat=1)
+            record('process_directory', f'{files}x1min', len(raw) * files, seconds)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def save_results(results, path):
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Results saved to {path}")
+
+def compare_results(baseline_path, current_path):
+    """Print the time ratio of every stage/dataset measured in both result files."""
+    with open(baseline_path) as f:
+        baseline = {(r['stage'], r['dataset']): r for r in json.load(f)['results']}
+    with open(current_path) as f:
+        current = json.load(f)['results']
+    print(f"{'stage':18s} {'dataset':>9s} {'baseline s':>11s} {'current s':>11s} {'ratio':>7s}")
+    for result in current:
+        before = baseline.get((result['stage'], result['dataset']))
+        if before is None:
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('nan')
+        print(f"{result['stage']:18s} {result['dataset']:>9s} {before['seconds']:11.4f} {result['seconds']:11.4f} {ratio:7.2f}")
+
+def bench_compression(seconds, repeat, rate=8):
+    """Logging cost, file size and read throughput of plain, gzip, zstd and binary captures.
+
+    Rows are written the way the loggers write them, a second of capture
+    at a time with a flush after each (which ends a zstd frame or makes a
+    gzip sync point), and the write cost is reported per second of
+    capture: the serial reader must never wait on the log.
+    """
+    raw = synthetic_capture(seconds, rate)
+    rows = raw.to_numpy().tolist()
+    rows_per_second = rate * 8
+    workdir = tempfile.mkdtemp(prefix='sensors-bench-')
+    results = []
+    try:
+        print(f"Capture compression: {seconds:g} s capture, {len(rows):,} rows, best of {repeat}")
+        print(f"  {'format':6s} {'bytes':>12s} {'ratio':>6s} {'write':>16s} {'read (pandas)':>16s} {'read (numpy)':>16s}")
+        plain_size = None
+        for capture_format, compression in [('csv', None), ('csv', 'gzip'), ('csv', 'zstd'), ('bin', None)]:
+            name = compression or capture_format
+            try:
+                path = os.path.join(workdir, 'capture' + capturefile.capture_extension(capture_format, compression))
+            except ValueError as e:
+                print(f"  {name:6s} skipped: {e}")
+                continue
+
+            def write():
+                log_file, writer = capturefile.open_capture_log(path, 8)
+                with log_file:
+                    for start in range(0, len(rows), rows_per_second):
+                        writer.writerows(rows[start:start + rows_per_second])
+                        log_file.flush()
+            write_seconds, _ = timed(write, repeat=repeat)
+            size = os.path.getsize(path)
+            plain_size = plain_size or size
+            pandas_seconds, _ = timed(capturefile.read_capture, path, repeat=repeat)
+            numpy_seconds, _ = timed(capturefile.read_capture_arrays, path, repeat=repeat)
+            print(f"  {name:6s} {size:12,d} {plain_size / size:6.1f} {write_seconds / seconds * 1000:8.3f} ms/s "
+                  f"{len(rows) / pandas_seconds:12,.0f} r/s {len(rows) / numpy_seconds:12,.0f} r/s")
+            for stage, stage_seconds in [('write', write_seconds), ('read_pandas', pandas_seconds), ('read_numpy', numpy_seconds)]:
+                results.append({'stage': f'compression_{stage}', 'dataset': name, 'rows': len(rows), 'seconds': stage_seconds,
+                                'rows_per_second': len(rows) / stage_seconds})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sensor processing hot paths.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    calibration_parser = subparsers.add_parser('calibration', help='Vectorized vs row-wise calibration and unit conversion')
+    calibration_parser.add_argument('--rows', type=int, default=10_000_000, help='Rows in the synthetic frame')
+    calibration_parser.add_argument('--legacy-rows', type=int, default=100_000, help='Rows to time the row-wise version on')
+
+    serial_parser = subparsers.add_parser('serial', help='Serial line ingestion throughput (lines/s) and CPU use')
+    serial_parser.add_argument('--lines', type=int, default=200_000, help='Lines for the throughput test')
+    serial_parser.add_argument('--rate', type=float, default=8, help='Line rate for the CPU test (the Arduino sends 8 lines/s at a 125 ms interval)')
+    serial_parser.add_argument('--seconds', type=float, default=5, help='Duration of the CPU test')
+
+    frames_parser = subparsers.add_parser('frames', help='Binary frame decoding throughput and loss accounting')
+    frames_parser.add_argument('--frames', type=int, default=200_000, help='Frames in the synthetic stream')
+    frames_parser.add_argument('--corrupt', type=float, default=0.001, help='Probability of a flipped bit in a frame')
+    frames_parser.add_argument('--drop', type=float, default=0.001, help='Probability of a frame going missing')
+
+    simulate_parser = subparsers.add_parser('simulate', help='Lines read and dropped against a simulated Arduino at several rates')
+    simulate_parser.add_argument('--rates', type=float, nargs='+', default=[8, 100, 1000, 10000, 50000], help='Line rates in Hz')
+    simulate_parser.add_argument('--seconds', type=float, default=3, help='Duration per rate')
+
+    suite_parser = subparsers.add_parser('suite', help='Time every pipeline stage on synthetic 8-sensor captures of several sizes')
+    suite_parser.add_argument('--sizes', nargs='+', choices=list(DATASETS), default=list(DATASETS), help='Dataset sizes to run')
+    suite_parser.add_argument('--stages', nargs='+', choices=SUITE_STAGES, default=SUITE_STAGES, help='Stages to time')
+    suite_parser.add_argument('--files', type=int, default=20, help='Number of 1-minute files for the process_directory stage')
+    suite_parser.add_argument('--jobs', type=int, default=1, help='Worker processes for the process_directory stage')
+    suite_parser.add_argument('--repeat', type=int, default=3, help='Runs per stage (the best time is kept)')
+    suite_parser.add_argument('--output', default='bench_results.json', help='JSON file to save the results to')
+
+    render_parser = subparsers.add_parser('render', help='PNG rendering throughput in figures/s')
+    render_parser.add_argument('--figures', type=int, default=20, help='Figures to render with each renderer')
+    render_parser.add_argument('--seconds', type=float, default=60, help='Length of the synthetic capture behind each figure')
+
+    startup_parser = subparsers.add_parser('startup', help='Command-line startup time of plot.py, plot.py --summary and closest.py')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='Runs per command (the best time is kept)')
+    startup_parser.add_argument('--seconds', type=float, default=60, help='Length of the synthetic capture')
+    startup_parser.add_argument('--output', help='Also save the results to this JSON file (for bench.py compare)')
+
+    compression_parser = subparsers.add_parser('compression', help='Write cost, size and read throughput of plain, gzip and zstd CSV and binary captures')
+    compression_parser.add_argument('--seconds', type=float, default=3600, help='Length of the synthetic capture')
+    compression_parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (the best time is kept)')
+    compression_parser.add_argument('--output', help='Also save the results to this JSON file (for bench.py compare)')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two saved suite results')
+    compare_parser.add_argument('baseline', help='Earlier results JSON')
+    compare_parser.add_argument('current', help='Newer results JSON')
+
+    args = parser.parse_args()
+    if args.benchmark == 'suite':
+        print("benchmark suite")
+        save_results(run_suite(args.sizes, args.stages, args.files, args.jobs, args.repeat), args.output)
+    elif args.benchmark == 'compare':
+        compare_results(args.baseline, args.current)
+    elif args.benchmark == 'calibration':
+        bench_calibration(args.rows, args.legacy_rows)
+    elif args.benchmark == 'serial':
+        bench_serial(args.lines, args.rate, args.seconds)
+    elif args.benchmark == 'startup':
+        results = bench_startup(args.repeat, args.seconds)
+        if args.output:
+            save_results(results, args.output)
+    elif args.benchmark == 'compression':
+        results = bench_compression(args.seconds, args.repeat)
+        if args.output:
+            save_results(results, args.output)
+    elif args.benchmark == 'render':
+        bench_render(args.figures, args.seconds)
+    elif args.benchmark == 'frames':
+        bench_frames(args.frames, args.corrupt, args.drop)
+    elif args.benchmark == 'simulate':
+        bench_simulated_rates(args.rates, args.seconds)
+
+if __name__ == "__main__":
+    main()
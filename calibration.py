@@ -0,0 +1,31 @@
+import numpy as np
+
+MM_PER_INCH = 25.4
+
+def calibration_offsets(calibration_map, size=0):
+    """Build a lookup table of calibration offsets indexed by sensor ID.
+
+    Sensors without an entry in calibration_map get an offset of 0. The table
+    is at least `size` entries long so it can be indexed by every sensor ID
+    present in the data.
+    """
+    keys = [int(sensor_id) for sensor_id in (calibration_map or {})]
+    length = max([size] + [key + 1 for key in keys])
+    offsets = np.zeros(length, dtype=np.float64)
+    for sensor_id, offset in (calibration_map or {}).items():
+        offsets[int(sensor_id)] = offset
+    return offsets
+
+def apply_calibration(measurements, sensor_ids, calibration_map):
+    """Add the per-sensor calibration offset to a whole column of measurements."""
+    sensor_ids = np.asarray(sensor_ids, dtype=np.intp)
+    size = int(sensor_ids.max()) + 1 if sensor_ids.size else 0
+    offsets = calibration_offsets(calibration_map, size)
+    return np.asarray(measurements, dtype=np.float64) + offsets[sensor_ids]
+
+def mm_to_inches(mm):
+    """Convert millimeters to inches rounded to the nearest 1/8 inch.
+
+    Accepts a scalar, a NumPy array or a pandas Series and returns the same kind.
+    """
+    return np.round(mm / MM_PER_INCH * 8) / 8
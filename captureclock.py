@@ -0,0 +1,84 @@
+import time
+from collections import deque
+
+# Captures store UTC epoch milliseconds; this is only applied when times are shown or exported
+DISPLAY_TIMEZONE = 'America/Los_Angeles'
+
+MILLIS_WRAP = 1 << 32  # The Arduino's unsigned long millis() wraps after ~49.7 days
+
+class CaptureClock:
+    """Wall clock for sample timestamps, read once and advanced with perf_counter.
+
+    time.time() is sampled a single time when the clock is created; after
+    that timestamps come from the monotonic high-resolution counter, so they
+    never jump when the system clock is adjusted and cost one integer
+    subtraction per call. All readers in a process share default_clock so
+    timestamps from several boards are directly comparable.
+    """
+    def __init__(self):
+        self.anchor_wall_ns = time.time_ns()
+        self.anchor_perf_ns = time.perf_counter_ns()
+
+    def now_ms(self):
+        """Current time as integer UTC epoch milliseconds."""
+        return (self.anchor_wall_ns + time.perf_counter_ns() - self.anchor_perf_ns) // 1_000_000
+
+    def monotonic_ms(self):
+        """Milliseconds on the monotonic counter, for measuring intervals."""
+        return time.perf_counter_ns() // 1_000_000
+
+default_clock = CaptureClock()
+
+class DeviceClockMapper:
+    """Maps the Arduino's millis() on each line to host epoch milliseconds.
+
+    A line reaches the host some USB/buffering latency after the board
+    stamped it, and that latency is never negative, so the smallest
+    (arrival - millis) difference seen recently is the best estimate of the
+    offset between the two clocks. The minimum is kept over a sliding window
+    of window_ms, which lets the estimate follow the crystal's drift
+    relative to the host clock. Lines are then timestamped at millis +
+    offset: spaced exactly as the board measured them, without the host's
+    arrival jitter. A millis() value going backwards (board reset) or more
+    than max_gap_ms forward starts a fresh estimate; the 32-bit wrap is
+    unwrapped.
+    """
+    def __init__(self, window_ms=30_000, max_gap_ms=60_000):
+        self.window_ms = window_ms
+        self.max_gap_ms = max_gap_ms
+        self.offsets = deque()  # (device ms, arrival - device ms), increasing offsets: a monotonic min queue
+        self.last_device_ms = None
+        self.wraps = 0
+        self.resets = 0
+
+    def timestamp(self, millis, arrival_ms):
+        """Host epoch ms for a line the board stamped with millis() that arrived at arrival_ms."""
+        device_ms = millis + self.wraps * MILLIS_WRAP
+        if self.last_device_ms is not None and device_ms < self.last_device_ms:
+            if self.last_device_ms - device_ms > MILLIS_WRAP // 2:
+                self.wraps += 1
+                device_ms += MILLIS_WRAP
+            else:
+                self.reset()
+        if self.last_device_ms is not None and device_ms - self.last_device_ms > self.max_gap_ms:
+            self.reset()
+        self.last_device_ms = device_ms
+
+        offset = arrival_ms - device_ms
+        offsets = self.offsets
+        while offsets and offsets[-1][1] >= offset:
+            offsets.pop()
+        offsets.append((device_ms, offset))
+        while offsets[0][0] < device_ms - self.window_ms:
+            offsets.popleft()
+        return device_ms + offsets[0][1]
+
+    def reset(self):
+        self.offsets.clear()
+        self.last_device_ms = None
+        self.resets += 1
+
+def to_display_time(timestamps_ms, timezone=DISPLAY_TIMEZONE):
+    """Epoch-millisecond timestamps (a pandas Series) as naive local times in the display timezone."""
+    import pandas as pd
+    return pd.to_datetime(timestamps_ms, unit='ms', utc=True).dt.tz_convert(timezone).dt.tz_localize(None)
@@ -0,0 +1,389 @@
+import argparse
+import csv
+import io
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+CSV_HEADER = ['Timestamp (PST)', 'Sensor Number', 'Measurement']
+
+# Binary capture layout: a small header followed by fixed-width little-endian
+# records of (int64 epoch ms, uint8 sensor, uint16 mm), 11 bytes each.
+BINARY_EXTENSION = '.bin'
+BINARY_MAGIC = b'SNSRLOG\0'
+BINARY_VERSION = 1
+# magic, version, sensor count, metadata length
+HEADER_STRUCT = struct.Struct('<8sHBI')
+RECORD_STRUCT = struct.Struct('<qBH')
+RECORD_DTYPE = np.dtype([('timestamp', '<i8'), ('sensor', 'u1'), ('measurement', '<u2')])
+
+# CSV captures can be written as gzip or zstd streams; the extension says which
+COMPRESSED_EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+COMPRESSION_EXTENSIONS = {compression: extension for extension, compression in COMPRESSED_EXTENSIONS.items()}
+DEFAULT_COMPRESSION_LEVELS = {'gzip': 6, 'zstd': 3}
+CAPTURE_EXTENSIONS = ('.csv', '.csv.gz', '.csv.zst', BINARY_EXTENSION)
+# Empty file a logger leaves next to a capture once it has closed it, for watch.py
+CLOSE_MARKER_SUFFIX = '.closed'
+
+def is_capture_file(path):
+    return path.endswith(CAPTURE_EXTENSIONS)
+
+def is_binary_capture(path):
+    return path.endswith(BINARY_EXTENSION)
+
+def compression_of(path):
+    """'gzip' or 'zstd' for a compressed capture, None for a plain one."""
+    return COMPRESSED_EXTENSIONS.get(os.path.splitext(path)[1])
+
+def capture_stem(path):
+    """File name of a capture without its extensions, e.g. run for run.csv.gz."""
+    name = os.path.basename(path)
+    if compression_of(name):
+        name = os.path.splitext(name)[0]
+    return os.path.splitext(name)[0]
+
+def capture_extension(capture_format='csv', compression=None):
+    """Extension for new captures: .bin, .csv, .csv.gz or .csv.zst. Binary captures are never compressed.
+
+    Raises ValueError for an unknown compression, or zstd without the zstandard package.
+    """
+    if capture_format == 'bin':
+        return BINARY_EXTENSION
+    if compression in (None, 'none'):
+        return '.csv'
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unknown capture compression {compression!r}; use none, gzip or zstd")
+    if compression == 'zstd':
+        import_zstandard()
+    return '.csv' + COMPRESSION_EXTENSIONS[compression]
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd captures need the zstandard package (pip install zstandard)") from None
+    return zstandard
+
+def find_capture_files(directory):
+    """Every capture file (CSV or binary) under directory, in a stable order, skipping plot.py's summary file."""
+    capture_files = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            if is_capture_file(file) and file != 'lowest_readings.csv':
+                capture_files.append(os.path.join(root, file))
+    return capture_files
+
+def close_marker_path(path):
+    return path + CLOSE_MARKER_SUFFIX
+
+def write_close_marker(path):
+    with open(close_marker_path(path), 'w'):
+        pass
+
+class CompressedCaptureFile:
+    """Text file for csv.writer that compresses as it writes.
+
+    flush() ends a zstd frame (or makes a gzip sync point), so everything
+    written before it can be read back even if the logger dies before
+    close(); the loggers flush about once a second.
+    """
+    def __init__(self, filename, compression, level=None):
+        level = DEFAULT_COMPRESSION_LEVELS[compression] if level is None else level
+        if compression == 'zstd':
+            zstandard = import_zstandard()
+            self.finish_mode = zstandard.COMPRESSOBJ_FLUSH_FINISH
+            self.new_compressor = zstandard.ZstdCompressor(level=level).compressobj
+        else:
+            self.finish_mode = zlib.Z_FINISH
+            # wbits 31 writes the gzip container rather than a bare zlib stream
+            self.new_compressor = lambda: zlib.compressobj(level, zlib.DEFLATED, 31)
+        self.compression = compression
+        self.name = filename
+        self.raw = open(filename, 'wb')
+        self.compressor = None
+
+    def write(self, text):
+        if self.compressor is None:
+            self.compressor = self.new_compressor()
+        self.raw.write(self.compressor.compress(text.encode('utf-8')))
+        return len(text)
+
+    def flush(self):
+        if self.compressor is not None:
+            if self.compression == 'zstd':
+                # A finished frame stands on its own; the next write starts a new one
+                self.raw.write(self.compressor.flush(self.finish_mode))
+                self.compressor = None
+            else:
+                self.raw.write(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.raw.flush()
+
+    def fileno(self):
+        return self.raw.fileno()
+
+    def close(self):
+        if self.raw.closed:
+            return
+        if self.compressor is not None:
+            self.raw.write(self.compressor.flush(self.finish_mode))
+            self.compressor = None
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class StreamDecompressor:
+    """Incremental decompression of a gzip or zstd capture, across members and frames.
+
+    A stream cut off mid-frame (a logger that died) simply ends at the last
+    data that could be decoded.
+    """
+    def __init__(self, compression):
+        if compression == 'zstd':
+            self.new_decompressor = import_zstandard().ZstdDecompressor().decompressobj
+        else:
+            self.new_decompressor = lambda: zlib.decompressobj(31)
+        self.decompressor = None
+
+    def decompress(self, data):
+        output = []
+        while data:
+            if self.decompressor is None:
+                self.decompressor = self.new_decompressor()
+            output.append(self.decompressor.decompress(data))
+            if self.decompressor.eof:
+                data = self.decompressor.unused_data
+                self.decompressor = None
+            else:
+                data = b''
+        return b''.join(output)
+
+class DecompressingReader(io.RawIOBase):
+    """Readable binary stream of a compressed capture's decompressed bytes, for pandas and NumPy.
+
+    If the file ends mid-stream the partial last line is dropped, so a
+    capture whose logger died reads as every complete row it wrote.
+    """
+    def __init__(self, path, compression, block_size=1 << 20):
+        self.file = open(path, 'rb')
+        self.decompressor = StreamDecompressor(compression)
+        self.block_size = block_size
+        self.buffer = memoryview(b'')
+        self.held = b''  # Text after the last newline, released once more data or a clean end comes
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not len(self.buffer):
+            block = self.file.read(self.block_size)
+            if not block:
+                if self.decompressor.decompressor is None:
+                    self.buffer, self.held = memoryview(self.held), b''
+                else:
+                    self.held = b''
+                if not len(self.buffer):
+                    return 0
+                break
+            data = self.held + self.decompressor.decompress(block)
+            end = data.rfind(b'\n') + 1
+            self.buffer, self.held = memoryview(data)[:end], data[end:]
+        count = min(len(target), len(self.buffer))
+        target[:count] = self.buffer[:count]
+        self.buffer = self.buffer[count:]
+        return count
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+def complete_length(f, block_size=1 << 16):
+    """Bytes of an open file up to and including its last newline (0 if it has none)."""
+    position = f.seek(0, os.SEEK_END)
+    while position > 0:
+        length = min(block_size, position)
+        position -= length
+        f.seek(position)
+        newline = f.read(length).rfind(b'\n')
+        if newline >= 0:
+            return position + newline + 1
+    return 0
+
+class CompleteLinesReader(io.RawIOBase):
+    """Readable binary stream of the first length bytes of a file, for a plain CSV cut off mid-row."""
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        count = self.file.readinto(memoryview(target)[:self.remaining])
+        self.remaining -= count
+        return count
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+def open_capture_csv(path):
+    """Binary stream of a CSV capture's complete lines, decompressed on the fly for .gz and .zst."""
+    compression = compression_of(path)
+    if compression is None:
+        f = open(path, 'rb')
+        length = complete_length(f)
+        f.seek(0)
+        if length == os.fstat(f.fileno()).st_size:
+            return f
+        # The loggers end every row with a newline, so text after the last one is a row
+        # a logger died in the middle of writing; drop it, as DecompressingReader does
+        return io.BufferedReader(CompleteLinesReader(f, length), buffer_size=1 << 20)
+    return io.BufferedReader(DecompressingReader(path, compression), buffer_size=1 << 20)
+
+class BinaryCaptureWriter:
+    """Drop-in for csv.writer that writes fixed-width binary records."""
+    def __init__(self, file, sensor_count, metadata=None):
+        self.file = file
+        encoded = json.dumps(metadata or {}).encode('utf-8')
+        file.write(HEADER_STRUCT.pack(BINARY_MAGIC, BINARY_VERSION, sensor_count, len(encoded)))
+        file.write(encoded)
+
+    def writerow(self, row):
+        timestamp, sensor_id, measurement = row
+        self.file.write(RECORD_STRUCT.pack(int(timestamp), int(sensor_id), int(measurement)))
+
+    def writerows(self, rows):
+        self.file.write(b''.join(RECORD_STRUCT.pack(int(t), int(s), int(m)) for t, s, m in rows))
+
+def open_capture_log(filename, sensor_count, metadata=None):
+    """Open a capture log for writing and return (file, writer).
+
+    The format follows the extension: '.bin' gets the binary layout, '.gz'
+    and '.zst' a compressed CSV, anything else a plain CSV with the usual
+    header row. Either way the writer takes [timestamp, sensor_id,
+    measurement] rows.
+    """
+    if is_binary_capture(filename):
+        log_file = open(filename, 'wb')
+        return log_file, BinaryCaptureWriter(log_file, sensor_count, metadata)
+    compression = compression_of(filename)
+    if compression is not None:
+        log_file = CompressedCaptureFile(filename, compression)
+    else:
+        log_file = open(filename, 'w', newline='')
+    writer = csv.writer(log_file)
+    writer.writerow(CSV_HEADER)
+    return log_file, writer
+
+def read_binary_header(path):
+    """Return (sensor_count, metadata, data_offset) for a binary capture."""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_STRUCT.size)
+        if len(header) < HEADER_STRUCT.size:
+            raise ValueError(f"{path} is too short to be a binary capture")
+        magic, version, sensor_count, metadata_length = HEADER_STRUCT.unpack(header)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary capture")
+        if version != BINARY_VERSION:
+            raise ValueError(f"{path} has unsupported binary capture version {version}")
+        metadata = json.loads(f.read(metadata_length).decode('utf-8') or '{}')
+    return sensor_count, metadata, HEADER_STRUCT.size + metadata_length
+
+def map_binary_capture(path):
+    """Memory-map the records of a binary capture as a structured array."""
+    _, _, offset = read_binary_header(path)
+    # A logger that died mid-record leaves a partial record at the end; ignore it
+    count = (os.path.getsize(path) - offset) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=offset, shape=(count,))
+
+def read_capture_arrays(path):
+    """Load a capture as (timestamps, sensors, measurements) NumPy arrays without pandas.
+
+    Only for captures with epoch-millisecond timestamps: a CSV with date
+    string timestamps raises ValueError, and callers fall back to read_capture.
+    """
+    if is_binary_capture(path):
+        records = map_binary_capture(path)
+        return records['timestamp'], records['sensor'], records['measurement']
+    with io.TextIOWrapper(open_capture_csv(path), encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f), None)
+        if header is None:
+            raise ValueError(f"{path} is empty")
+        missing = [column for column in CSV_HEADER if column not in header]
+        if missing:
+            raise KeyError(f"CSV file {path} is missing columns: {missing}")
+        columns = [header.index(column) for column in CSV_HEADER]
+        data = np.loadtxt(f, delimiter=',', dtype=np.int64, usecols=columns, ndmin=2)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+def read_capture(path):
+    """Load a capture (CSV or binary) into a DataFrame with the CSV column names."""
+    import pandas as pd
+    if not is_binary_capture(path):
+        with open_capture_csv(path) as f:
+            return pd.read_csv(f)
+    records = map_binary_capture(path)
+    return pd.DataFrame({
+        'Timestamp (PST)': records['timestamp'],
+        'Sensor Number': records['sensor'],
+        'Measurement': records['measurement'],
+    })
+
+def iter_capture(path, chunksize):
+    """Yield a capture as DataFrames of at most chunksize rows, with the CSV column names."""
+    import pandas as pd
+    if not is_binary_capture(path):
+        with open_capture_csv(path) as f, pd.read_csv(f, chunksize=chunksize) as chunks:
+            yield from chunks
+        return
+    records = map_binary_capture(path)
+    for start in range(0, len(records), chunksize):
+        chunk = records[start:start + chunksize]
+        yield pd.DataFrame({
+            'Timestamp (PST)': np.asarray(chunk['timestamp']),
+            'Sensor Number': np.asarray(chunk['sensor']),
+            'Measurement': np.asarray(chunk['measurement']),
+        }, index=pd.RangeIndex(start, start + len(chunk)))
+
+def csv_to_binary(csv_path, binary_path, metadata=None):
+    df = read_capture(csv_path)
+    records = np.empty(len(df), dtype=RECORD_DTYPE)
+    records['timestamp'] = df['Timestamp (PST)']
+    records['sensor'] = df['Sensor Number']
+    records['measurement'] = df['Measurement']
+    sensor_count = int(df['Sensor Number'].max()) + 1 if len(df) else 0
+    metadata = dict(metadata or {}, source=os.path.basename(csv_path))
+    with open(binary_path, 'wb') as f:
+        BinaryCaptureWriter(f, sensor_count, metadata)
+        records.tofile(f)
+
+def binary_to_csv(binary_path, csv_path):
+    # pandas compresses by the extension, so a .csv.gz or .csv.zst output works too
+    read_capture(binary_path).to_csv(csv_path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert capture logs between the CSV and binary formats.')
+    parser.add_argument('path', type=str, help='CSV or .bin capture to convert')
+    parser.add_argument('output', type=str, nargs='?', help='Output file (defaults to the input name with the other extension)')
+    args = parser.parse_args()
+
+    base = os.path.join(os.path.dirname(args.path), capture_stem(args.path))
+    if is_binary_capture(args.path):
+        output = args.output or base + '.csv'
+        binary_to_csv(args.path, output)
+    else:
+        output = args.output or base + BINARY_EXTENSION
+        csv_to_binary(args.path, output)
+    print(f"Wrote {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import yaml
+from runnames import parse_run_name
+
+DEFAULT_DB = 'run_catalog.sqlite'
+# Bump when the stored summaries change meaning; older catalogs are rebuilt from scratch
+CATALOG_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    calibration TEXT NOT NULL,
+    detection TEXT NOT NULL,
+    layout TEXT,
+    run_date TEXT,
+    building TEXT,
+    radio TEXT,
+    tug TEXT,
+    step TEXT,
+    passes INTEGER NOT NULL,
+    left_min REAL,
+    right_min REAL,
+    closest REAL
+);
+CREATE TABLE IF NOT EXISTS sensor_minima (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    sensor INTEGER NOT NULL,
+    min_inches REAL NOT NULL,
+    min_time TEXT,
+    PRIMARY KEY (run_id, sensor)
+);
+-- One row per pass below the threshold, as in plot.py's lowest_readings.csv
+CREATE TABLE IF NOT EXISTS passes (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    number INTEGER NOT NULL,
+    event_start TEXT NOT NULL,
+    event_end TEXT NOT NULL,
+    left_min REAL,
+    right_min REAL,
+    closest REAL,
+    PRIMARY KEY (run_id, number)
+);
+-- Queries filter on a field and a date range and sort by closest; with closest in
+-- every index, counting and filtering never has to touch the table itself
+CREATE INDEX IF NOT EXISTS runs_building_step_tug ON runs (building, step, tug, run_date, closest);
+CREATE INDEX IF NOT EXISTS runs_building ON runs (building, run_date, closest);
+CREATE INDEX IF NOT EXISTS runs_tug ON runs (tug, run_date, closest);
+CREATE INDEX IF NOT EXISTS runs_step ON runs (step, run_date, closest);
+CREATE INDEX IF NOT EXISTS runs_date ON runs (run_date, closest);
+CREATE INDEX IF NOT EXISTS runs_closest ON runs (closest);
+"""
+
+def connect(db_path=DEFAULT_DB):
+    connection = sqlite3.connect(db_path)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA foreign_keys = ON')
+    if connection.execute('PRAGMA user_version').fetchone()[0] != CATALOG_VERSION:
+        connection.executescript('DROP TABLE IF EXISTS passes; DROP TABLE IF EXISTS sensor_minima; DROP TABLE IF EXISTS runs;')
+        connection.execute(f'PRAGMA user_version = {CATALOG_VERSION}')
+    connection.executescript(SCHEMA)
+    return connection
+
+def summarize_capture(file_path):
+    """Everything process_and_plot works out for a capture, without drawing the PNG.
+
+    Returns (summary, error); summary is None for a capture without an event.
+    The summary has a row per pass, like lowest_readings.csv, and the
+    closest reading of every sensor and side over all of them. Runs in
+    worker processes, so it never raises.
+    """
+    import plot  # Loads config.yaml and the plotting stack, so only in the processes that need it
+    try:
+        windows = plot.load_passes(file_path)
+        if not windows:
+            return None, None
+        passes = []
+        sensors = {}
+        for number, (start, end, df) in enumerate(windows, 1):
+            closest_readings, closest_times = plot.find_closest(df)
+            left, right = plot.lowest_side_readings(closest_readings)
+            passes.append((number, start.isoformat(), end.isoformat(), None if left is None else float(left),
+                           None if right is None else float(right), float(closest_readings.min())))
+            for sensor, reading in closest_readings.items():
+                # A tie keeps the earlier pass, like the first time a sensor read its minimum
+                if sensor not in sensors or reading < sensors[sensor][0]:
+                    sensors[sensor] = (float(reading), closest_times[sensor].isoformat())
+        lefts = [left for _, _, _, left, _, _ in passes if left is not None]
+        rights = [right for _, _, _, _, right, _ in passes if right is not None]
+        summary = {
+            'passes': passes,
+            'left_min': min(lefts) if lefts else None,
+            'right_min': min(rights) if rights else None,
+            'sensors': [(int(sensor), reading, time) for sensor, (reading, time) in sorted(sensors.items())],
+        }
+        return summary, None
+    except Exception as e:
+        return None, e
+
+def update_catalog(connection, directory, config, jobs=1):
+    """Add new and changed captures under directory to the catalog and drop deleted ones.
+
+    A file is (re)processed when its size or mtime changed since it was
+    catalogued, or the calibration map or the pass detection settings are
+    different; everything else costs one stat call. Returns (added,
+    updated, removed) counts.
+    """
+    import plot
+    import runcache
+    calibration = json.dumps(config.get('calibration_map') or {}, sort_keys=True)
+    detection = json.dumps(runcache.detection_settings(config))
+    known = {row['path']: row for row in connection.execute('SELECT id, path, size, mtime_ns, calibration, detection FROM runs')}
+    directory = os.path.abspath(directory)
+
+    stale = []
+    seen = set()
+    for file_path in plot.find_csv_files(directory):
+        path = os.path.abspath(file_path)
+        seen.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            print(f"Failed to read {path}: {e}")
+            continue
+        row = known.get(path)
+        if row is None or ((row['size'], row['mtime_ns'], row['calibration'], row['detection']) !=
+                           (stat.st_size, stat.st_mtime_ns, calibration, detection)):
+            stale.append((path, stat))
+
+    if jobs > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(summarize_capture, [path for path, _ in stale], chunksize=8))
+    else:
+        results = [summarize_capture(path) for path, _ in stale]
+
+    lists = (config.get('buildingcodes') or [], config.get('tugs') or [], config.get('door_list') or [])
+    added = updated = 0
+    with connection:
+        for (path, stat), (summary, error) in zip(stale, results):
+            if error is not None:
+                print(f"Failed to process {path}: {error}")
+                continue
+            name = parse_run_name(path, *lists) or {}
+            run_date = name.get('date')
+            if run_date is None:
+                # Layouts without {DATE}: fall back to when the file was written
+                run_date = datetime.fromtimestamp(stat.st_mtime)
+            summary = summary or {}
+            minima = [reading for _, reading, _ in summary.get('sensors', [])]
+            values = {
+                'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'calibration': calibration, 'detection': detection,
+                'layout': name.get('layout'), 'run_date': run_date.isoformat(timespec='seconds'),
+                'building': name.get('building'), 'radio': name.get('radio'), 'tug': name.get('tug'), 'step': name.get('step'),
+                'passes': len(summary.get('passes', [])), 'left_min': summary.get('left_min'), 'right_min': summary.get('right_min'),
+                'closest': min(minima) if minima else None,
+            }
+            if path in known:
+                connection.execute('DELETE FROM runs WHERE id = ?', (known[path]['id'],))
+                updated += 1
+            else:
+                added += 1
+            columns = ', '.join(values)
+            cursor = connection.execute(f'INSERT INTO runs ({columns}) VALUES ({", ".join("?" * len(values))})',
+                                        list(values.values()))
+            connection.executemany('INSERT INTO sensor_minima (run_id, sensor, min_inches, min_time) VALUES (?, ?, ?, ?)',
+                                   [(cursor.lastrowid, *sensor) for sensor in summary.get('sensors', [])])
+            connection.executemany('INSERT INTO passes (run_id, number, event_start, event_end, left_min, right_min, closest) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   [(cursor.lastrowid, *event_pass) for event_pass in summary.get('passes', [])])
+
+        # Only files under the directory that was scanned can have disappeared
+        removed = [row['id'] for path, row in known.items()
+                   if path not in seen and path.startswith(directory + os.sep)]
+        connection.executemany('DELETE FROM runs WHERE id = ?', [(run_id,) for run_id in removed])
+    if added or updated or removed:
+        # Refresh the statistics the query planner uses to pick an index
+        connection.execute('ANALYZE')
+    return added, updated, len(removed)
+
+def query_runs(connection, building=None, radio=None, tug=None, step=None, since=None, until=None, limit=20):
+    """Runs matching the filters, closest approach first, and the number of matching runs."""
+    conditions = ['closest IS NOT NULL']
+    parameters = []
+    for column, value in [('building', building), ('radio', radio), ('tug', tug), ('step', step)]:
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            parameters.append(value)
+    if since is not None:
+        conditions.append('run_date >= ?')
+        parameters.append(since)
+    if until is not None:
+        # A bare date includes the whole day
+        conditions.append('run_date < ?' if 'T' in until else "run_date < date(?, '+1 day')")
+        parameters.append(until)
+    where = ' AND '.join(conditions)
+    count = connection.execute(f'SELECT COUNT(*) FROM runs WHERE {where}', parameters).fetchone()[0]
+    rows = connection.execute(f'SELECT * FROM runs WHERE {where} ORDER BY closest, run_date LIMIT ?',
+                              parameters + [limit]).fetchall()
+    return rows, count
+
+def sensor_minima(connection, run_id):
+    return connection.execute('SELECT sensor, min_inches, min_time FROM sensor_minima WHERE run_id = ? ORDER BY sensor',
+                              (run_id,)).fetchall()
+
+def print_runs(connection, rows, count, elapsed):
+    print(f"{count} run(s) with an event ({elapsed * 1000:.1f} ms)")
+    if not rows:
+        return
+    closest = rows[0]
+    print(f"Closest approach: {closest['closest']} inches, {closest['tug']} at {closest['building']}{closest['radio'] or ''} "
+          f"{closest['step']} on {closest['run_date']} ({closest['path']})")
+    print(f"{'date':19s} {'building':8s} {'tug':6s} {'step':18s} {'passes':>6s} {'closest':>7s} {'left':>6s} {'right':>6s}  sensors")
+    for row in rows:
+        sensors = ' '.join(f"{sensor['sensor']}:{sensor['min_inches']:g}" for sensor in sensor_minima(connection, row['id']))
+        left = '' if row['left_min'] is None else f"{row['left_min']:g}"
+        right = '' if row['right_min'] is None else f"{row['right_min']:g}"
+        building = f"{row['building'] or ''}{row['radio'] or ''}"
+        print(f"{row['run_date']:19s} {building:8s} {row['tug'] or '':6s} {row['step'] or '':18s} "
+              f"{row['passes']:6d} {row['closest']:7g} {left:>6s} {right:>6s}  {sensors}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Index capture runs in a SQLite catalog and query their closest approaches.')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'Catalog database file (default {DEFAULT_DB})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = subparsers.add_parser('update', help='Add new or changed captures under a directory to the catalog')
+    update_parser.add_argument('directory', help='Directory containing capture files')
+    update_parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of worker processes for new files')
+
+    query_parser = subparsers.add_parser('query', help='Runs matching the filters, closest approach first')
+    query_parser.add_argument('--building', help='Building code, e.g. BLD3')
+    query_parser.add_argument('--radio', help='Radio letter next to the building code, e.g. A')
+    query_parser.add_argument('--tug', help='Tug, e.g. agv2')
+    query_parser.add_argument('--step', help='Door step, e.g. Dock-outer')
+    query_parser.add_argument('--since', help='First date to include, e.g. 2024-05-01')
+    query_parser.add_argument('--until', help='Last date to include, e.g. 2024-05-31')
+    query_parser.add_argument('--limit', type=int, default=20, help='Number of runs to list')
+    args = parser.parse_args()
+
+    connection = connect(args.db)
+    if args.command == 'update':
+        with open('config.yaml', 'r') as f:
+            config = yaml.safe_load(f)
+        added, updated, removed = update_catalog(connection, args.directory, config, args.jobs)
+        print(f"Catalog {args.db}: {added} added, {updated} updated, {removed} removed")
+    else:
+        start = time.perf_counter()
+        rows, count = query_runs(connection, args.building, args.radio, args.tug, args.step, args.since, args.until, args.limit)
+        print_runs(connection, rows, count, time.perf_counter() - start)
+    connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,7 @@ def remove_png_files(target_path):
     # Walk through the directory and its subdirectories
     for root, dirs, files in os.walk(target_path):
         for file in files:
-            if file.endswith('.png'):
+            if file.endswith(('.png', '.pyramid')):  # plots and pyramid sidecars, both rebuilt by plot.py
                 file_path = os.path.join(root, file)
                 try:
                     os.remove(file_path)
@@ -0,0 +1,132 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+import numpy as np
+import yaml
+from calibration import apply_calibration, mm_to_inches
+from captureclock import DISPLAY_TIMEZONE
+from eventgate import event_settings
+from extremes import approach_settings, extreme_index
+from segments import find_passes, pass_settings
+import capturefile
+
+# Closest reading per sensor with nothing but NumPy: no pandas, matplotlib or seaborn
+# to import, so a summary of one capture is printed in a fraction of plot.py's startup time.
+
+def load_config(config_file='config.yaml'):
+    with open(config_file, 'r') as f:
+        return yaml.safe_load(f)
+
+def epoch_ms_to_display(timezone=DISPLAY_TIMEZONE):
+    """Converter from epoch ms to a naive local datetime in the display timezone, like plot.py shows."""
+    from zoneinfo import ZoneInfo
+    zone = ZoneInfo(timezone)
+    def convert(timestamp_ms):
+        seconds, millis = divmod(int(timestamp_ms), 1000)
+        return (datetime.fromtimestamp(seconds, zone) + timedelta(milliseconds=millis)).replace(tzinfo=None)
+    return convert
+
+def naive_ms_to_datetime(timestamp_ms):
+    return datetime(1970, 1, 1) + timedelta(milliseconds=int(timestamp_ms))
+
+def load_capture_arrays(path):
+    """(timestamps_ms, sensors, mm, naive) for any capture.
+
+    Epoch-millisecond captures never touch pandas. Old captures with date
+    string timestamps are parsed with pandas; their local times are then
+    carried as naive milliseconds and naive is True. An epoch-millisecond
+    capture NumPy can't parse (e.g. a row with an empty field) also goes
+    through pandas, which skips the incomplete rows.
+    """
+    try:
+        timestamps, sensors, measurements = capturefile.read_capture_arrays(path)
+        return timestamps, sensors, measurements, False
+    except ValueError:
+        pass
+    import pandas as pd
+    df = capturefile.read_capture(path)
+    if pd.api.types.is_numeric_dtype(df['Timestamp (PST)']):
+        df = df.dropna(subset=capturefile.CSV_HEADER)
+        return (df['Timestamp (PST)'].to_numpy(np.int64), df['Sensor Number'].to_numpy(np.int64),
+                df['Measurement'].to_numpy(np.int64), False)
+    timestamps = pd.to_datetime(df['Timestamp (PST)']).to_numpy('datetime64[ms]').astype(np.int64)
+    return timestamps, df['Sensor Number'].to_numpy(), df['Measurement'].to_numpy(), True
+
+def closest_approaches(path, config):
+    """Every pass below the event threshold with the closest approaches per sensor and per side of the tug.
+
+    Passes are found the same way plot.py finds them (segments.find_passes)
+    and each is widened by the padding. Returns a list of (start, end,
+    per_sensor, per_side), with start and end the first and last low
+    reading as datetimes and per_sensor and per_side as from
+    extremes.extreme_index in inches; empty if the capture has no event.
+    """
+    timestamps, sensors, measurements, naive = load_capture_arrays(path)
+    to_datetime = naive_ms_to_datetime if naive else epoch_ms_to_display()
+    _, threshold_mm, padding_seconds = event_settings(config)
+    hysteresis_mm, merge_gap_seconds = pass_settings(config)
+    count, min_gap_seconds = approach_settings(config)
+    sensors = np.asarray(sensors)
+    inches = mm_to_inches(apply_calibration(measurements, sensors, config.get('calibration_map')))
+    if len(timestamps) and np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, sensors, inches = timestamps[order], sensors[order], inches[order]
+
+    starts, ends = find_passes(timestamps, inches, mm_to_inches(threshold_mm),
+                               mm_to_inches(threshold_mm + hysteresis_mm), merge_gap_seconds * 1000)
+    padding_ms = padding_seconds * 1000
+    sides = {'left': config.get('left_side_sensors') or [], 'right': config.get('right_side_sensors') or []}
+
+    def readable(approaches):
+        return [approach._replace(reading=float(approach.reading), time=to_datetime(approach.time))
+                for approach in approaches]
+    passes = []
+    for start, end in zip(starts, ends):
+        # The rows are in time order, so each padded window is one slice
+        low = np.searchsorted(timestamps, start - padding_ms, side='left')
+        high = np.searchsorted(timestamps, end + padding_ms, side='right')
+        per_sensor, per_side = extreme_index(timestamps[low:high], sensors[low:high], inches[low:high],
+                                             count, int(min_gap_seconds * 1000), sides)
+        passes.append((to_datetime(start), to_datetime(end),
+                       {sensor: readable(approaches) for sensor, approaches in sorted(per_sensor.items())},
+                       {side: readable(approaches) for side, approaches in per_side.items()}))
+    return passes
+
+def print_summary(path, config):
+    try:
+        passes = closest_approaches(path, config)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error reading {path}: {e}")
+        return
+    if not passes:
+        print("No event found in the dataset.")
+        return
+    for number, (start, end, per_sensor, per_side) in enumerate(passes, 1):
+        print(f"Pass {number} of {len(passes)}: {start} to {end} ({(end - start).total_seconds():g} s)")
+        for sensor, (closest, *_) in per_sensor.items():
+            print(f"Sensor {sensor} - Closest Reading: {closest.reading} inches at {closest.time}")
+        for side, side_approaches in per_side.items():
+            print(f"{side.capitalize()} side closest approaches:")
+            for approach in side_approaches:
+                print(f"  {approach.reading} inches at {approach.time} (sensor {approach.sensor})")
+
+def summarize_path(path, config):
+    """Print the closest readings of a capture, or of every capture under a directory."""
+    if os.path.isfile(path) and capturefile.is_capture_file(path):
+        print_summary(path, config)
+    elif os.path.isdir(path):
+        for file_path in capturefile.find_capture_files(path):
+            print(f"{file_path}:")
+            print_summary(file_path, config)
+    else:
+        print(f"Invalid input: {path}. Please provide a valid CSV file or directory.")
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the closest reading of every sensor in a capture without plotting.')
+    parser.add_argument('path', type=str, help='CSV/.bin capture file or directory containing capture files')
+    args = parser.parse_args()
+
+    summarize_path(args.path, load_config())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import numpy as np
+
+def minmax_decimate(timestamps, values, start, end, width):
+    """Reduce a time series to at most 2 points per pixel column.
+
+    timestamps must be sorted. Samples in [start, end] are binned into
+    `width` columns and each column is replaced by its minimum and maximum,
+    so the drawn envelope looks the same as drawing every sample while the
+    cost of drawing depends only on the width. Returns (columns, ys) with
+    column positions in pixels (0..width) and the min/max pairs in order.
+    """
+    first = int(np.searchsorted(timestamps, start, side='left'))
+    last = int(np.searchsorted(timestamps, end, side='right'))
+    if last <= first or width <= 0 or end <= start:
+        return np.empty(0), np.empty(0)
+
+    t = timestamps[first:last]
+    y = values[first:last]
+    columns = ((t - start) * width // (end - start)).astype(np.int64)
+    np.clip(columns, 0, width - 1, out=columns)
+
+    # Each run of equal column numbers is one pixel column
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+    mins = np.minimum.reduceat(y, starts)
+    maxs = np.maximum.reduceat(y, starts)
+
+    xs = np.repeat(columns[starts], 2).astype(np.float64)
+    ys = np.empty(2 * len(starts), dtype=np.float64)
+    ys[0::2] = mins
+    ys[1::2] = maxs
+    return xs, ys
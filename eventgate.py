@@ -0,0 +1,114 @@
+from collections import deque
+from calibration import apply_calibration, mm_to_inches
+
+# Defaults for the event_detection section of config.yaml, the values plot.py always used
+DEFAULT_THRESHOLD_MM = 510
+DEFAULT_PADDING_SECONDS = 1.0
+
+def event_settings(config):
+    """(enabled, threshold_mm, padding_seconds) from the event_detection section of config.yaml."""
+    settings = config.get('event_detection') or {}
+    return (settings.get('enabled', False),
+            settings.get('threshold_mm', DEFAULT_THRESHOLD_MM),
+            settings.get('padding_seconds', DEFAULT_PADDING_SECONDS))
+
+class EventNotice:
+    """An event starting or ending, for showing to the operator."""
+    def __init__(self, kind, number, timestamp, sensor_id=None, value=None, samples=0, lowest=None):
+        self.kind = kind  # 'start' or 'end'
+        self.number = number
+        self.timestamp = timestamp
+        self.sensor_id = sensor_id
+        self.value = value
+        self.samples = samples
+        self.lowest = lowest
+
+    def __str__(self):
+        if self.kind == 'start':
+            return f"Event {self.number} started: sensor {self.sensor_id} read {self.value:.0f} mm"
+        return f"Event {self.number} ended: {self.samples} samples kept, lowest reading {self.lowest:.0f} mm"
+
+class EventGate:
+    """Live version of plot.py's event detection that decides which samples get written.
+
+    A sample is below the threshold when its calibrated reading, rounded to
+    1/8 inch, is under the threshold, the same test that opens a pass in
+    plot.py (segments.find_passes).
+    Samples are held in a pre-roll buffer covering the last padding seconds;
+    the first reading below the threshold opens an event and releases the
+    pre-roll, and the event stays open until padding seconds pass without a
+    reading below the threshold. Samples outside events are dropped, so a
+    capture only keeps each event window plus padding on both sides. Two
+    events closer than twice the padding come out as one.
+
+    Samples must arrive in timestamp order (as every capture reader returns them).
+    """
+    def __init__(self, threshold_mm=DEFAULT_THRESHOLD_MM, padding_seconds=DEFAULT_PADDING_SECONDS, calibration_map=None):
+        self.threshold_inches = mm_to_inches(threshold_mm)
+        self.padding_ms = padding_seconds * 1000
+        self.calibration_map = calibration_map or {}
+        self.pre_roll = deque()
+        self.open_until = None  # Timestamp the current event ends at unless another low reading arrives
+        self.events = 0
+        self.event_samples = 0
+        self.event_lowest = None
+        self.samples_seen = 0
+        self.samples_kept = 0
+
+    @property
+    def in_event(self):
+        return self.open_until is not None
+
+    def process(self, samples):
+        """Take (timestamp, sensor_id, value) samples; return (samples to write, notices)."""
+        if not samples:
+            return [], []
+        timestamps, sensor_ids, values = zip(*samples)
+        calibrated = apply_calibration(values, sensor_ids, self.calibration_map)
+        below = (mm_to_inches(calibrated) < self.threshold_inches).tolist()
+
+        keep = []
+        notices = []
+        for sample, is_below in zip(samples, below):
+            timestamp = sample[0]
+            if self.open_until is not None and timestamp > self.open_until:
+                notices.append(self.close_event())
+            if is_below:
+                if self.open_until is None:
+                    self.events += 1
+                    notices.append(EventNotice('start', self.events, timestamp, sample[1], sample[2]))
+                    # Release the last padding seconds before this reading
+                    while self.pre_roll and self.pre_roll[0][0] < timestamp - self.padding_ms:
+                        self.pre_roll.popleft()
+                    keep.extend(self.pre_roll)
+                    self.event_samples = len(self.pre_roll)
+                    self.event_lowest = min((s[2] for s in self.pre_roll), default=sample[2])
+                    self.pre_roll.clear()
+                self.open_until = timestamp + self.padding_ms
+            if self.open_until is not None:
+                keep.append(sample)
+                self.event_samples += 1
+                self.event_lowest = min(self.event_lowest, sample[2])
+            else:
+                self.pre_roll.append(sample)
+                while self.pre_roll[0][0] < timestamp - self.padding_ms:
+                    self.pre_roll.popleft()
+
+        self.samples_seen += len(samples)
+        self.samples_kept += len(keep)
+        return keep, notices
+
+    def close_event(self):
+        notice = EventNotice('end', self.events, self.open_until, samples=self.event_samples, lowest=self.event_lowest)
+        self.open_until = None
+        return notice
+
+    def finish(self):
+        """End of capture: close an open event and drop the pre-roll. Returns the notices."""
+        self.pre_roll.clear()
+        return [self.close_event()] if self.open_until is not None else []
+
+    def reset(self):
+        """Start over for a new capture file, without carrying an open event or pre-roll across."""
+        self.pre_roll.clear()
+        self.open_until = None
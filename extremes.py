@@ -0,0 +1,105 @@
+from collections import namedtuple
+import numpy as np
+
+# Defaults for the closest_approaches section of config.yaml
+DEFAULT_COUNT = 3
+DEFAULT_MIN_GAP_SECONDS = 5.0
+
+# One approach: the closest reading, when it was first read and which sensor read it
+Approach = namedtuple('Approach', ['reading', 'time', 'sensor'])
+
+def approach_settings(config):
+    """(count, min_gap_seconds) from the closest_approaches section of config.yaml."""
+    settings = config.get('closest_approaches') or {}
+    return settings.get('count', DEFAULT_COUNT), settings.get('min_gap_seconds', DEFAULT_MIN_GAP_SECONDS)
+
+def separated_minima(runs, readings, timestamps, count, min_gap):
+    """Row indices of up to count lowest readings that are at least min_gap apart in time.
+
+    runs are (row indices, readings) pairs, one per sensor. The lowest
+    reading is taken first, then the lowest one at least min_gap away from
+    every reading already taken, and so on; equal readings go in file
+    order. Only readings up to the pool_size-th lowest of each run are
+    ranked (found with a partition, not a sort), and the pool only grows if
+    they don't hold enough separate approaches, e.g. for a sensor that sat
+    at its minimum for a long time.
+    """
+    runs = [(rows, values) for rows, values in runs if len(rows)]
+    if not runs:
+        return []
+    pool_size = 64
+    while True:
+        pools = []
+        cut = []
+        for rows, values in runs:
+            if len(values) > pool_size:
+                # Every reading up to the pool_size-th lowest, ties included
+                highest = np.partition(values, pool_size)[pool_size]
+                pools.append(rows[values <= highest])
+                cut.append(highest)
+            else:
+                pools.append(rows)
+        pool = np.concatenate(pools)
+        if cut:
+            # Past the lowest cut some run may have readings that are not in the pool
+            pool = pool[readings[pool] <= min(cut)]
+        pool = pool[np.lexsort((pool, readings[pool]))]
+        times = timestamps[pool]
+        available = np.ones(len(pool), dtype=bool)
+        taken = []
+        while len(taken) < count:
+            remaining = np.flatnonzero(available)
+            if not len(remaining):
+                break
+            taken.append(pool[remaining[0]])
+            available[remaining[0]] = False
+            available &= np.abs(times - times[remaining[0]]) >= min_gap
+        if len(taken) == count or not cut:
+            return taken
+        pool_size *= 4
+
+def extreme_index(timestamps, sensors, readings, count=DEFAULT_COUNT, min_gap=0, sides=None):
+    """Closest approaches of every sensor, and of every side of the tug, in one pass over the capture.
+
+    The rows are grouped by sensor with a single stable radix argsort of
+    the sensor IDs (linear time, file order kept within each sensor), and
+    each sensor's lowest readings are then picked out with a partition;
+    nothing is sorted by reading except those few candidates, and no
+    DataFrame is grouped or copied.
+
+    min_gap is in the units of timestamps (e.g. ms, or a numpy timedelta64
+    for datetime64 timestamps). sides maps a side name to its sensor IDs,
+    e.g. {'left': left_side_sensors, 'right': right_side_sensors}; a side's
+    approaches are spaced across all of its sensors together.
+
+    Returns (per_sensor, per_side): per_sensor maps each sensor to a list
+    of up to count Approaches, closest first, the first being its exact
+    minimum and the first time it was read; per_side does the same for
+    each side with sensors that reported.
+    """
+    timestamps = np.asarray(timestamps)
+    sensors = np.asarray(sensors)
+    readings = np.asarray(readings)
+    runs = {}
+    if len(sensors):
+        low, high = int(sensors.min()), int(sensors.max())
+        # Small integer keys make numpy's stable argsort a radix sort
+        keys = (sensors - low).astype(np.uint8 if high - low < 256 else np.uint16)
+        order = np.argsort(keys, kind='stable')
+        starts = np.searchsorted(keys[order], np.arange(high - low + 2))
+        for offset in range(high - low + 1):
+            if starts[offset + 1] > starts[offset]:
+                rows = order[starts[offset]:starts[offset + 1]]
+                runs[low + offset] = (rows, readings[rows])
+
+    def approaches(sensor_runs):
+        return [Approach(readings[i].item(), timestamps[i], int(sensors[i]))
+                for i in separated_minima(sensor_runs, readings, timestamps, count, min_gap)]
+
+    per_sensor = {sensor: approaches([run]) for sensor, run in runs.items()}
+    per_side = {}
+    for side, side_sensors in (sides or {}).items():
+        side_runs = [runs[sensor] for sensor in side_sensors if sensor in runs]
+        if side_runs:
+            per_side[side] = approaches(side_runs)
+    return per_sensor, per_side
@@ -0,0 +1,146 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import yaml
+from runnames import RADIO_OPTIONS, parse_run_name
+
+NAME_FIELDS = ['building', 'radio', 'tug', 'step']
+# Distributions reported by default: per door step, per tug and per building
+DEFAULT_GROUPINGS = [['step'], ['tug'], ['building']]
+
+def load_run(file_path):
+    """Samples in the padded windows of one capture's passes as (sensor, inches) arrays, or None if it has no event.
+
+    Readings between passes are left out; a reading in two overlapping
+    windows is only counted once. Never raises.
+    """
+    import plot  # Loads config.yaml and the plotting stack, so only in the processes that need it
+    try:
+        windows = plot.load_passes(file_path)
+    except Exception as e:
+        print(f"Failed to load {file_path}: {e}")
+        return None
+    if not windows:
+        return None
+    df = pd.concat([window for _, _, window in windows])
+    df = df[~df.index.duplicated()]
+    return df['Sensor Number'].to_numpy(np.int16), df['Measurement'].to_numpy(np.float32)
+
+def name_categories(config):
+    """Categories for the filename fields, in config.yaml order so tables sort the way the lists do."""
+    return {
+        'building': list(config.get('buildingcodes') or []),
+        'radio': list(RADIO_OPTIONS),
+        'tug': list(config.get('tugs') or []),
+        'step': list(config.get('door_list') or []),
+    }
+
+def load_fleet(files, config, jobs=1):
+    """Load the event samples of many runs into one columnar table.
+
+    Returns (samples, runs): samples has one row per reading with a run
+    code, sensor and calibrated inches; runs has one row per run code with
+    the path and the building, radio, tug and step parsed from the filename
+    as categoricals. Runs without an event are left out.
+    """
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            loaded = list(executor.map(load_run, files, chunksize=8))
+    else:
+        loaded = [load_run(file_path) for file_path in files]
+
+    categories = name_categories(config)
+    lists = (categories['building'], config.get('tugs') or [], config.get('door_list') or [])
+    paths = []
+    names = {field: [] for field in NAME_FIELDS}
+    sensors = []
+    measurements = []
+    lengths = []
+    for file_path, run in zip(files, loaded):
+        if run is None:
+            continue
+        name = parse_run_name(file_path, *lists) or {}
+        paths.append(file_path)
+        for field in NAME_FIELDS:
+            names[field].append(name.get(field) or None)
+        sensors.append(run[0])
+        measurements.append(run[1])
+        lengths.append(len(run[1]))
+
+    runs = pd.DataFrame({'path': paths})
+    for field in NAME_FIELDS:
+        # Values missing from config.yaml still get a category, after the configured ones
+        extra = sorted({value for value in names[field] if value is not None} - set(categories[field]))
+        runs[field] = pd.Categorical(names[field], categories=categories[field] + extra)
+
+    samples = pd.DataFrame({
+        'run': np.repeat(np.arange(len(paths), dtype=np.int32), lengths),
+        'sensor': np.concatenate(sensors) if sensors else np.empty(0, np.int16),
+        'inches': np.concatenate(measurements) if measurements else np.empty(0, np.float32),
+    })
+    return samples, runs
+
+def run_minima(samples, runs):
+    """Closest approach of every run, next to its filename fields."""
+    closest = samples.groupby('run')['inches'].min()
+    result = runs.copy()
+    result['closest'] = closest.reindex(np.arange(len(runs))).to_numpy()
+    return result
+
+def distributions(run_table, by, reference_lines):
+    """Closest-approach distribution per group: runs, min, p1, p5, median and near-miss counts.
+
+    A near miss below a reference line is a run whose closest approach is
+    under it. Everything is computed with grouped operations over the whole
+    run table at once.
+    """
+    grouped = run_table.groupby(by, observed=True)['closest']
+    table = grouped.agg(['count', 'min'])
+    table.columns = ['runs', 'min']
+    # Runs whose filenames don't give the fields fall in no group, which can leave no quantiles at all
+    quantiles = grouped.quantile([0.01, 0.05, 0.5]).unstack().reindex(columns=[0.01, 0.05, 0.5])
+    table['p1'] = quantiles[0.01]
+    table['p5'] = quantiles[0.05]
+    table['median'] = quantiles[0.5]
+    for line in reference_lines:
+        below = (run_table['closest'] < line).groupby([run_table[column] for column in by], observed=True).sum()
+        table[f'below_{line:g}in'] = below.astype(np.int64)
+    return table
+
+def main():
+    parser = argparse.ArgumentParser(description='Closest-approach distributions across many runs, per door, tug and building.')
+    parser.add_argument('directory', help='Directory containing capture files')
+    parser.add_argument('--by', nargs='+', action='append', choices=NAME_FIELDS,
+                        help='Filename fields to group by; repeat for several tables (default: step, tug and building separately)')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of worker processes for loading captures')
+    parser.add_argument('--output', help='Also write the tables to this CSV file')
+    args = parser.parse_args()
+
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+
+    import plot
+    files = plot.find_csv_files(args.directory)
+    samples, runs = load_fleet(files, config, args.jobs)
+    print(f"{len(runs)} of {len(files)} runs had an event ({len(samples):,} samples)")
+    if runs.empty:
+        return
+
+    run_table = run_minima(samples, runs)
+    reference_lines = [y_value for y_value, _, _ in plot.REFERENCE_LINES]
+    tables = []
+    with pd.option_context('display.width', 200, 'display.max_rows', 500):
+        for by in args.by or DEFAULT_GROUPINGS:
+            table = distributions(run_table, by, reference_lines)
+            print(f"\nClosest approach (inches) by {', '.join(by)}")
+            print(table.to_string(float_format=lambda value: f"{value:.3f}"))
+            tables.append(table.reset_index().assign(grouped_by='+'.join(by)))
+
+    if args.output:
+        pd.concat(tables, ignore_index=True).to_csv(args.output, index=False)
+        print(f"\nTables saved to {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()
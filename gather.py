@@ -1,98 +1,190 @@
-import serial
-import re
 import time
-import sys
-from collections import deque
 from datetime import datetime, timedelta
 import pytz
-import csv
+import argparse
+import yaml
+import numpy as np
+from calibration import apply_calibration, mm_to_inches
+from capturefile import capture_extension, open_capture_log, write_close_marker
+from simserial import SimulatedSerial, add_simulation_arguments, open_simulated_ports
+from multicapture import SENSORS_PER_BOARD, MergedCapture, capture_reader, open_boards
+from ringbuffer import SensorRingBuffer
+from eventgate import EventGate, event_settings
+from metrics import PipelineMetrics, metrics_settings
 
 # Define parameters
 NUM_SENSORS = 6
 REPORT_INTERVAL = 1  # Report interval in seconds
+FLUSH_INTERVAL = 1  # Seconds between flushes of the capture file, so a crash loses at most this much
 WINDOW_SIZE = 10 * REPORT_INTERVAL  # Window size in seconds
+SAMPLE_RATE = 8  # Readings per second per sensor (the firmware's 125 ms interval)
+STATS_INTERVAL = 10  # Seconds between --stats lines
 
 # Global variables
 LOGGING = False
 
-# an array of NUM_SENSORS, each element is a deque of WINDOW_SIZE
-sensor_data = [deque([-1] * WINDOW_SIZE, maxlen=WINDOW_SIZE) for _ in range(NUM_SENSORS)]
-mindist = [999999 for _ in range(NUM_SENSORS)]
-
-
-from serial.tools import list_ports
-def find_arduino_port():
-    ports = list(list_ports.comports())
-    for port in ports:
-        if "CH340" in port.description or "CP210x" in port.description:
-            return port.device
-    return None
-
-def capture_data(sensor_id, value):
-    sensor_data[sensor_id].append(value)
-    mindist[sensor_id] = min(mindist[sensor_id], value)
-
-def log_sensor_readings(ser, duration, csv_filename):
+# Last WINDOW_SIZE seconds of every sensor, with rolling and all-time statistics
+sensor_history = SensorRingBuffer(NUM_SENSORS, WINDOW_SIZE * SAMPLE_RATE)
+
+def init_sensor_state(num_sensors):
+    """Resize the live sensor state, e.g. when several boards add up to more sensors."""
+    global NUM_SENSORS, sensor_history
+    NUM_SENSORS = num_sensors
+    sensor_history = SensorRingBuffer(NUM_SENSORS, WINDOW_SIZE * SAMPLE_RATE)
+
+def load_config(config_file='config.yaml'):
+    with open(config_file, 'r') as f:
+        config = yaml.safe_load(f)
+    return config
+
+def lowest_readings(calibration_map):
+    """Calibrated all-time minimum per sensor, in inches, for sensors that reported."""
+    all_time_min = sensor_history.snapshot().all_time_min
+    sensors = np.flatnonzero(np.isfinite(all_time_min))
+    inches = mm_to_inches(apply_calibration(all_time_min[sensors], sensors, calibration_map))
+    return dict(zip(sensors.tolist(), inches.tolist()))
+
+def write_samples(writer, samples, gate, metrics=None):
+    """Write the samples inside the sensor range, only those in an event window if gate is set."""
+    if gate is not None:
+        samples, notices = gate.process(samples)
+        for notice in notices:
+            # Flag events to the operator as they happen
+            print(f"{datetime.fromtimestamp(notice.timestamp / 1000).strftime('%H:%M:%S')} *** {notice}")
+    rows = [[timestamp, sensor_id, data_value] for timestamp, sensor_id, data_value in samples
+            if 0 <= sensor_id < NUM_SENSORS]
+    if rows:
+        started = time.perf_counter()
+        writer.writerows(rows)
+        if metrics is not None:
+            metrics.record_write(len(rows), time.perf_counter() - started)
+
+def log_sensor_readings(reader, duration, csv_filename, calibration_map=None, gate=None, metrics=None, show_stats=False):
     start_time = time.time()
-    readings = {}
     first_reading_time = None
     pst_timezone = pytz.timezone('America/Los_Angeles')
 
-    with open(csv_filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Timestamp (PST)', 'Sensor Number', 'Measurement'])
-
+    metadata = {'started': datetime.now(pst_timezone).isoformat(), 'source': 'gather.py'}
+    file, writer = open_capture_log(csv_filename, NUM_SENSORS, metadata)
+    with file:
+        last_report = time.time()
+        last_stats = time.time()
+        last_flush = time.time()
         while time.time() - start_time < duration * 60:  # Convert minutes to seconds
             try:
-                if ser.in_waiting:
-                    line = ser.readline().decode('utf-8', errors='ignore').strip()
-                    print(line)
-                    # Updated regex pattern for integer measurements in mm
-                    pattern = re.compile(r'D(\d)\s*\(mm\):\s*(\d+)')
-                    # match = re.match(r'(\d+)\s*D(\d)\s*\(mm\):\s+(\d+)', line)
-                    matches = re.findall(pattern, line)
-                    timestamp = int(time.time() * 1000)
-                    # print(match)
-                    for hit in matches:
-                        # logger.debug("Index:", hit[0], "Measurement:", hit[1])
-                        sensor_id = int(hit[0])
-                        data_value = int(hit[1])
-                        if 0 <= sensor_id < len(sensor_data):
-                            capture_data(sensor_id, data_value)
-                            writer.writerow([timestamp, sensor_id, data_value])
+                samples = reader.read_samples()
+                sensor_history.append_samples(samples)
+                if metrics is not None:
+                    metrics.record_samples(samples)
+                write_samples(writer, samples, gate, metrics)
+                if time.time() - last_flush >= FLUSH_INTERVAL:
+                    last_flush = time.time()
+                    file.flush()
+
+                # Show the latest value per sensor once per report interval instead of echoing every line
+                if time.time() - last_report >= REPORT_INTERVAL:
+                    last_report = time.time()
+                    latest = sensor_history.snapshot().latest
+                    print(" ".join(f"D{i}: {'-' if np.isnan(value) else int(value)}" for i, value in enumerate(latest)))
+                if metrics is not None:
+                    if show_stats and time.time() - last_stats >= STATS_INTERVAL:
+                        last_stats = time.time()
+                        print(metrics.summary_line())
+                    metrics.maybe_export()
 
             except Exception as e:
+                if metrics is not None:
+                    metrics.record_error(e)
                 print(f"Error: {e}")
 
-    return readings
+        samples = reader.flush()
+        sensor_history.append_samples(samples)
+        if metrics is not None:
+            metrics.record_samples(samples)
+        write_samples(writer, samples, gate, metrics)
+        if gate is not None:
+            for notice in gate.finish():
+                print(f"*** {notice}")
+            print(f"Kept {gate.samples_kept} of {gate.samples_seen} samples in {gate.events} event(s)")
+
+    return lowest_readings(calibration_map or {})
 
 def main():
-    port = find_arduino_port()
-    if port is None:
-        print("Arduino not found. Please check your connection.")
-        return
-
-    duration = 1
-    if len(sys.argv) > 1:
-        try:
-            duration = int(sys.argv[1])
-        except ValueError:
-            print("Invalid duration. Using default 5 minutes.")
+    config = load_config()
+    parser = argparse.ArgumentParser(description='Log sensor readings from the Arduino to a capture file.')
+    parser.add_argument('duration', type=int, nargs='?', default=1, help='Logging duration in minutes')
+    parser.add_argument('--format', choices=['csv', 'bin'], default=config.get('capture_format', 'csv'),
+                        help='Capture file format (defaults to capture_format in config.yaml)')
+    parser.add_argument('--compression', choices=['none', 'gzip', 'zstd'], default=config.get('capture_compression') or 'none',
+                        help='Write CSV captures as .csv.gz or .csv.zst streams (defaults to capture_compression in config.yaml)')
+    events_enabled, threshold_mm, padding_seconds = event_settings(config)
+    parser.add_argument('--events', action=argparse.BooleanOptionalAction, default=events_enabled,
+                        help=f'Only write readings within {padding_seconds:g} s of one below {threshold_mm} mm '
+                             '(defaults to event_detection in config.yaml)')
+    export_path, export_interval = metrics_settings(config)
+    parser.add_argument('--stats', action='store_true',
+                        help=f'Print pipeline metrics every {STATS_INTERVAL} s and a full report at the end')
+    parser.add_argument('--metrics-file', default=export_path,
+                        help='Write the metrics to this file periodically, as JSON for .json and Prometheus text otherwise '
+                             '(defaults to metrics.export_path in config.yaml)')
+    add_simulation_arguments(parser)
+    args = parser.parse_args()
+    duration = args.duration
+
+    ports = open_simulated_ports(args)
+    if ports:
+        sensor_offsets = [i * SENSORS_PER_BOARD for i in range(len(ports))]
+    else:
+        ports, sensor_offsets = open_boards(config.get('boards'))
+        if not ports:
+            print("Arduino not found. Please check your connection.")
+            return
+
+    # Simulated boards send whichever protocol --binary asks for
+    protocol = ('binary' if args.binary else 'text') if args.simulate else config.get('serial_protocol', 'text')
+    reader = capture_reader(ports, sensor_offsets, protocol)
+    if isinstance(reader, MergedCapture):
+        # Several boards are read concurrently into one time-ordered stream
+        init_sensor_state(max(NUM_SENSORS, reader.num_sensors))
+        for ser, offset in zip(ports, sensor_offsets):
+            print(f"Reading {ser.port} as sensors {offset}-{offset + SENSORS_PER_BOARD - 1}")
 
     pst = datetime.now(pytz.timezone('America/Los_Angeles'))
-    csv_filename = pst.strftime("%Y%m%d_%H%M%S.csv")
-
-    ser = serial.Serial(port, 115200, timeout=1)
-
-    readings = log_sensor_readings(ser, duration, csv_filename)
-
-    ser.close()
+    try:
+        extension = capture_extension(args.format, args.compression)
+    except ValueError as e:
+        print(f"{e}; writing an uncompressed capture")
+        extension = capture_extension(args.format)
+    csv_filename = pst.strftime("%Y%m%d_%H%M%S") + extension
+
+    gate = EventGate(threshold_mm, padding_seconds, config.get('calibration_map')) if args.events else None
+    metrics = PipelineMetrics(reader, export_path=args.metrics_file, export_interval=export_interval)
+    readings = log_sensor_readings(reader, duration, csv_filename, config.get('calibration_map'), gate, metrics, args.stats)
+    if (config.get('watch') or {}).get('close_markers', False):
+        # Tell watch.py the capture is complete
+        write_close_marker(csv_filename)
+
+    if isinstance(reader, MergedCapture):
+        reader.close()
+    else:
+        ports[0].close()
+
+    if getattr(reader, 'lost_frames', 0):
+        print(f"Lost {reader.lost_frames} frames (gaps in the frame counter)")
+    if args.stats:
+        print(metrics.report())
+    if args.metrics_file:
+        metrics.export()
+        print(f"Metrics written to {args.metrics_file}")
+    for ser in ports:
+        if isinstance(ser, SimulatedSerial) and ser.dropped_lines:
+            print(f"Simulated port {ser.port} dropped {ser.dropped_lines} of {ser.lines_sent + ser.dropped_lines} lines")
 
     # Display the lowest reading for each sensor
     if readings:
         for sensor in sorted(readings.keys()):
             lowest_reading = readings[sensor]
-            print(f"Lowest reading for sensor {sensor}: {lowest_reading}")
+            print(f"Lowest reading for sensor {sensor}: {lowest_reading} inches")
 
     # Display the filename of the CSV
     print(f"Data logged in: {csv_filename}")
@@ -1,94 +1,111 @@
 import sys
-import re
+import argparse
 import threading
+import queue
 import time
-import csv
-import serial
 import yaml
-from collections import deque
+import numpy as np
 from datetime import datetime
 import pytz
-from PyQt5.QtGui import QIcon
+from PyQt5.QtGui import QIcon, QPainter, QPen, QColor, QPolygonF
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFrame,
     QCheckBox, QPushButton, QTextEdit, QLabel, QLineEdit,
     QRadioButton, QButtonGroup, QComboBox
 )
 from PyQt5.QtCore import QTimer, Qt, QObject, QEvent, QSettings
+import calibration
+from capturefile import capture_extension
+from logwriter import BackgroundLogWriter
+from simserial import add_simulation_arguments, open_simulated_ports
+from multicapture import ARDUINO_DESCRIPTIONS, SENSORS_PER_BOARD, MergedCapture, capture_reader, open_boards
+from ringbuffer import SensorRingBuffer
+from decimate import minmax_decimate
+from eventgate import EventGate, event_settings
+from runnames import DATE_FORMAT, FILENAME_FORMATS, RADIO_OPTIONS
+from captureclock import default_clock
+from metrics import PipelineMetrics, metrics_settings
 
 # Define parameters
 NUM_SENSORS = 4
 REPORT_INTERVAL = 1  # Report interval in seconds
-WINDOW_SIZE = 10 * REPORT_INTERVAL  # Window size in seconds
+WINDOW_SIZE = 30 * REPORT_INTERVAL  # Window size in seconds, also the span of the trace panel
+SAMPLE_RATE = 8  # Readings per second per sensor (the firmware's 125 ms interval)
+TRACE_FPS = 30  # Trace panel redraws per second
+# matplotlib's tab10, so trace colours match the plot.py PNGs
+TRACE_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+                '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
 
 # Global variables
 LOGGING = False
-sensor_data = [deque([-1] * WINDOW_SIZE, maxlen=WINDOW_SIZE) for _ in range(NUM_SENSORS)]
-mindist = [999999 for _ in range(NUM_SENSORS)]
-pattern = re.compile(r'D(\d)\s*\(mm\):\s*(\d+)')
+# Last WINDOW_SIZE seconds of every sensor, with rolling and all-time statistics
+sensor_history = SensorRingBuffer(NUM_SENSORS, WINDOW_SIZE * SAMPLE_RATE)
 SEQUENCE = []
 current_step = None
 current_step_index = 0
 
-def find_arduino_port():
-    from serial.tools import list_ports
-    ports = list(list_ports.comports())
-    for port in ports:
-        if "CH340" in port.description or "CP210x" in port.description or "USB" in port.description:
-            return port.device
-    return None
+def init_sensor_state(num_sensors, sample_rate=SAMPLE_RATE):
+    """Resize the live sensor state, e.g. when several boards add up to more sensors
+    or a board sends faster than the firmware's default rate."""
+    global NUM_SENSORS, sensor_history
+    NUM_SENSORS = num_sensors
+    sensor_history = SensorRingBuffer(NUM_SENSORS, int(WINDOW_SIZE * sample_rate))
+
+def make_polyline(xs, ys):
+    """Build a QPolygonF straight from two numpy arrays, without a Python loop over the points"""
+    polyline = QPolygonF(len(xs))
+    buffer = polyline.data()
+    buffer.setsize(len(xs) * 2 * np.dtype(np.float64).itemsize)
+    points = np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)
+    points[:, 0] = xs
+    points[:, 1] = ys
+    return polyline
 
 def mm_to_inches(lengths):
-    mm_to_in = 0.0393701
-    inches_lengths = []
-    for length in lengths:
-        converted_length = round(length * mm_to_in * 8) / 8
-        inches_lengths.append(converted_length)
-    return inches_lengths
-
-def capture_data(sensor_id, value):
-    sensor_data[sensor_id].append(value)
-    mindist[sensor_id] = min(mindist[sensor_id], value)
-
-def serial_reader(ser, main_window):
-    global sensor_data, LOGGING, current_step
+    return calibration.mm_to_inches(np.asarray(lengths, dtype=np.float64)).tolist()
+
+def serial_reader(reader, main_window, log_writer, gate=None, metrics=None):
+    """Reads samples into the live history and, while logging, hands them to the log writer.
+
+    With an EventGate only the samples in event windows are logged, and its
+    start/end notices are queued on main_window.event_notices for the GUI thread.
+    """
+    global LOGGING, current_step
     logging_running = False
-    writer = None
-    log_file = None
 
     while True:
         if LOGGING and current_step:
             if not logging_running:
                 logging_running = True
                 fn = main_window.gen_file_name(current_step)
-                log_file = open(fn, 'w', newline='')
-                writer = csv.writer(log_file)
-                writer.writerow(['Timestamp (PST)', 'Sensor Number', 'Measurement'])
+                log_writer.open(fn, NUM_SENSORS, main_window.run_metadata(current_step))
                 print(f"Opened file: {fn}")
+                if gate is not None:
+                    gate.reset()
         else:
             if logging_running:
                 logging_running = False
-                if log_file:
-                    log_file.close()
-                    print(f"Closed file: {fn}")
+                if gate is not None:
+                    for notice in gate.finish():
+                        main_window.event_notices.put(notice)
+                log_writer.close_log()
+                print(f"Closed file: {fn}")
                 if not SEQUENCE and current_step:
                     current_step = None
                     LOGGING = False
         
-        try:
-            line = ser.readline().decode('utf-8').strip()
-            matches = re.findall(pattern, line)
-            utc_now = datetime.fromtimestamp(time.time(), pytz.utc)
-            timestamp = int(utc_now.astimezone(pytz.timezone('US/Pacific')).timestamp() * 1000)
-            for hit in matches:
-                sensor_id = int(hit[0])
-                data_value = int(hit[1])
-                if 0 <= sensor_id < len(sensor_data):
-                    capture_data(sensor_id, data_value)
-                    if logging_running and writer:
-                        writer.writerow([timestamp, sensor_id, data_value])
-        except UnicodeDecodeError:
-            print("Error decoding byte sequence from serial port")
+        samples = reader.read_samples()
+        sensor_history.append_samples(samples)
+        if metrics is not None:
+            metrics.record_samples(samples)
+        if logging_running and gate is not None:
+            samples, notices = gate.process(samples)
+            for notice in notices:
+                main_window.event_notices.put(notice)
+        # Disk writes happen on the log writer's thread, never on this one
+        if logging_running and samples:
+            log_writer.write_rows([[timestamp, sensor_id, data_value] for timestamp, sensor_id, data_value in samples
+                                   if 0 <= sensor_id < NUM_SENSORS])
 
 class EventFilter(QObject):
     """An event filter to capture spacebar key events globally"""
@@ -98,9 +115,59 @@ class EventFilter(QObject):
             return True
         return super().eventFilter(obj, event)
 
+class TracePanel(QWidget):
+    """Live scrolling trace of every sensor over the last WINDOW_SIZE seconds.
+
+    Each frame takes a snapshot of sensor_history and min/max-decimates
+    every sensor down to the panel's pixel width, so drawing costs the same
+    whether the buffer holds hundreds or hundreds of thousands of samples.
+    """
+    def __init__(self, threshold_mm, parent=None):
+        super().__init__(parent)
+        self.threshold_mm = threshold_mm
+        self.setMinimumHeight(200)
+        self.frame_time = 0.0  # Seconds spent in the last paintEvent
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update)
+        self.timer.start(1000 // TRACE_FPS)
+
+    def paintEvent(self, event):
+        started = time.perf_counter()
+        snapshot = sensor_history.snapshot()
+        width, height = self.width(), self.height()
+        end = default_clock.now_ms()
+        start = end - WINDOW_SIZE * 1000
+
+        traces = [minmax_decimate(timestamps, values, start, end, width)
+                  for timestamps, values in zip(snapshot.timestamps, snapshot.values)]
+        # Autoscale to the largest reading on screen, but always keep the threshold in view
+        top = max([ys.max() for _, ys in traces if len(ys)] + [self.threshold_mm]) * 1.05
+        scale = (height - 1) / top
+
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor('#1d1d19'))
+
+        threshold_y = int(height - 1 - self.threshold_mm * scale)
+        painter.setPen(QPen(QColor('#F92672'), 1, Qt.DashLine))
+        painter.drawLine(0, threshold_y, width, threshold_y)
+        painter.drawText(4, threshold_y - 4, f"{self.threshold_mm} mm")
+
+        for sensor_id, (xs, ys) in enumerate(traces):
+            color = QColor(TRACE_COLORS[sensor_id % len(TRACE_COLORS)])
+            painter.setPen(QPen(color, 1))
+            painter.drawText(width - 60, 16 + 14 * sensor_id, f"Sensor {sensor_id}")
+            if len(xs):
+                painter.drawPolyline(make_polyline(xs, height - 1 - ys * scale))
+        painter.end()
+        self.frame_time = time.perf_counter() - started
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, log_writer=None, reader=None, metrics=None):
         super().__init__()
+        self.log_writer = log_writer
+        self.reader = reader
+        self.metrics = metrics
         
         # Create QSettings to remember user selections
         self.settings = QSettings("Bsoft", "sensors")
@@ -113,24 +180,28 @@ class MainWindow(QMainWindow):
         self.building_codes = config.get('buildingcodes', [])
         self.tugs_options = config.get('tugs', [])
         self.checkbox_options = config.get('door_list', [])
+        self.capture_format = config.get('capture_format', 'csv')
+        try:
+            self.capture_extension = capture_extension(self.capture_format, config.get('capture_compression'))
+        except ValueError as e:
+            print(f"{e}; writing uncompressed captures")
+            self.capture_extension = capture_extension(self.capture_format)
+        _, self.threshold_mm, _ = event_settings(config)
+        # EventNotices from the serial thread, shown by update_sensor_values
+        self.event_notices = queue.Queue()
+        self.last_event = None
 
         # -----------
         # 1) Define possible filename formats
         #    We map a "label" -> "actual format"
         #    We'll keep building_code + selected_radio as BC
         #    placeholders: {DATE}, {BC}, {TUG}, {STEP}
+        #    The layouts live in runnames.py so catalog.py can parse the names back
         # -----------
-        self.filename_format_options = {
-            "Tug_Date_BC_Step":      "{TUG}_{DATE}_{BC}_{STEP}.csv",
-            "BC_Tug_Step":           "{BC}_{TUG}_{STEP}.csv",
-            "Date_BC_Tug_Step":      "{DATE}_{BC}_{TUG}_{STEP}.csv",
-            "Date_Tug_BC_Step":      "{DATE}_{TUG}_{BC}_{STEP}.csv",
-            "BC_Date_Tug_Step":      "{BC}_{DATE}_{TUG}_{STEP}.csv",
-            "Tug_BC_Date_Step":      "{TUG}_{BC}_{DATE}_{STEP}.csv",
-        }
+        self.filename_format_options = FILENAME_FORMATS
 
         self.setWindowTitle("Sensors")
-        self.setGeometry(100, 100, 900, 600)
+        self.setGeometry(100, 100, 900, 800)
         self.display_in_inches = False
 
         central_widget = QWidget(self)
@@ -139,7 +210,9 @@ class MainWindow(QMainWindow):
         
         top_layout = QHBoxLayout()
         bottom_panel = self.create_bottom_panel()
+        self.trace_panel = TracePanel(self.threshold_mm, self)
         main_layout.addLayout(top_layout)
+        main_layout.addWidget(self.trace_panel, 1)
         main_layout.addWidget(bottom_panel)
         
         left_panel = self.create_left_panel()
@@ -175,8 +248,7 @@ class MainWindow(QMainWindow):
         # 2) Radio button group (A,B,C,D) if you need them
         radio_layout = QHBoxLayout()
         self.radio_group = QButtonGroup(self)
-        radio_options = ["A", "B", "C", "D"]
-        for option in radio_options:
+        for option in RADIO_OPTIONS:
             rb = QRadioButton(option, self)
             self.radio_group.addButton(rb)
             radio_layout.addWidget(rb)
@@ -248,6 +320,10 @@ class MainWindow(QMainWindow):
             sensor_layout.addWidget(sensor_box)
         layout.addLayout(sensor_layout)
 
+        # Pipeline metrics, with the per-sensor report in the tooltip
+        self.metrics_label = QLabel("", self)
+        layout.addWidget(self.metrics_label)
+
         # Add Start/Stop button
         self.start_stop_button = QPushButton("Start", self)
         self.start_stop_button.clicked.connect(self.toggle_logging)
@@ -255,14 +331,58 @@ class MainWindow(QMainWindow):
         return bottom_panel
 
     def update_sensor_values(self):
-        """Updates the sensor values in the text boxes"""
+        """Updates the sensor values in the text boxes from a snapshot of the sensor history"""
+        snapshot = sensor_history.snapshot()
+        p5 = snapshot.percentile(5)
         for i in range(NUM_SENSORS):
-            mm_value = sensor_data[i][0]
+            mm_value = snapshot.latest[i]
+            if np.isnan(mm_value):
+                self.sensor_boxes[i].setText("-")
+                continue
             if self.display_in_inches:
                 inches_value = mm_to_inches([mm_value])[0]
                 self.sensor_boxes[i].setText(f"{inches_value:.2f} in")
             else:
-                self.sensor_boxes[i].setText(f"{mm_value} mm")
+                self.sensor_boxes[i].setText(f"{int(mm_value)} mm")
+            self.sensor_boxes[i].setToolTip(
+                f"Last {WINDOW_SIZE} s: min {snapshot.rolling_min[i]:.0f} mm, mean {snapshot.rolling_mean[i]:.0f} mm, "
+                f"5th percentile {p5[i]:.0f} mm\nAll-time min: {snapshot.all_time_min[i]:.0f} mm")
+        self.show_event_notices()
+        self.update_writer_status()
+        self.update_metrics()
+
+    def update_metrics(self):
+        """Shows the pipeline metrics and writes them to the export file when it is due"""
+        if self.metrics is None:
+            return
+        snapshot = self.metrics.snapshot()
+        self.metrics_label.setText(self.metrics.summary_line(snapshot))
+        self.metrics_label.setToolTip(self.metrics.report(snapshot))
+        self.metrics.maybe_export()
+
+    def show_event_notices(self):
+        """Flags events detected by the serial thread in the text output"""
+        while True:
+            try:
+                notice = self.event_notices.get_nowait()
+            except queue.Empty:
+                break
+            color = '#F92672' if notice.kind == 'start' else '#A6E22E'
+            self.text_output.append(f'<span style="color: {color}">{notice}</span>')
+            self.last_event = notice
+
+    def update_writer_status(self):
+        """Shows the log writer's queue depth, dropped row count and trace draw time in the status bar"""
+        status = f"Trace: {self.trace_panel.frame_time * 1000:.1f} ms/frame"
+        if getattr(self.reader, 'lost_frames', 0):
+            status += f"   Lost frames: {self.reader.lost_frames}"
+        if self.last_event is not None:
+            status += f"   {'IN EVENT ' if self.last_event.kind == 'start' else ''}Events: {self.last_event.number}"
+        if self.log_writer is not None:
+            status += f"   Writer queue: {self.log_writer.queue_depth} rows   Dropped: {self.log_writer.dropped_rows} rows"
+            if self.log_writer.error:
+                status += f"   Last error: {self.log_writer.error}"
+        self.statusBar().showMessage(status)
 
     def gen_file_name(self, step):
         """
@@ -275,7 +395,7 @@ class MainWindow(QMainWindow):
         """
         # 1) Gather all placeholders
         pst = datetime.now(pytz.timezone('America/Los_Angeles'))
-        date_str = pst.strftime("%Y%m%d_%H%M%S")  # This is {DATE}
+        date_str = pst.strftime(DATE_FORMAT)  # This is {DATE}
         
         building_code = self.building_combo.currentText()
         radio = self.radio_group.checkedButton().text() if self.radio_group.checkedButton() else ""
@@ -297,7 +417,18 @@ class MainWindow(QMainWindow):
             TUG=selected_tug,
             STEP=step
         )
-        return filename
+        return filename[:-len('.csv')] + self.capture_extension
+
+    def run_metadata(self, step):
+        """Run details stored in the header of binary capture files"""
+        return {
+            'started': datetime.now(pytz.timezone('America/Los_Angeles')).isoformat(),
+            'building': self.building_combo.currentText(),
+            'radio': self.radio_group.checkedButton().text() if self.radio_group.checkedButton() else "",
+            'tug': self.tugs_combo.currentText(),
+            'step': step,
+            'source': 'gui.py',
+        }
 
     def toggle_units(self):
         """Toggles the display between millimeters and inches"""
@@ -466,17 +597,58 @@ def apply_monokai_theme(app):
     app.setStyleSheet(dark_stylesheet)
 
 def main():
-    # Start the serial reader in a background thread
-    ser = serial.Serial(find_arduino_port(), 115200)
+    parser = argparse.ArgumentParser(description='Sensor logging GUI.')
+    parser.add_argument('--events', action=argparse.BooleanOptionalAction, default=None,
+                        help='Only log readings around events below the threshold (defaults to event_detection in config.yaml)')
+    add_simulation_arguments(parser)
+    args, qt_args = parser.parse_known_args()
+
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    events_enabled, threshold_mm, padding_seconds = event_settings(config)
+    if args.events is not None:
+        events_enabled = args.events
+
+    # The ports have a timeout so the reader thread notices logging changes while they are idle
+    ports = open_simulated_ports(args)
+    if ports:
+        sensor_offsets = [i * SENSORS_PER_BOARD for i in range(len(ports))]
+    else:
+        ports, sensor_offsets = open_boards(config.get('boards'), ARDUINO_DESCRIPTIONS + ("USB",))
+        if not ports:
+            print("Arduino not found. Please check your connection.")
+            return
+    # Simulated boards send whichever protocol --binary asks for
+    protocol = ('binary' if args.binary else 'text') if args.simulate else config.get('serial_protocol', 'text')
+    reader = capture_reader(ports, sensor_offsets, protocol)
+    # Size the history for the fastest board so the trace always spans WINDOW_SIZE seconds
+    sample_rate = max(config.get('sample_rate', SAMPLE_RATE), args.rate if args.simulate else 0)
+    num_sensors = max(NUM_SENSORS, reader.num_sensors) if isinstance(reader, MergedCapture) else NUM_SENSORS
+    init_sensor_state(num_sensors, sample_rate)
     
     # Create and run the Qt application
-    app = QApplication(sys.argv)
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setWindowIcon(QIcon("icon.png"))
     apply_monokai_theme(app)
-    window = MainWindow()
+
+    writer_config = config.get('log_writer', {})
+    log_writer = BackgroundLogWriter(
+        max_pending_rows=writer_config.get('max_pending_rows', 100000),
+        flush_interval=writer_config.get('flush_interval', 1.0),
+        fsync_on_close=writer_config.get('fsync_on_close', False),
+        close_markers=(config.get('watch') or {}).get('close_markers', False),
+    )
+    log_writer.start()
+    app.aboutToQuit.connect(log_writer.stop)
+
+    export_path, export_interval = metrics_settings(config)
+    metrics = PipelineMetrics(reader, log_writer, export_path, export_interval)
+    window = MainWindow(log_writer, reader, metrics)
     window.show()
 
-    serial_thread = threading.Thread(target=serial_reader, args=(ser, window), daemon=True)
+    # Start the serial reader in a background thread
+    gate = EventGate(threshold_mm, padding_seconds, config.get('calibration_map')) if events_enabled else None
+    serial_thread = threading.Thread(target=serial_reader, args=(reader, window, log_writer, gate, metrics), daemon=True)
     serial_thread.start()
 
     sys.exit(app.exec_())
@@ -0,0 +1,137 @@
+import os
+import queue
+import threading
+import time
+from capturefile import open_capture_log, write_close_marker
+from metrics import WRITE_LATENCY_BUCKETS, Histogram
+
+class BackgroundLogWriter(threading.Thread):
+    """Writes capture rows on its own thread so disk stalls never block the serial reader.
+
+    The reader hands over rows with write_rows(); they go through a bounded
+    queue and are written in batches, with the file flushed at most every
+    flush_interval seconds. If the disk falls so far behind that more than
+    max_pending_rows are waiting, new rows are dropped (and counted) rather
+    than letting the serial buffer overflow. Opening and closing step files
+    goes through the same queue, so rows always land in the right file.
+    The time each batch takes to write is kept in the write_latency histogram.
+    With close_markers, every closed file gets a <capture>.closed marker so
+    watch.py knows the step is over without waiting for a quiet period.
+    """
+    def __init__(self, max_pending_rows=100000, flush_interval=1.0, fsync_on_close=False, close_markers=False):
+        super().__init__(daemon=True, name='BackgroundLogWriter')
+        self.max_pending_rows = max_pending_rows
+        self.flush_interval = flush_interval
+        self.fsync_on_close = fsync_on_close
+        self.close_markers = close_markers
+        self.commands = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending_rows = 0
+        self.rows_written = 0
+        self.dropped_rows = 0
+        self.write_latency = Histogram(WRITE_LATENCY_BUCKETS)
+        self.error = None
+        self.log_file = None
+        self.writer = None
+
+    @property
+    def queue_depth(self):
+        """Rows handed over but not written yet."""
+        return self.pending_rows
+
+    def open(self, filename, sensor_count, metadata=None):
+        self.commands.put(('open', (filename, sensor_count, metadata)))
+
+    def write_rows(self, rows):
+        """Queue [timestamp, sensor_id, measurement] rows; returns False if they had to be dropped."""
+        with self.lock:
+            if self.pending_rows + len(rows) > self.max_pending_rows:
+                self.dropped_rows += len(rows)
+                return False
+            self.pending_rows += len(rows)
+        self.commands.put(('rows', rows))
+        return True
+
+    def close_log(self):
+        self.commands.put(('close', None))
+
+    def stop(self):
+        """Write everything still queued, close the current file and end the thread."""
+        self.commands.put(('stop', None))
+        self.join()
+
+    def run(self):
+        batch = []
+        last_flush = time.monotonic()
+        while True:
+            try:
+                command, argument = self.commands.get(timeout=self.flush_interval)
+            except queue.Empty:
+                command, argument = None, None
+
+            if command == 'rows':
+                batch.extend(argument)
+            elif command is not None:
+                # Everything queued before an open/close/stop belongs to the current file
+                self.write_batch(batch)
+                batch = []
+                if command == 'open':
+                    self.open_file(*argument)
+                else:
+                    self.close_file()
+                    if command == 'stop':
+                        return
+
+            if batch and (self.commands.empty() or time.monotonic() - last_flush >= self.flush_interval):
+                self.write_batch(batch)
+                batch = []
+            if self.log_file and time.monotonic() - last_flush >= self.flush_interval:
+                self.log_file.flush()
+                last_flush = time.monotonic()
+
+    def write_batch(self, batch):
+        if not batch:
+            return
+        dropped = 0
+        if self.writer is not None:
+            try:
+                started = time.perf_counter()
+                self.writer.writerows(batch)
+                self.write_latency.observe(time.perf_counter() - started)
+                self.rows_written += len(batch)
+            except OSError as e:
+                self.error = e
+                dropped = len(batch)
+                print(f"Error writing {self.log_file.name}: {e}")
+        else:
+            # No file open: none was opened yet, or opening the last one failed
+            dropped = len(batch)
+        with self.lock:
+            self.pending_rows -= len(batch)
+            # Under the lock, as write_rows counts its drops from the caller's thread
+            self.dropped_rows += dropped
+
+    def open_file(self, filename, sensor_count, metadata):
+        self.close_file()
+        try:
+            self.log_file, self.writer = open_capture_log(filename, sensor_count, metadata)
+            self.error = None
+        except OSError as e:
+            self.error = e
+            print(f"Error opening {filename}: {e}")
+
+    def close_file(self):
+        if self.log_file is None:
+            return
+        try:
+            self.log_file.flush()
+            if self.fsync_on_close:
+                os.fsync(self.log_file.fileno())
+            self.log_file.close()
+            if self.close_markers:
+                write_close_marker(self.log_file.name)
+        except OSError as e:
+            self.error = e
+            print(f"Error closing {self.log_file.name}: {e}")
+        self.log_file = None
+        self.writer = None
@@ -0,0 +1,267 @@
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+
+# Histogram bucket upper bounds, in seconds
+WRITE_LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+# The firmware reports every 125 ms; anything much past that is a missed reading
+SAMPLE_GAP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.125, 0.15, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0)
+RATE_WINDOW = 5.0  # Seconds over which bytes/s and lines/s are averaged
+DEFAULT_EXPORT_INTERVAL = 10.0
+
+class Histogram:
+    """Bucketed histogram in the Prometheus style, with one series per label (e.g. per sensor).
+
+    counts[series, i] is the number of observations in bucket i, the last
+    bucket being everything above the largest bound. Observations are
+    bucketed with one searchsorted call per batch.
+    """
+    def __init__(self, bounds, series=1):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.counts = np.zeros((series, len(bounds) + 1), dtype=np.int64)
+        self.sums = np.zeros(series, dtype=np.float64)
+
+    def grow(self, series):
+        """Make room for at least `series` series."""
+        if series > len(self.counts):
+            extra = series - len(self.counts)
+            self.counts = np.vstack([self.counts, np.zeros((extra, self.counts.shape[1]), dtype=np.int64)])
+            self.sums = np.concatenate([self.sums, np.zeros(extra)])
+
+    def observe(self, value, series=0):
+        self.counts[series, np.searchsorted(self.bounds, value)] += 1
+        self.sums[series] += value
+
+    def observe_many(self, values, series):
+        """Record values (an array) in the series given alongside each of them."""
+        np.add.at(self.counts, (series, np.searchsorted(self.bounds, values)), 1)
+        np.add.at(self.sums, series, values)
+
+    def count(self, series=None):
+        counts = self.counts if series is None else self.counts[series:series + 1]
+        return int(counts.sum())
+
+    def quantile(self, q, series=None):
+        """Upper bound of the bucket holding quantile q (inf past the last bound), or None with no data."""
+        counts = (self.counts if series is None else self.counts[series:series + 1]).sum(axis=0)
+        total = counts.sum()
+        if total == 0:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(counts), q * total))
+        return float(self.bounds[bucket]) if bucket < len(self.bounds) else float('inf')
+
+    def prometheus(self, name, label=None):
+        """Exposition-format lines for every series; label names the series index (e.g. 'sensor')."""
+        lines = [f'# TYPE {name} histogram']
+        for series, counts in enumerate(self.counts):
+            if label is not None and not counts.any():
+                continue
+            labels = f'{label}="{series}",' if label is not None else ''
+            cumulative = np.cumsum(counts)
+            for bound, count in zip(self.bounds, cumulative):
+                lines.append(f'{name}_bucket{{{labels}le="{bound:g}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {cumulative[-1]}')
+            suffix = f'{{{labels[:-1]}}}' if labels else ''
+            lines.append(f'{name}_sum{suffix} {self.sums[series]:.6f}')
+            lines.append(f'{name}_count{suffix} {cumulative[-1]}')
+        return lines
+
+    def as_dict(self):
+        return {'bounds': self.bounds.tolist(), 'counts': self.counts.tolist(), 'sums': self.sums.tolist()}
+
+def format_seconds(value):
+    if value is None:
+        return '-'
+    if value == float('inf'):
+        return 'inf'
+    return f"{value * 1000:g} ms"
+
+class PipelineMetrics:
+    """Counters and histograms for every stage of a capture, from the serial port to the log file.
+
+    The serial counters (bytes, lines, parse failures, null readings per
+    sensor, lost frames) are kept by the reader itself and the writer
+    counters by the BackgroundLogWriter if there is one; this class reads
+    them when a snapshot is taken. It records itself what only the capture
+    loop sees: samples read, the gap between consecutive samples of each
+    sensor, errors, and for loops that write synchronously, the samples
+    written and write latency.
+
+    record_* methods are called from the capture thread; snapshot() and the
+    reports can be called from any thread.
+    """
+    def __init__(self, reader=None, log_writer=None, export_path=None, export_interval=DEFAULT_EXPORT_INTERVAL):
+        self.reader = reader
+        self.log_writer = log_writer
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.started = time.monotonic()
+        self.last_export = self.started
+        self.samples_read = 0
+        self.samples_written = 0
+        self.errors = 0
+        self.last_error = None
+        self.write_latency = Histogram(WRITE_LATENCY_BUCKETS)
+        self.sample_gap = Histogram(SAMPLE_GAP_BUCKETS, series=0)
+        self.last_timestamps = np.zeros(0, dtype=np.int64)
+        self.totals = deque()  # (monotonic time, bytes, lines) for the rate window
+
+    def record_samples(self, samples):
+        """Count a batch of (timestamp_ms, sensor_id, mm) samples and the per-sensor gaps between them."""
+        if not samples:
+            return
+        self.samples_read += len(samples)
+        data = np.array(samples, dtype=np.int64)
+        sensors = data[:, 1]
+        if sensors.min() < 0:
+            data = data[sensors >= 0]
+            sensors = data[:, 1]
+        if not len(sensors):
+            return
+        num_sensors = int(sensors.max()) + 1
+        if num_sensors > len(self.last_timestamps):
+            self.last_timestamps = np.concatenate([self.last_timestamps, np.zeros(num_sensors - len(self.last_timestamps), dtype=np.int64)])
+            self.sample_gap.grow(num_sensors)
+
+        # Group by sensor (keeping time order within each) and diff against the previous sample
+        order = np.argsort(sensors, kind='stable')
+        sensors = sensors[order]
+        timestamps = data[order, 0]
+        first = np.ones(len(sensors), dtype=bool)
+        first[1:] = sensors[1:] != sensors[:-1]
+        previous = np.empty_like(timestamps)
+        previous[1:] = timestamps[:-1]
+        previous[first] = self.last_timestamps[sensors[first]]
+        seen = previous > 0
+        self.sample_gap.observe_many((timestamps[seen] - previous[seen]) / 1000, sensors[seen])
+        last = np.ones(len(sensors), dtype=bool)
+        last[:-1] = first[1:]
+        self.last_timestamps[sensors[last]] = timestamps[last]
+
+    def record_write(self, rows, seconds):
+        self.samples_written += rows
+        self.write_latency.observe(seconds)
+
+    def record_error(self, error):
+        self.errors += 1
+        self.last_error = error
+
+    def reader_counter(self, name):
+        return getattr(self.reader, name, 0) if self.reader is not None else 0
+
+    def rates(self, now):
+        """(bytes/s, lines/s) over the last RATE_WINDOW seconds."""
+        totals = self.totals
+        totals.append((now, self.reader_counter('bytes_read'), self.reader_counter('lines_read')))
+        while len(totals) > 2 and now - totals[1][0] >= RATE_WINDOW:
+            totals.popleft()
+        elapsed = now - totals[0][0]
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (totals[-1][1] - totals[0][1]) / elapsed, (totals[-1][2] - totals[0][2]) / elapsed
+
+    def snapshot(self):
+        """Every metric as a plain dict."""
+        now = time.monotonic()
+        bytes_per_second, lines_per_second = self.rates(now)
+        null_readings = self.reader_counter('null_readings') or {}
+        writer = self.log_writer
+        write_latency = writer.write_latency if writer is not None else self.write_latency
+        return {
+            'uptime_seconds': now - self.started,
+            'serial_bytes': self.reader_counter('bytes_read'),
+            'serial_lines': self.reader_counter('lines_read'),
+            'serial_bytes_per_second': bytes_per_second,
+            'serial_lines_per_second': lines_per_second,
+            'parse_failures': self.reader_counter('parse_failures'),
+            'lost_frames': self.reader_counter('lost_frames'),
+            'null_readings': {int(sensor): int(count) for sensor, count in sorted(dict(null_readings).items())},
+            'samples_read': self.samples_read,
+            'samples_written': writer.rows_written if writer is not None else self.samples_written,
+            'rows_dropped': writer.dropped_rows if writer is not None else 0,
+            'writer_queue_depth': writer.queue_depth if writer is not None else 0,
+            'errors': self.errors,
+            'write_latency_seconds': write_latency,
+            'sample_gap_seconds': self.sample_gap,
+        }
+
+    def summary_line(self, snapshot=None):
+        s = snapshot or self.snapshot()
+        nulls = sum(s['null_readings'].values())
+        return (f"Serial {s['serial_bytes_per_second']:,.0f} B/s {s['serial_lines_per_second']:,.1f} lines/s   "
+                f"Parse failures: {s['parse_failures']}   Null: {nulls}   Written: {s['samples_written']:,}   "
+                f"Queue: {s['writer_queue_depth']}   Write p99: {format_seconds(s['write_latency_seconds'].quantile(0.99))}   "
+                f"Gap p99: {format_seconds(s['sample_gap_seconds'].quantile(0.99))}")
+
+    def report(self, snapshot=None):
+        """Multi-line report with the per-sensor figures."""
+        s = snapshot or self.snapshot()
+        lines = [
+            f"Serial: {s['serial_bytes']:,} bytes, {s['serial_lines']:,} lines "
+            f"({s['serial_bytes_per_second']:,.0f} B/s, {s['serial_lines_per_second']:,.1f} lines/s)",
+            f"Parse failures: {s['parse_failures']}   Lost frames: {s['lost_frames']}   Errors: {s['errors']}",
+            f"Samples: {s['samples_read']:,} read, {s['samples_written']:,} written, {s['rows_dropped']:,} dropped, "
+            f"{s['writer_queue_depth']} queued",
+        ]
+        latency = s['write_latency_seconds']
+        lines.append(f"Write latency: {latency.count()} writes, p50 {format_seconds(latency.quantile(0.5))}, "
+                     f"p99 {format_seconds(latency.quantile(0.99))}")
+        gap = s['sample_gap_seconds']
+        for sensor in range(len(gap.counts)):
+            if gap.count(sensor) or s['null_readings'].get(sensor):
+                lines.append(f"Sensor {sensor}: gap p50 {format_seconds(gap.quantile(0.5, sensor))}, "
+                             f"p99 {format_seconds(gap.quantile(0.99, sensor))}, "
+                             f"{s['null_readings'].get(sensor, 0)} null")
+        return "\n".join(lines)
+
+    def prometheus(self, snapshot=None):
+        """The snapshot in the Prometheus text exposition format."""
+        s = snapshot or self.snapshot()
+        lines = []
+        for name, kind in [('serial_bytes', 'counter'), ('serial_lines', 'counter'), ('parse_failures', 'counter'),
+                           ('lost_frames', 'counter'), ('samples_read', 'counter'), ('samples_written', 'counter'),
+                           ('rows_dropped', 'counter'), ('errors', 'counter'), ('serial_bytes_per_second', 'gauge'),
+                           ('serial_lines_per_second', 'gauge'), ('writer_queue_depth', 'gauge'), ('uptime_seconds', 'gauge')]:
+            metric = f'sensors_{name}_total' if kind == 'counter' else f'sensors_{name}'
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.append(f'{metric} {s[name]}')
+        lines.append('# TYPE sensors_null_readings_total counter')
+        for sensor, count in s['null_readings'].items():
+            lines.append(f'sensors_null_readings_total{{sensor="{sensor}"}} {count}')
+        lines += s['write_latency_seconds'].prometheus('sensors_write_latency_seconds')
+        lines += s['sample_gap_seconds'].prometheus('sensors_sample_gap_seconds', 'sensor')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=None):
+        """Write the metrics to path (.json for JSON, anything else Prometheus text).
+
+        The file is replaced atomically so a scraper never reads half of it.
+        """
+        path = path or self.export_path
+        snapshot = self.snapshot()
+        if path.endswith('.json'):
+            data = dict(snapshot, write_latency_seconds=snapshot['write_latency_seconds'].as_dict(),
+                        sample_gap_seconds=snapshot['sample_gap_seconds'].as_dict(), time=time.time())
+            text = json.dumps(data, indent=1)
+        else:
+            text = self.prometheus(snapshot)
+        temporary = path + '.tmp'
+        try:
+            with open(temporary, 'w') as f:
+                f.write(text)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Error writing metrics to {path}: {e}")
+        self.last_export = time.monotonic()
+
+    def maybe_export(self):
+        """Export if an export_path is set and export_interval has passed since the last export."""
+        if self.export_path and time.monotonic() - self.last_export >= self.export_interval:
+            self.export()
+
+def metrics_settings(config):
+    """(export_path or None, export_interval) from the metrics section of config.yaml."""
+    settings = config.get('metrics') or {}
+    return settings.get('export_path') or None, settings.get('export_interval', DEFAULT_EXPORT_INTERVAL)
@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import queue
+import threading
+from collections import Counter
+from captureclock import default_clock
+from serialreader import SerialLineReader
+from serialframes import FrameReader
+
+# Reader class for each serial_protocol setting in config.yaml
+PROTOCOL_READERS = {'text': SerialLineReader, 'binary': FrameReader}
+
+SENSORS_PER_BOARD = 8  # Sensors::numSensors in the firmware
+# USB-serial chips used on our boards
+ARDUINO_DESCRIPTIONS = ("CH340", "CP210x")
+
+def find_arduino_ports(descriptions=ARDUINO_DESCRIPTIONS):
+    """Every attached port that looks like one of our boards, sorted by device name."""
+    from serial.tools import list_ports
+    ports = [port for port in list_ports.comports() if any(d in port.description for d in descriptions)]
+    return sorted(ports, key=lambda port: port.device)
+
+def board_sensor_offsets(ports, boards_config):
+    """Global sensor ID offset for each port.
+
+    boards_config is the `boards` list from config.yaml; an entry's `match`
+    is compared with the port's serial number, USB location and device name.
+    Ports without an entry are numbered after the configured boards,
+    SENSORS_PER_BOARD IDs apart, in device order.
+    """
+    offsets = []
+    next_offset = max([board['sensor_offset'] + SENSORS_PER_BOARD for board in boards_config or []], default=0)
+    for port in ports:
+        identifiers = {port.device, getattr(port, 'serial_number', None), getattr(port, 'location', None)}
+        board = next((b for b in boards_config or [] if str(b['match']) in identifiers), None)
+        if board is not None:
+            offsets.append(board['sensor_offset'])
+        else:
+            offsets.append(next_offset)
+            next_offset += SENSORS_PER_BOARD
+    return offsets
+
+def open_boards(boards_config, descriptions=ARDUINO_DESCRIPTIONS, baudrate=115200):
+    """Open every attached board; returns (ports, sensor_offsets), both empty if none is found."""
+    import serial
+    port_infos = find_arduino_ports(descriptions)
+    ports = [serial.Serial(port.device, baudrate, timeout=1) for port in port_infos]
+    return ports, board_sensor_offsets(port_infos, boards_config)
+
+def capture_reader(ports, sensor_offsets, protocol='text'):
+    """A plain reader for a single board that needs no remapping, a MergedCapture otherwise.
+
+    protocol is 'text' for the firmware's text lines or 'binary' for its
+    BINARY_FRAMES frames.
+    """
+    if len(ports) == 1 and sensor_offsets[0] == 0:
+        return PROTOCOL_READERS[protocol](ports[0])
+    return MergedCapture(ports, sensor_offsets, protocol=protocol)
+
+class PortReader(threading.Thread):
+    """Reads one board on its own thread and forwards remapped samples to a shared queue."""
+    def __init__(self, ser, sensor_offset, samples, protocol='text'):
+        super().__init__(daemon=True, name=f"PortReader-{getattr(ser, 'port', ser)}")
+        self.ser = ser
+        self.sensor_offset = sensor_offset
+        self.samples = samples
+        self.reader = PROTOCOL_READERS[protocol](ser)
+        self.stopping = threading.Event()
+        self.error = None
+
+    def run(self):
+        offset = self.sensor_offset
+        while not self.stopping.is_set():
+            try:
+                samples = self.reader.read_samples()
+            except Exception as e:
+                # An unplugged board stops only its own thread
+                self.error = e
+                print(f"Stopped reading {getattr(self.ser, 'port', self.ser)}: {e}")
+                return
+            if samples:
+                self.samples.put([(timestamp, sensor_id + offset, value) for timestamp, sensor_id, value in samples])
+
+    def stop(self):
+        self.stopping.set()
+
+class MergedCapture:
+    """Reads several boards concurrently and returns their samples as one time-ordered stream.
+
+    Samples are held back for reorder_delay seconds so a sample from a port
+    that delivered slightly late can still be put in order; after that they
+    are released whether or not the other ports have delivered anything, so
+    one slow or silent port never stalls the rest. Has the same
+    read_samples() interface as SerialLineReader.
+    """
+    def __init__(self, ports, sensor_offsets, reorder_delay=0.1, protocol='text'):
+        self.samples = queue.Queue()
+        self.readers = [PortReader(ser, offset, self.samples, protocol) for ser, offset in zip(ports, sensor_offsets)]
+        self.reorder_delay = reorder_delay
+        self.pending = []
+        self.sequence = itertools.count()
+        self.last_released = None
+        self.late_samples = 0
+        self.num_sensors = max(sensor_offsets, default=0) + SENSORS_PER_BOARD
+        for reader in self.readers:
+            reader.start()
+
+    @property
+    def lost_frames(self):
+        """Frames lost on all boards (binary protocol only)."""
+        return sum(getattr(reader.reader, 'lost_frames', 0) for reader in self.readers)
+
+    @property
+    def bytes_read(self):
+        return sum(reader.reader.bytes_read for reader in self.readers)
+
+    @property
+    def lines_read(self):
+        return sum(reader.reader.lines_read for reader in self.readers)
+
+    @property
+    def parse_failures(self):
+        return sum(reader.reader.parse_failures for reader in self.readers)
+
+    @property
+    def null_readings(self):
+        """Null readings per global sensor number across all boards."""
+        counts = Counter()
+        for reader in self.readers:
+            for sensor_id, count in list(reader.reader.null_readings.items()):
+                counts[sensor_id + reader.sensor_offset] += count
+        return counts
+
+    def read_samples(self, timeout=0.05):
+        """Return the samples that are ready, ordered by timestamp."""
+        try:
+            batch = self.samples.get(timeout=timeout)
+            while True:
+                for sample in batch:
+                    # The sequence number keeps samples with equal timestamps in arrival order
+                    heapq.heappush(self.pending, (sample[0], next(self.sequence), sample))
+                batch = self.samples.get_nowait()
+        except queue.Empty:
+            pass
+
+        cutoff = default_clock.now_ms() - self.reorder_delay * 1000
+        ready = []
+        while self.pending and self.pending[0][0] <= cutoff:
+            ready.append(heapq.heappop(self.pending)[2])
+        if ready:
+            if self.last_released is not None and ready[0][0] < self.last_released:
+                self.late_samples += sum(1 for sample in ready if sample[0] < self.last_released)
+            self.last_released = ready[-1][0]
+        return ready
+
+    def flush(self):
+        """Stop the port threads and return every sample still held back, in order."""
+        for reader in self.readers:
+            reader.stop()
+        for reader in self.readers:
+            reader.join(timeout=2)
+        self.reorder_delay = -float('inf')
+        return self.read_samples(timeout=0)
+
+    def close(self):
+        for reader in self.readers:
+            reader.stop()
+            reader.ser.close()
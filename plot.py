@@ -1,12 +1,19 @@
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import seaborn as sns
 import argparse
 import yaml
 import os
-import warnings
 from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor
+from calibration import apply_calibration, mm_to_inches
+from eventgate import event_settings
+from extremes import approach_settings, extreme_index
+from segments import EventPass, find_passes, pass_settings
+from captureclock import DISPLAY_TIMEZONE, to_display_time
+import runcache
+import capturefile
+import closest
+import pyramid
 
 def load_config(config_file='config.yaml'):
     with open(config_file, 'r') as f:
@@ -19,11 +26,28 @@ right_side_sensors = config['right_side_sensors']
 left_side_sensors = config['left_side_sensors']
 calibration_map = config['calibration_map']
 
-# Suppress specific FutureWarnings from Seaborn, if desired
-warnings.simplefilter(action='ignore', category=FutureWarning)
-
-# Set Monokai theme using rcParams
-plt.rcParams.update({
+# Event detection: Sensor reads below threshold_mm (510mm, 20.08 inches, by default)
+_, THRESHOLD_MM, padding_seconds = event_settings(config)
+THRESHOLD_INCHES = mm_to_inches(THRESHOLD_MM)
+# Padding kept on each side of the event
+EVENT_PADDING = pd.Timedelta(seconds=padding_seconds)
+# A pass stays open while readings are below the threshold plus the hysteresis, and
+# ends once the merge gap goes by without one; the next low reading opens a new pass
+hysteresis_mm, merge_gap_seconds = pass_settings(config)
+EXIT_THRESHOLD_INCHES = mm_to_inches(THRESHOLD_MM + hysteresis_mm)
+MERGE_GAP = np.timedelta64(int(merge_gap_seconds * 1000), 'ms')
+# All of the above, recorded with each cached result so a change to any of them reprocesses the files
+DETECTION_SETTINGS = runcache.detection_settings(config)
+
+# Closest approaches reported per sensor and side, and how far apart they must be
+APPROACH_COUNT, APPROACH_GAP_SECONDS = approach_settings(config)
+SIDES = {'left': left_side_sensors, 'right': right_side_sensors}
+
+# Points per sensor a plot needs at least; the grouping is the coarsest pyramid level that still gives this many
+PLOT_POINTS = 500
+
+# Monokai theme, applied to matplotlib's rcParams when the plotting stack is loaded
+MONOKAI_RCPARAMS = {
     'axes.facecolor': '#272822',
     'axes.edgecolor': '#F8F8F2',
     'axes.labelcolor': '#F8F8F2',
@@ -38,202 +62,499 @@ plt.rcParams.update({
     'lines.linewidth': 1.5,
     'savefig.facecolor': '#272822',
     'savefig.edgecolor': '#272822',
-})
-
-def apply_calibration(measurement, sensor_id, calibration_map, active_sensors):
-    """Apply the calibration based on the sensor ID only if the sensor is active."""
-    # Only apply calibration if the sensor_id is active in the data
-    if sensor_id in active_sensors:
-        calibration_value = calibration_map.get(sensor_id, 0)  # Default to 0 if no calibration value is found
-        return measurement + calibration_value
-    else:
-        return measurement  # Return the original measurement if the sensor is not active
+}
+
+def matplotlib_modules():
+    """Import matplotlib and its dates module with the Monokai theme and return (matplotlib, mdates).
 
-def mm_to_inches(mm):
-    inches = mm / 25.4
-    return round(inches * 8) / 8
+    The plotting stack is most of plot.py's startup time, so it is only
+    loaded once a figure is actually drawn. PlotRenderer needs neither
+    pyplot nor seaborn, so they are never loaded.
+    """
+    import matplotlib
+    import matplotlib.dates as mdates
+    matplotlib.rcParams.update(MONOKAI_RCPARAMS)
+    return matplotlib, mdates
 
 def determine_grouping_frequency(start_time, end_time):
-    duration_seconds = (end_time - start_time).total_seconds()
-
-    # Calculate the number of intervals we want, which is between 5 and 20
-    desired_intervals = min(max(duration_seconds // 5, 5), 20)
-
-    frequency_seconds = duration_seconds / desired_intervals
-    return '0.1S'
-    if frequency_seconds < 1:
-        return '1S'  # Minimum frequency is 1 second
-    elif frequency_seconds < 60:
-        return f'{int(frequency_seconds)}S'
-    elif frequency_seconds < 3600:
-        return f'{int(frequency_seconds // 60)}T'  # 'T' is the alias for minutes
-    else:
-        return f'{int(frequency_seconds // 3600)}H'  # 'H' is the alias for hours
+    """Coarsest pyramid level (0.1 s up to 1 h) that still gives PLOT_POINTS points per sensor.
 
-def convert_frequency_to_words(frequency):
-    if 'S' in frequency:
-        return f"{frequency.replace('S', '')} seconds"
-    elif 'T' in frequency:
-        return f"{frequency.replace('T', '')} minutes"
-    elif 'H' in frequency:
-        return f"{frequency.replace('H', '')} hours"
-    else:
-        return frequency
+    Short events keep the 0.1 second grouping; long recordings get fewer,
+    wider groups instead of one point per 0.1 s.
+    """
+    duration_ms = (end_time - start_time).total_seconds() * 1000
+    return pyramid.choose_level(duration_ms, PLOT_POINTS)
 
-def process_and_plot(csv_file):
+def convert_frequency_to_words(frequency):
+    """Grouping frequency for the plot title, e.g. '100ms' -> '0.1 seconds' and '1min' -> '1 minute'."""
     try:
-        df = pd.read_csv(csv_file)
-    except Exception as e:
-        print(f"Error reading {csv_file}: {e}")
-        return None, None
+        seconds = pd.Timedelta(frequency).total_seconds()
+    except ValueError:
+        return frequency
+    for unit_seconds, unit in [(3600, 'hour'), (60, 'minute'), (1, 'second')]:
+        if seconds >= unit_seconds or unit == 'second':
+            number = seconds / unit_seconds
+            return f"{number:g} {unit}{'' if number == 1 else 's'}"
 
+def output_png_path(csv_file):
+    base_filename = capturefile.capture_stem(csv_file)
+    output_dir = os.path.dirname(csv_file)
+    return os.path.join(output_dir, base_filename + '_trimmed.png')
+
+def pass_png_path(csv_file, number, total):
+    """PNG of one pass: the usual <capture>_trimmed.png for a single pass, <capture>_pass<n>_trimmed.png otherwise.
+
+    total is None while the capture is still being written (watch.py), which always gives the _pass<n> name.
+    """
+    if total == 1:
+        return output_png_path(csv_file)
+    base_filename = capturefile.capture_stem(csv_file)
+    return os.path.join(os.path.dirname(csv_file), f"{base_filename}_pass{number}_trimmed.png")
+
+def remove_stale_pngs(csv_file, total):
+    """Delete the PNGs an earlier run drew for passes the capture no longer has (total is the new pass count).
+
+    Passes are numbered from 1 without gaps, so the stale _pass<n> PNGs
+    are the ones from the first unused number on.
+    """
+    if total != 1 and os.path.exists(output_png_path(csv_file)):
+        os.remove(output_png_path(csv_file))
+    # A single pass is drawn to <capture>_trimmed.png, so then even _pass1 is stale
+    number = 1 if total == 1 else total + 1
+    while os.path.exists(pass_png_path(csv_file, number, None)):
+        os.remove(pass_png_path(csv_file, number, None))
+        number += 1
+
+def prepare_capture(df, csv_file):
+    """Validate a raw capture frame, parse its timestamps and convert measurements to calibrated inches."""
     required_columns = ['Timestamp (PST)', 'Measurement', 'Sensor Number']
     if not all(column in df.columns for column in required_columns):
         raise KeyError(f"CSV file {csv_file} is missing one or more required columns: {required_columns}")
 
     # Check if the timestamp is a Unix timestamp or a date string
-    if pd.api.types.is_numeric_dtype(df['Timestamp (PST)']):
-        df['Timestamp (PST)'] = pd.to_datetime(df['Timestamp (PST)'], unit='ms')
+    naive = not pd.api.types.is_numeric_dtype(df['Timestamp (PST)'])
+    if not naive:
+        # Captures store UTC epoch ms; plots and summaries show Pacific time
+        df['Timestamp (PST)'] = to_display_time(df['Timestamp (PST)'])
     else:
         df['Timestamp (PST)'] = pd.to_datetime(df['Timestamp (PST)'])
 
-    # Determine active sensors from the data
-    active_sensors = df['Sensor Number'].unique()
-
-    # Apply calibration and convert to inches
-    df['Measurement'] = df.apply(lambda row: mm_to_inches(apply_calibration(row['Measurement'], row['Sensor Number'], calibration_map, active_sensors)), axis=1)
-
-    # Event detection: Sensor reads below 510mm (20.08 inches)
-    threshold_mm = 510
-    threshold_inches = mm_to_inches(threshold_mm)
-    
-    # Find the first time any sensor drops below the threshold
-    event_start_idx = df[df['Measurement'] < threshold_inches].index.min()
-    event_end_idx = df[df['Measurement'] < threshold_inches].index.max()
+    # Apply calibration and convert to inches for the whole column at once
+    df['Measurement'] = mm_to_inches(apply_calibration(df['Measurement'], df['Sensor Number'], calibration_map))
+    # Whether the times are naive local ones from date strings, for checking them against the pyramid sidecar
+    df.attrs['naive'] = naive
+    return df
+
+def trim_to_event(df, event_start, event_end):
+    # Add padding to start and end
+    event_start_time = event_start - EVENT_PADDING
+    event_end_time = event_end + EVENT_PADDING
+    return df[(df['Timestamp (PST)'] >= event_start_time) & (df['Timestamp (PST)'] <= event_end_time)]
+
+def find_event_passes(df):
+    """(start, end) of every separate pass below the threshold in a time-ordered frame (see segments.find_passes)."""
+    starts, ends = find_passes(df['Timestamp (PST)'].to_numpy(), df['Measurement'].to_numpy(),
+                               THRESHOLD_INCHES, EXIT_THRESHOLD_INCHES, MERGE_GAP)
+    return list(zip(pd.to_datetime(starts), pd.to_datetime(ends)))
+
+def slice_pass(df, start, end):
+    """The padded window of one pass out of a time-ordered frame, found by binary search instead of a scan."""
+    times = df['Timestamp (PST)']
+    return df.iloc[times.searchsorted(start - EVENT_PADDING, side='left'):times.searchsorted(end + EVENT_PADDING, side='right')]
+
+def load_passes(csv_file):
+    """Load a whole capture and cut it into the padded window of every pass: [(start, end, frame)]."""
+    df = prepare_capture(capturefile.read_capture(csv_file), csv_file)
+    if not df['Timestamp (PST)'].is_monotonic_increasing:
+        df = df.sort_values('Timestamp (PST)', kind='stable')
+    return [(start, end, slice_pass(df, start, end)) for start, end in find_event_passes(df)]
+
+def load_passes_streaming(csv_file, chunksize):
+    """Two-pass version of load_passes that never holds more than one chunk plus the passes in memory.
+
+    Pass one keeps only the readings below the exit threshold of each
+    chunk, which is all the segmentation looks at. Pass two reads the
+    capture again and keeps the rows inside each padded pass window.
+    Chunks must come in time order, as captures are written.
+    """
+    low_times = []
+    low_readings = []
+    for chunk in capturefile.iter_capture(csv_file, chunksize):
+        chunk = prepare_capture(chunk, csv_file)
+        low = chunk[chunk['Measurement'] < EXIT_THRESHOLD_INCHES]
+        low_times.append(low['Timestamp (PST)'].to_numpy())
+        low_readings.append(low['Measurement'].to_numpy())
+    if not low_times:
+        return []
+    starts, ends = find_passes(np.concatenate(low_times), np.concatenate(low_readings),
+                               THRESHOLD_INCHES, EXIT_THRESHOLD_INCHES, MERGE_GAP)
+    passes = list(zip(pd.to_datetime(starts), pd.to_datetime(ends)))
+    if not passes:
+        return []
+
+    window_starts = pd.DatetimeIndex([start - EVENT_PADDING for start, _ in passes])
+    window_ends = pd.DatetimeIndex([end + EVENT_PADDING for _, end in passes])
+    pieces = [[] for _ in passes]
+    for chunk in capturefile.iter_capture(csv_file, chunksize):
+        chunk = prepare_capture(chunk, csv_file)
+        if chunk.empty:
+            continue
+        # Only the passes whose windows overlap this chunk are checked against it
+        first = window_ends.searchsorted(chunk['Timestamp (PST)'].min(), side='left')
+        last = window_starts.searchsorted(chunk['Timestamp (PST)'].max(), side='right')
+        for number in range(first, last):
+            pieces[number].append(trim_to_event(chunk, *passes[number]))
+    return [(start, end, pd.concat(frames)) for (start, end), frames in zip(passes, pieces)]
+
+def group_minimums(df, grouping_frequency):
+    """Minimum measurement per sensor in each grouping interval, as a flat frame."""
+    grouped = df.set_index('Timestamp (PST)').groupby(['Sensor Number', pd.Grouper(freq=grouping_frequency)]).min()
+    return grouped.reset_index()
+
+def local_to_epoch_ms(timestamp, ambiguous):
+    return pd.Timestamp(timestamp).tz_localize(DISPLAY_TIMEZONE, ambiguous=ambiguous, nonexistent='shift_forward').value // 1_000_000
+
+def pyramid_minimums(csv_file, start_time, end_time, grouping_frequency, naive=False):
+    """group_minimums for the event window, read from the capture's pyramid sidecar instead of the raw rows.
+
+    Only the buckets of one level that overlap the window are read, so the
+    cost follows the number of points drawn. Buckets straddling the window
+    edges also cover the readings just outside it. Returns None if the
+    sidecar's timestamps aren't the kind (naive local or epoch ms) given.
+    """
+    capture_pyramid = pyramid.load_pyramid(csv_file)
+    if capture_pyramid.naive != naive:
+        return None
+    if capture_pyramid.naive:
+        start_ms = pd.Timestamp(start_time).value // 1_000_000
+        end_ms = pd.Timestamp(end_time).value // 1_000_000
+    else:
+        # A local time in the hour repeated when daylight saving ends could be either UTC time; take the wider range
+        start_ms = min(local_to_epoch_ms(start_time, ambiguous) for ambiguous in (True, False))
+        end_ms = max(local_to_epoch_ms(end_time, ambiguous) for ambiguous in (True, False))
+    _, (times, sensors, minima, _, _) = capture_pyramid.query(start_ms, end_ms, frequency=grouping_frequency)
+    times = pd.Series(times)
+    timestamps = pd.to_datetime(times, unit='ms') if capture_pyramid.naive else to_display_time(times)
+    width = pd.Timedelta(milliseconds=pyramid.LEVEL_WIDTHS[grouping_frequency])
+    rows = ((timestamps + width > start_time) & (timestamps <= end_time)).to_numpy()
+    sensors = sensors[rows].astype(np.int64)
+    return pd.DataFrame({
+        'Sensor Number': sensors,
+        'Timestamp (PST)': timestamps[rows].to_numpy(),
+        'Measurement': mm_to_inches(apply_calibration(minima[rows], sensors, calibration_map)),
+    })
+
+# Dashed reference lines drawn on every plot: (inches, colour, label)
+REFERENCE_LINES = [(2.5, '#E6DB74', '2.5 inches'), (5, '#AE81FF', '5 inches'), (10, '#66D9EF', '10 inches')]
+
+def min_label(measurement):
+    intnum = int(measurement)
+    fracnum = Fraction(measurement - intnum)
+    return f"{intnum} {fracnum} in"
+
+class PlotRenderer:
+    """Headless renderer for the per-file PNGs, drawing the same picture as the old seaborn renderer (bench.seaborn_render_plot).
+
+    The Agg figure, axes, labels, log scale, date formatting and reference
+    lines are set up once; each render only swaps in the sensor traces,
+    legend and minimum labels. That skips seaborn's hue grouping and
+    estimator passes and pyplot's figure management for every file.
+    """
+    def __init__(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        matplotlib, mdates = matplotlib_modules()
+
+        self.figure = Figure(figsize=(16, 9))
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.colors = matplotlib.colormaps['tab10'].colors
+        self.date2num = mdates.date2num
+        ax = self.ax
+        ax.xaxis_date()
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M:%S'))
+        ax.set_xlabel('Timestamp')
+        ax.set_ylabel('Measurement (inches)')
+        ax.grid(True)
+        ax.set_yscale('log')
+        self.reference_labels = []
+        for y_value, color, label in REFERENCE_LINES:
+            # Above the sensor traces, which the seaborn renderer drew first
+            ax.axhline(y=y_value, color=color, linestyle='--', zorder=2.01)
+            self.reference_labels.append(ax.text(0, y_value, f'  {label}', verticalalignment='center', color=color))
+        self.artists = []
+
+    def render(self, grouped, grouping_frequency_words, output_filename):
+        ax = self.ax
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+
+        timestamps = self.date2num(grouped['Timestamp (PST)'].to_numpy())
+        measurements = grouped['Measurement'].to_numpy()
+        sensors = grouped['Sensor Number'].to_numpy()
+        for i, sensor in enumerate(sorted(pd.unique(sensors))):
+            rows = sensors == sensor
+            x = timestamps[rows]
+            y = measurements[rows]
+            order = np.argsort(x, kind='stable')
+            x, y = x[order], y[order]
+            color = self.colors[i % len(self.colors)]
+            line, = ax.plot(x, y, color=color, label=str(sensor))
+            self.artists.append(line)
+
+            # Label only the lowest point of each sensor
+            lowest = int(np.nanargmin(y))
+            self.artists.append(ax.text(x[lowest], y[lowest] - 0.5, min_label(y[lowest]),
+                                        color=color, fontsize=9, verticalalignment='top'))
+
+        for text in self.reference_labels:
+            text.set_x(timestamps[-1])
+        self.artists.append(ax.legend(title='Sensor Number'))
+        ax.set_title(f'Minimum Measurement per Sensor (Grouped every {grouping_frequency_words})')
+        ax.relim()
+        ax.autoscale_view()
+        self.figure.autofmt_xdate()
+        # Light zlib compression: same pixels, a somewhat bigger file, a fraction of the encoding time
+        self.figure.savefig(output_filename, pil_kwargs={'compress_level': 1})
+
+_renderer = None
+
+def fast_render_plot(grouped, grouping_frequency_words, output_filename):
+    """Draw a PNG with a PlotRenderer shared by every file this process draws."""
+    global _renderer
+    if _renderer is None:
+        _renderer = PlotRenderer()
+    _renderer.render(grouped, grouping_frequency_words, output_filename)
+
+def find_extremes(df, count=None):
+    """Closest approaches per sensor and per side of the tug (see extremes.extreme_index).
+
+    Up to count (APPROACH_COUNT by default) approaches each, at least
+    APPROACH_GAP_SECONDS apart, with times as Timestamps.
+    """
+    per_sensor, per_side = extreme_index(df['Timestamp (PST)'].to_numpy(), df['Sensor Number'].to_numpy(),
+                                         df['Measurement'].to_numpy(), count or APPROACH_COUNT,
+                                         np.timedelta64(int(APPROACH_GAP_SECONDS * 1000), 'ms'), SIDES)
+    def with_timestamps(approaches):
+        return [approach._replace(time=pd.Timestamp(approach.time)) for approach in approaches]
+    return ({sensor: with_timestamps(approaches) for sensor, approaches in per_sensor.items()},
+            {side: with_timestamps(approaches) for side, approaches in per_side.items()})
+
+def closest_series(per_sensor):
+    """(closest_readings, closest_times) Series indexed by sensor from find_extremes' per-sensor approaches."""
+    index = pd.Index(sorted(per_sensor), name='Sensor Number')
+    closest_readings = pd.Series([per_sensor[sensor][0].reading for sensor in index], index=index, name='Measurement')
+    closest_times = pd.Series([per_sensor[sensor][0].time for sensor in index], index=index, name='Timestamp (PST)')
+    return closest_readings, closest_times
 
-    if pd.isna(event_start_idx) or pd.isna(event_end_idx):
-        print("No event found in the dataset.")
-        return None, None
+def find_closest(df):
+    """Closest reading per sensor and the time that sensor first read it."""
+    per_sensor, _ = find_extremes(df, count=1)
+    return closest_series(per_sensor)
 
-    # Add 1 second padding to start and end
-    event_start_time = df.loc[event_start_idx, 'Timestamp (PST)'] - pd.Timedelta(seconds=1)
-    event_end_time = df.loc[event_end_idx, 'Timestamp (PST)'] + pd.Timedelta(seconds=1)
+def print_side_approaches(per_side):
+    for side, approaches in per_side.items():
+        print(f"{side.capitalize()} side closest approaches:")
+        for approach in approaches:
+            print(f"  {approach.reading} inches at {approach.time} (sensor {approach.sensor})")
 
-    # Trim the dataframe to the event duration
-    df = df[(df['Timestamp (PST)'] >= event_start_time) & (df['Timestamp (PST)'] <= event_end_time)]
+def plot_pass(df, output_filename, csv_file=None):
+    """Draw one pass, grouped by the coarsest level with enough points for its length.
 
+    With csv_file, the minima come from the capture's pyramid sidecar
+    instead of grouping the rows of df, unless the sidecar doesn't match
+    the rows.
+    """
     start_time = df['Timestamp (PST)'].min()
     end_time = df['Timestamp (PST)'].max()
 
     grouping_frequency = determine_grouping_frequency(start_time, end_time)
     grouping_frequency_words = convert_frequency_to_words(grouping_frequency)
 
-    df.set_index('Timestamp (PST)', inplace=True)
-    grouped = df.groupby(['Sensor Number', pd.Grouper(freq=grouping_frequency)]).min()
-    grouped = grouped.reset_index()
-
-    plt.figure(figsize=(16, 9))
-    plot = sns.lineplot(data=grouped, x='Timestamp (PST)', y='Measurement', hue='Sensor Number', palette='tab10')
-
-    plt.title(f'Minimum Measurement per Sensor (Grouped every {grouping_frequency_words})')
-    plt.xlabel('Timestamp')
-    plt.ylabel('Measurement (inches)')
-    plt.legend(title='Sensor Number')
-    plt.grid(True)
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M:%S'))
-    plt.gcf().autofmt_xdate()
-
-    plt.yscale('log')
-    plt.autoscale(enable=True, axis='y')
-
-    # Optional reference lines
-    for y_value, color, label in [(2.5, '#E6DB74', '2.5 inches'), (5, '#AE81FF', '5 inches'), (10, '#66D9EF', '10 inches')]:
-        plt.axhline(y=y_value, color=color, linestyle='--')
-        plt.text(grouped['Timestamp (PST)'].iloc[-1], y_value, f'  {label}', verticalalignment='center', color=color)
-
-    # Find the lowest measurement for each sensor and label only that point
-    for sensor in grouped['Sensor Number'].unique():
-        sensor_data = grouped[grouped['Sensor Number'] == sensor]
-        min_row = sensor_data.loc[sensor_data['Measurement'].idxmin()]  # Get the row with the lowest value for the sensor
-        intnum = int(min_row["Measurement"])
-        fracnum = Fraction(min_row["Measurement"] - intnum)
-        label_text = f"{intnum} {fracnum} in"
-
-        # Add the label at the lowest point
-        plt.text(min_row['Timestamp (PST)'], min_row['Measurement'] - 0.5, label_text,
-                 color=plot.get_lines()[sensor].get_color(), fontsize=9, verticalalignment='top')
-
-    base_filename = os.path.splitext(os.path.basename(csv_file))[0]
-    output_dir = os.path.dirname(csv_file)
-    output_filename = os.path.join(output_dir, base_filename + '_trimmed.png')
-    plt.savefig(output_filename)
+    grouped = None
+    if csv_file is not None:
+        try:
+            grouped = pyramid_minimums(csv_file, start_time, end_time, grouping_frequency, df.attrs.get('naive', False))
+        except (OSError, ValueError) as e:
+            # e.g. a read-only share where the sidecar can't be written
+            print(f"No pyramid sidecar for {csv_file} ({e}); grouping the raw readings")
+    if grouped is None or (grouped.empty and not df.empty):
+        grouped = group_minimums(df, grouping_frequency)
+    fast_render_plot(grouped, grouping_frequency_words, output_filename)
+
+def print_pass(event_pass, total, per_side):
+    print(f"Pass {event_pass.number} of {total}: {event_pass.start} to {event_pass.end} "
+          f"({(event_pass.end - event_pass.start).total_seconds():g} s, {event_pass.samples} samples)")
+    for sensor, reading in event_pass.closest_readings.items():
+        print(f"Sensor {sensor} - Closest Reading: {reading} inches at {event_pass.closest_times[sensor]}")
+    print_side_approaches(per_side)
+
+def process_and_plot(csv_file, chunksize=None, show_approaches=False):
+    """Plot every pass of one capture to its own PNG and return an EventPass for each (an empty list if there are none).
+
+    show_approaches also prints each pass with its sides' near misses.
+    """
+    try:
+        if chunksize:
+            windows = load_passes_streaming(csv_file, chunksize)
+        else:
+            windows = load_passes(csv_file)
+    except (OSError, ValueError, pd.errors.ParserError) as e:
+        print(f"Error reading {csv_file}: {e}")
+        return []
 
-    closest_readings = df.groupby('Sensor Number')['Measurement'].min()
-    
-    df = df.reset_index()
-    closest_times = df.loc[df['Measurement'].isin(closest_readings)].groupby('Sensor Number')['Timestamp (PST)'].first()
+    remove_stale_pngs(csv_file, len(windows))
+    if not windows:
+        print("No event found in the dataset.")
+        return []
+
+    passes = []
+    for number, (start, end, df) in enumerate(windows, 1):
+        # Building the pyramid needs the whole capture in memory, which --stream avoids
+        plot_pass(df, pass_png_path(csv_file, number, len(windows)), None if chunksize else csv_file)
+        per_sensor, per_side = find_extremes(df, count=None if show_approaches else 1)
+        closest_readings, closest_times = closest_series(per_sensor)
+        event_pass = EventPass(number, start, end, len(df), closest_readings, closest_times)
+        if show_approaches:
+            print_pass(event_pass, len(windows), per_side)
+        passes.append(event_pass)
+    return passes
+
+def find_csv_files(directory):
+    """Every capture file (CSV or binary) under directory, in a stable order, skipping our own summary file."""
+    return capturefile.find_capture_files(directory)
+
+def lowest_side_readings(closest_readings):
+    """Lowest reading on the left and right side of the tug, or None for a side with no active sensors."""
+    # Filter sensors that are in the current dataset
+    active_sensors = closest_readings.index
+
+    # Filter right and left side sensors based on active sensors in the dataset
+    active_right_side_sensors = [sensor for sensor in right_side_sensors if sensor in active_sensors]
+    active_left_side_sensors = [sensor for sensor in left_side_sensors if sensor in active_sensors]
+
+    # Initialize the lowest readings as None
+    lowest_left_reading = None
+    lowest_right_reading = None
+
+    # Check for left side sensors
+    if active_left_side_sensors:
+        # Find the lowest reading on the left side
+        left_side_readings = closest_readings[active_left_side_sensors]
+        lowest_left_reading = left_side_readings.min()
+
+    # Check for right side sensors
+    if active_right_side_sensors:
+        # Find the lowest reading on the right side
+        right_side_readings = closest_readings[active_right_side_sensors]
+        lowest_right_reading = right_side_readings.min()
+
+    return lowest_left_reading, lowest_right_reading
+
+def summary_row(file, event_pass):
+    """lowest_readings.csv line of one pass: file, lowest left and right reading, then the pass number, start and end."""
+    lowest_left_reading, lowest_right_reading = lowest_side_readings(event_pass.closest_readings)
+    return (f"{file},{lowest_left_reading if lowest_left_reading is not None else ''},"
+            f"{lowest_right_reading if lowest_right_reading is not None else ''},"
+            f"{event_pass.number},{event_pass.start.isoformat()},{event_pass.end.isoformat()}\n")
+
+def process_file(file_path, chunksize=None):
+    """Worker entry point: process one CSV and never raise, so one bad file can't stop a batch."""
+    try:
+        return process_and_plot(file_path, chunksize), None
+    except Exception as e:
+        return None, e
 
-    plt.close()
-    
-    return closest_readings, closest_times
+def init_worker():
+    # Workers only ever save figures, so skip any interactive backend
+    matplotlib, _ = matplotlib_modules()
+    matplotlib.use('Agg')
 
-def process_directory(directory):
+def process_directory(directory, jobs=1, use_cache=True, chunksize=None):
     # Define the output CSV file path
     output_file = os.path.join(directory, 'lowest_readings.csv')
-
-    # Open the output file in write mode
-    with open(output_file, 'w') as f_out:
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if file.endswith('.csv'):
-                    file_path = os.path.join(root, file)
-                    try:
-                        closest_readings, closest_times = process_and_plot(file_path)
-
-                        # If there are no readings, skip to the next file
-                        if closest_readings is None or closest_times is None:
-                            continue
-
-                        # Filter sensors that are in the current dataset
-                        active_sensors = closest_readings.index
-
-                        # Filter right and left side sensors based on active sensors in the dataset
-                        active_right_side_sensors = [sensor for sensor in right_side_sensors if sensor in active_sensors]
-                        active_left_side_sensors = [sensor for sensor in left_side_sensors if sensor in active_sensors]
-
-                        # Initialize the lowest readings as None
-                        lowest_left_reading = None
-                        lowest_right_reading = None
-
-                        # Check for left side sensors
-                        if active_left_side_sensors:
-                            # Find the lowest reading on the left side
-                            left_side_readings = closest_readings[active_left_side_sensors]
-                            lowest_left_reading = left_side_readings.min()
-
-                        # Check for right side sensors
-                        if active_right_side_sensors:
-                            # Find the lowest reading on the right side
-                            right_side_readings = closest_readings[active_right_side_sensors]
-                            lowest_right_reading = right_side_readings.min()
-
-                        # Write the results to the output CSV file
-                        f_out.write(f"{file},{lowest_left_reading if lowest_left_reading is not None else ''},{lowest_right_reading if lowest_right_reading is not None else ''}\n")
-
-                    except Exception as e:
-                        print(f"Failed to process {file_path}: {e}")
+    csv_files = find_csv_files(directory)
+
+    # Results of earlier runs, keyed by path relative to the directory
+    manifest = runcache.load_manifest(directory) if use_cache else {}
+    entries = {}
+    fingerprints = {}
+    stale_files = []
+    for file_path in csv_files:
+        key = os.path.relpath(file_path, directory)
+        try:
+            fingerprints[file_path] = runcache.fingerprint(file_path, manifest.get(key))
+        except OSError as e:
+            print(f"Failed to read {file_path}: {e}")
+            continue
+        png_paths = [pass_png_path(file_path, number, total) for number, total in runcache.pass_numbers(manifest.get(key))]
+        if runcache.is_fresh(manifest.get(key), fingerprints[file_path], calibration_map, png_paths, DETECTION_SETTINGS):
+            entries[key] = dict(manifest[key], **fingerprints[file_path])
+        else:
+            stale_files.append(file_path)
+
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) if jobs > 1 and stale_files else None
+    try:
+        futures = None
+        if executor is not None:
+            futures = {file_path: executor.submit(process_file, file_path, chunksize) for file_path in stale_files}
+
+        # Open the output file in write mode
+        with open(output_file, 'w') as f_out:
+            # Results are collected in file order, so the output is the same for any number of jobs
+            for file_path in csv_files:
+                key = os.path.relpath(file_path, directory)
+                if file_path not in fingerprints:
+                    continue
+
+                if key in entries:
+                    passes = runcache.cached_results(entries[key])
+                else:
+                    if futures is None:
+                        passes, error = process_file(file_path, chunksize)
+                    else:
+                        try:
+                            passes, error = futures[file_path].result()
+                        except Exception as e:
+                            # The worker process itself died (e.g. out of memory)
+                            passes, error = None, e
+
+                    if error is not None:
+                        print(f"Failed to process {file_path}: {error}")
+                        continue
+                    entries[key] = runcache.make_entry(fingerprints[file_path], calibration_map, passes, DETECTION_SETTINGS)
+
+                # One row per pass
+                for event_pass in passes:
+                    f_out.write(summary_row(os.path.basename(file_path), event_pass))
+    finally:
+        # Also on an error or Ctrl+C, so no worker outlives the run; files not started yet are dropped
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    # Files that disappeared since the last run drop out of the manifest here
+    runcache.save_manifest(directory, entries)
 
 def main():
     parser = argparse.ArgumentParser(description='Process a CSV file or directory of CSV files to plot sensor measurements.')
-    parser.add_argument('path', type=str, help='CSV file or directory containing CSV files to process')
+    parser.add_argument('path', type=str, help='CSV/.bin capture file or directory containing capture files to process')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of worker processes to use when processing a directory')
+    parser.add_argument('--stream', action='store_true', help='Find the event in two passes over the file instead of loading it whole (bounded memory for very large captures)')
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help='Rows per chunk in --stream mode')
+    parser.add_argument('--no-cache', action='store_true', help='Reprocess every file in a directory even if it has not changed since the last run')
+    parser.add_argument('--summary', action='store_true', help='Only print the closest reading of each sensor; no plots, and matplotlib is never loaded')
     args = parser.parse_args()
+    chunksize = args.chunksize if args.stream else None
+
+    if args.summary:
+        closest.summarize_path(args.path, config)
+        return
 
-    if os.path.isfile(args.path) and args.path.endswith('.csv'):
-        closest_readings, closest_times = process_and_plot(args.path)
-        for sensor, reading in closest_readings.items():
-            print(f"Sensor {sensor} - Closest Reading: {reading} inches at {closest_times[sensor]}")
+    if os.path.isfile(args.path) and capturefile.is_capture_file(args.path):
+        process_and_plot(args.path, chunksize, show_approaches=True)
     elif os.path.isdir(args.path):
-        process_directory(args.path)
+        process_directory(args.path, jobs=args.jobs, use_cache=not args.no_cache, chunksize=chunksize)
     else:
         print(f"Invalid input: {args.path}. Please provide a valid CSV file or directory.")
 
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import struct
+import time
+import numpy as np
+import capturefile
+from closest import load_capture_arrays
+
+# Resolutions of the pyramid, finest first: (pandas frequency, bucket width in ms).
+# The frequencies are the ones plot.py groups by, so a level can stand in for a groupby.
+LEVELS = [('100ms', 100), ('1s', 1000), ('10s', 10_000), ('1min', 60_000), ('1h', 3_600_000)]
+LEVEL_WIDTHS = dict(LEVELS)
+# Bump when the sidecar layout changes; older sidecars are rebuilt
+PYRAMID_VERSION = 3
+SIDECAR_SUFFIX = '.pyramid'
+SIDECAR_MAGIC = b'SNSRPYR\0'
+HEADER_LENGTH = struct.Struct('<I')
+
+def sidecar_path(capture_path):
+    return capture_path + SIDECAR_SUFFIX
+
+def choose_level(duration_ms, min_points):
+    """Coarsest level that still gives min_points buckets over duration_ms (the finest if none does)."""
+    for frequency, width in reversed(LEVELS):
+        if duration_ms / width >= min_points:
+            return frequency
+    return LEVELS[0][0]
+
+def combine(keys, sensors, minima, maxima, counts):
+    """Merge rows that share a (sensor, key); rows must already be sorted by sensor, then key."""
+    if not len(keys):
+        return keys, sensors, minima, maxima, counts
+    starts = np.flatnonzero(np.concatenate([[True], (keys[1:] != keys[:-1]) | (sensors[1:] != sensors[:-1])]))
+    return (keys[starts], sensors[starts], np.minimum.reduceat(minima, starts),
+            np.maximum.reduceat(maxima, starts), np.add.reduceat(counts, starts))
+
+def measurement_dtype(measurements):
+    """uint16 for whole millimetres (what the sensors send), float32 for anything else."""
+    if (np.issubdtype(measurements.dtype, np.integer) and
+            (not len(measurements) or (measurements.min() >= 0 and measurements.max() <= np.iinfo(np.uint16).max))):
+        return np.uint16
+    return np.float32
+
+def build_pyramid(timestamps, sensors, measurements):
+    """Per-sensor min, max and count of the raw mm readings at every level.
+
+    Returns {frequency: (bucket start ms, sensor, min, max, count)} with rows
+    sorted by sensor, then time. The finest level is built from the samples
+    with one sort; every coarser level is built from the level below it.
+    Minima are kept in raw mm: calibration adds a per-sensor offset and
+    rounds, which never reorders readings, so calibrating a stored minimum
+    gives the minimum of the calibrated readings.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    sensors = np.asarray(sensors).astype(np.uint8)
+    measurements = np.asarray(measurements)
+    measurements = measurements.astype(measurement_dtype(measurements))
+
+    levels = {}
+    keys = timestamps // LEVELS[0][1]
+    order = np.lexsort((keys, sensors))
+    rows = combine(keys[order], sensors[order], measurements[order], measurements[order],
+                   np.ones(len(order), dtype=np.uint32))
+    previous_width = LEVELS[0][1]
+    for frequency, width in LEVELS:
+        keys, level_sensors, minima, maxima, counts = rows
+        if width != previous_width:
+            # Rows stay sorted by sensor then time, so coarser buckets are runs of finer ones
+            rows = combine(keys * previous_width // width, level_sensors, minima, maxima, counts)
+            keys, level_sensors, minima, maxima, counts = rows
+        levels[frequency] = (keys * width, level_sensors, minima, maxima, counts)
+        previous_width = width
+    return levels
+
+class Pyramid:
+    """The min/max/count levels of one capture, memory-mapped from its sidecar.
+
+    Each level's rows are grouped by sensor and sorted by time within a
+    sensor, and the header records where every sensor's rows start, so a
+    time range is found with a binary search per sensor and only the pages
+    holding the rows returned are ever read from disk.
+    """
+    def __init__(self, path, meta, data_offset):
+        self.path = path
+        self.meta = meta
+        self.data_offset = data_offset
+        # Old captures with date-string timestamps carry naive local times instead of UTC epoch ms
+        self.naive = meta['naive']
+        self.start_ms = meta['start_ms']
+        self.end_ms = meta['end_ms']
+
+    def array(self, frequency, name):
+        offset, dtype, length = self.meta['levels'][frequency]['arrays'][name]
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=self.data_offset + offset, shape=(length,))
+
+    def query(self, start_ms=None, end_ms=None, min_points=500, frequency=None):
+        """Buckets overlapping [start_ms, end_ms] at the coarsest level with at least min_points per sensor.
+
+        Returns (frequency, (bucket start ms, sensor, min mm, max mm, count))
+        with rows sorted by sensor, then time.
+        """
+        start_ms = self.start_ms if start_ms is None else start_ms
+        end_ms = self.end_ms if end_ms is None else end_ms
+        frequency = frequency or choose_level(end_ms - start_ms, min_points)
+        level = self.meta['levels'][frequency]
+        width = LEVEL_WIDTHS[frequency]
+        first_key = max((start_ms - level['base']) // width, 0)
+        last_key = min((end_ms - level['base']) // width, np.iinfo(np.uint32).max)
+        times = self.array(frequency, 'time')
+        slices = []
+        for sensor, begin, end in zip(level['sensors'], level['offsets'][:-1], level['offsets'][1:]):
+            if last_key < 0:
+                break
+            sensor_times = times[begin:end]
+            low = begin + int(np.searchsorted(sensor_times, first_key, side='left'))
+            high = begin + int(np.searchsorted(sensor_times, last_key, side='right'))
+            slices.append((sensor, low, high))
+
+        def gather(name):
+            array = self.array(frequency, name)
+            if not slices:
+                return np.empty(0, dtype=array.dtype)
+            return np.concatenate([np.asarray(array[low:high]) for _, low, high in slices])
+        keys = gather('time').astype(np.int64)
+        sensors = np.repeat(np.array([sensor for sensor, _, _ in slices], dtype=np.int64),
+                            [high - low for _, low, high in slices])
+        return frequency, (keys * width + level['base'], sensors, gather('min'), gather('max'), gather('count'))
+
+    def level(self, frequency):
+        """Every bucket of one level, as from query()."""
+        return self.query(-(1 << 62), 1 << 62, frequency=frequency)[1]
+
+def source_fingerprint(capture_path):
+    stat = os.stat(capture_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def write_sidecar(capture_path, levels, naive, timestamps):
+    """Save the levels next to the capture: a JSON header, then the arrays, 8-byte aligned.
+
+    Bucket times are stored as uint32 bucket numbers from a per-level base
+    and sensors as row ranges in the header rather than a column. Written
+    under a temporary name so a reader never sees half a sidecar.
+    """
+    header = dict(source_fingerprint(capture_path), version=PYRAMID_VERSION, naive=naive,
+                  start_ms=int(timestamps.min()) if len(timestamps) else 0,
+                  end_ms=int(timestamps.max()) if len(timestamps) else 0, levels={})
+    blobs = []
+    offset = 0
+    for frequency, (times, sensors, minima, maxima, counts) in levels.items():
+        width = LEVEL_WIDTHS[frequency]
+        base = int(times.min()) // width * width if len(times) else 0
+        sensor_ids, starts = np.unique(sensors, return_index=True)
+        level = {'base': base, 'sensors': sensor_ids.tolist(), 'offsets': starts.tolist() + [len(times)], 'arrays': {}}
+        for name, array in [('time', ((times - base) // width).astype(np.uint32)), ('min', minima),
+                            ('max', maxima), ('count', counts)]:
+            level['arrays'][name] = [offset, array.dtype.str, len(array)]
+            blobs.append(array)
+            offset += array.nbytes
+            padding = -offset % 8
+            blobs.append(np.zeros(padding, dtype=np.uint8))
+            offset += padding
+        header['levels'][frequency] = level
+
+    encoded = json.dumps(header).encode('utf-8')
+    encoded += b' ' * (-(len(SIDECAR_MAGIC) + HEADER_LENGTH.size + len(encoded)) % 8)
+    temporary = sidecar_path(capture_path) + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(SIDECAR_MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded)
+        for blob in blobs:
+            blob.tofile(f)
+    os.replace(temporary, sidecar_path(capture_path))
+
+def read_sidecar(capture_path):
+    """The capture's Pyramid if its sidecar exists and matches the capture, else None."""
+    path = sidecar_path(capture_path)
+    try:
+        with open(path, 'rb') as f:
+            prefix = f.read(len(SIDECAR_MAGIC) + HEADER_LENGTH.size)
+            if not prefix.startswith(SIDECAR_MAGIC):
+                return None
+            length, = HEADER_LENGTH.unpack(prefix[len(SIDECAR_MAGIC):])
+            meta = json.loads(f.read(length).decode('utf-8'))
+    except (OSError, ValueError, struct.error):
+        return None
+    if meta.get('version') != PYRAMID_VERSION or {k: meta.get(k) for k in ('size', 'mtime_ns')} != source_fingerprint(capture_path):
+        return None
+    return Pyramid(path, meta, len(SIDECAR_MAGIC) + HEADER_LENGTH.size + length)
+
+def load_pyramid(capture_path):
+    """The capture's Pyramid, building (and saving) the sidecar first if it is missing or stale."""
+    pyramid = read_sidecar(capture_path)
+    if pyramid is not None:
+        return pyramid
+    timestamps, sensors, measurements, naive = load_capture_arrays(capture_path)
+    write_sidecar(capture_path, build_pyramid(timestamps, sensors, measurements), naive, timestamps)
+    pyramid = read_sidecar(capture_path)
+    if pyramid is None:
+        raise ValueError(f"{sidecar_path(capture_path)} could not be read back")
+    return pyramid
+
+def parse_time(value, pyramid):
+    """Epoch ms from a number of ms, or seconds from the start of the capture with an 's' suffix."""
+    if value is None:
+        return None
+    if value.endswith('s'):
+        return pyramid.start_ms + int(float(value[:-1]) * 1000)
+    return int(value)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the multi-resolution min/max/count sidecars of captures.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Build missing or stale sidecars for a capture or every capture in a directory')
+    build_parser.add_argument('path', help='Capture file or directory')
+    query_parser = subparsers.add_parser('query', help='Per-sensor minima over a time range from the coarsest level with enough points')
+    query_parser.add_argument('path', help='Capture file')
+    query_parser.add_argument('--start', help="Range start, epoch ms or seconds into the capture with an 's' suffix (e.g. 30s)")
+    query_parser.add_argument('--end', help='Range end, in the same form as --start')
+    query_parser.add_argument('--points', type=int, default=500, help='Points per sensor the range needs at least')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        files = capturefile.find_capture_files(args.path) if os.path.isdir(args.path) else [args.path]
+        for file_path in files:
+            start = time.perf_counter()
+            try:
+                load_pyramid(file_path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Failed to process {file_path}: {e}")
+                continue
+            print(f"{sidecar_path(file_path)} ({time.perf_counter() - start:.2f} s)")
+    else:
+        start = time.perf_counter()
+        pyramid = load_pyramid(args.path)
+        frequency, (times, sensors, minima, maxima, counts) = pyramid.query(
+            parse_time(args.start, pyramid), parse_time(args.end, pyramid), args.points)
+        elapsed = time.perf_counter() - start
+        print(f"Level {frequency}: {len(times):,} buckets covering {int(counts.sum()):,} readings ({elapsed * 1000:.1f} ms)")
+        for sensor in np.unique(sensors):
+            rows = sensors == sensor
+            print(f"Sensor {sensor}: min {minima[rows].min()} mm, max {maxima[rows].max()} mm, "
+                  f"{int(counts[rows].sum()):,} readings in {int(rows.sum()):,} buckets")
+
+if __name__ == "__main__":
+    main()
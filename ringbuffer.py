@@ -0,0 +1,104 @@
+import threading
+from collections import deque
+import numpy as np
+
+class RingSnapshot:
+    """A consistent copy of a SensorRingBuffer taken under its lock.
+
+    values[i] and timestamps[i] hold sensor i's buffered samples oldest
+    first. latest, rolling_min and rolling_mean are NaN for sensors that
+    have not reported yet; all_time_min is inf for them.
+    """
+    def __init__(self, values, timestamps, counts, latest, rolling_min, rolling_mean, all_time_min):
+        self.values = values
+        self.timestamps = timestamps
+        self.counts = counts
+        self.latest = latest
+        self.rolling_min = rolling_min
+        self.rolling_mean = rolling_mean
+        self.all_time_min = all_time_min
+
+    def percentile(self, q):
+        """Per-sensor q-th percentile of the buffered samples (NaN for empty sensors)."""
+        return np.array([np.percentile(values, q) if len(values) else np.nan for values in self.values])
+
+class SensorRingBuffer:
+    """Preallocated sensors x samples history with rolling statistics.
+
+    One writer thread appends samples while readers (the Qt timer, the
+    trace view) take snapshots; both sides go through the same lock so a
+    snapshot never mixes two states. Rolling min (monotonic queue), rolling
+    mean (running sum) and all-time min are kept up to date in O(1)
+    amortized time per sample; percentiles are computed from a snapshot.
+    """
+    def __init__(self, num_sensors, capacity):
+        self.num_sensors = num_sensors
+        self.capacity = capacity
+        self.values = np.zeros((num_sensors, capacity), dtype=np.float64)
+        self.timestamps = np.zeros((num_sensors, capacity), dtype=np.int64)
+        # Per-sensor counters stay plain Python lists: they're touched for every sample
+        self.counts = [0] * num_sensors
+        self.sums = [0.0] * num_sensors
+        self.all_time_min = [float('inf')] * num_sensors
+        self.min_queues = [deque() for _ in range(num_sensors)]
+        self.lock = threading.Lock()
+
+    def append(self, sensor_id, value, timestamp=0):
+        with self.lock:
+            self._append(sensor_id, value, timestamp)
+
+    def append_samples(self, samples):
+        """Append (timestamp, sensor_id, value) tuples, ignoring sensors outside the buffer."""
+        with self.lock:
+            for timestamp, sensor_id, value in samples:
+                if 0 <= sensor_id < self.num_sensors:
+                    self._append(sensor_id, value, timestamp)
+
+    def _append(self, sensor_id, value, timestamp):
+        count = self.counts[sensor_id]
+        index = count % self.capacity
+        if count >= self.capacity:
+            self.sums[sensor_id] -= self.values[sensor_id, index]
+        self.values[sensor_id, index] = value
+        self.timestamps[sensor_id, index] = timestamp
+        self.sums[sensor_id] += value
+        self.counts[sensor_id] = count + 1
+
+        # Monotonic queue of (sample number, value): the front is the window minimum
+        queue = self.min_queues[sensor_id]
+        while queue and queue[-1][1] >= value:
+            queue.pop()
+        queue.append((count, value))
+        if queue[0][0] <= count - self.capacity:
+            queue.popleft()
+
+        if value < self.all_time_min[sensor_id]:
+            self.all_time_min[sensor_id] = value
+
+    def snapshot(self):
+        with self.lock:
+            values = self.values.copy()
+            timestamps = self.timestamps.copy()
+            counts = list(self.counts)
+            sums = list(self.sums)
+            rolling_min = np.array([queue[0][1] if queue else np.nan for queue in self.min_queues])
+            all_time_min = np.array(self.all_time_min)
+
+        ordered_values = []
+        ordered_timestamps = []
+        for sensor_id, count in enumerate(counts):
+            # Unroll the ring so samples come out oldest first
+            if count < self.capacity:
+                ordered_values.append(values[sensor_id, :count])
+                ordered_timestamps.append(timestamps[sensor_id, :count])
+            else:
+                split = count % self.capacity
+                ordered_values.append(np.concatenate((values[sensor_id, split:], values[sensor_id, :split])))
+                ordered_timestamps.append(np.concatenate((timestamps[sensor_id, split:], timestamps[sensor_id, :split])))
+
+        lengths = np.array([len(v) for v in ordered_values])
+        latest = np.array([v[-1] if len(v) else np.nan for v in ordered_values])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rolling_mean = np.where(lengths > 0, np.array(sums) / np.maximum(lengths, 1), np.nan)
+        return RingSnapshot(ordered_values, ordered_timestamps, np.array(counts), latest,
+                            rolling_min, rolling_mean, all_time_min)
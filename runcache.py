@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from eventgate import event_settings
+from segments import EventPass, pass_settings
+
+MANIFEST_NAME = '.plot_manifest.json'
+# Bump when process_and_plot changes in a way that makes cached results stale
+MANIFEST_VERSION = 4
+
+def manifest_path(directory):
+    return os.path.join(directory, MANIFEST_NAME)
+
+def load_manifest(directory):
+    """Load the cache manifest for a directory run, or an empty one if it is missing or outdated."""
+    try:
+        with open(manifest_path(directory), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+def save_manifest(directory, entries):
+    # Write to a temporary file first so an interrupted run never leaves a corrupt manifest
+    path = manifest_path(directory)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': entries}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint(path, previous=None):
+    """Size, mtime and content hash of a file.
+
+    The hash is only recomputed when size or mtime differ from the previous
+    entry, so unchanged files cost a single stat call.
+    """
+    stat = os.stat(path)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        sha256 = previous['sha256']
+    else:
+        sha256 = file_hash(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+
+def calibration_snapshot(calibration_map, sensors=None):
+    """The calibration offsets in effect for the given sensors (or the whole map)."""
+    if sensors is None:
+        sensors = calibration_map.keys()
+    return {str(sensor): calibration_map.get(sensor, 0) for sensor in sorted(int(s) for s in sensors)}
+
+def detection_settings(config):
+    """[threshold_mm, padding_seconds, hysteresis_mm, merge_gap_seconds]: the settings that decide where passes are."""
+    return list(event_settings(config)[1:]) + list(pass_settings(config))
+
+def pass_numbers(entry):
+    """(number, total) of every pass a cached entry recorded, to find their PNGs."""
+    passes = (entry or {}).get('passes') or []
+    return [(number, len(passes)) for number in range(1, len(passes) + 1)]
+
+def is_fresh(entry, file_fingerprint, calibration_map, png_paths, detection):
+    """Whether a cached entry still describes the file as it is now and every pass still has its PNG.
+
+    detection is detection_settings() of the current config; passes found
+    with another threshold, padding, hysteresis or merge gap are stale.
+    """
+    if entry is None:
+        return False
+    # mtime alone may change (copy, touch) without the content changing
+    if entry['size'] != file_fingerprint['size'] or entry['sha256'] != file_fingerprint['sha256']:
+        return False
+    # Only the offsets of the sensors present in this file matter
+    sensors = {sensor for event_pass in entry['passes'] for sensor in event_pass['closest_readings']}
+    if entry['calibration'] != calibration_snapshot(calibration_map, sensors or None):
+        return False
+    if entry.get('detection') != list(detection):
+        return False
+    if not all(os.path.exists(png_path) for png_path in png_paths):
+        return False
+    return True
+
+def make_entry(file_fingerprint, calibration_map, passes, detection):
+    entry = dict(file_fingerprint)
+    entry['detection'] = list(detection)
+    # Only the offsets of the sensors in the passes matter; with no pass at all,
+    # any calibration change could move a reading below the threshold
+    sensors = {sensor for event_pass in passes for sensor in event_pass.closest_readings.index}
+    entry['calibration'] = calibration_snapshot(calibration_map, sensors or None)
+    entry['passes'] = [{
+        'start': pd.Timestamp(event_pass.start).isoformat(),
+        'end': pd.Timestamp(event_pass.end).isoformat(),
+        'samples': int(event_pass.samples),
+        'closest_readings': {str(sensor): float(value) for sensor, value in event_pass.closest_readings.items()},
+        'closest_times': {str(sensor): pd.Timestamp(value).isoformat() for sensor, value in event_pass.closest_times.items()},
+    } for event_pass in passes]
+    return entry
+
+def cached_results(entry):
+    """Rebuild the EventPasses process_and_plot returned for this entry."""
+    passes = []
+    for number, event_pass in enumerate(entry['passes'], 1):
+        closest_readings = pd.Series({int(sensor): value for sensor, value in event_pass['closest_readings'].items()}, name='Measurement')
+        closest_times = pd.Series({int(sensor): pd.Timestamp(value) for sensor, value in event_pass['closest_times'].items()}, name='Timestamp (PST)')
+        closest_readings.index.name = 'Sensor Number'
+        closest_times.index.name = 'Sensor Number'
+        passes.append(EventPass(number, pd.Timestamp(event_pass['start']), pd.Timestamp(event_pass['end']),
+                                event_pass['samples'], closest_readings, closest_times))
+    return passes
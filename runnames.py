@@ -0,0 +1,66 @@
+import os
+import re
+from datetime import datetime
+from capturefile import capture_stem
+
+# Filename layouts offered in the GUI, label -> pattern.
+# Placeholders: {DATE} (DATE_FORMAT, Pacific time), {BC} (building code + radio letter), {TUG}, {STEP}
+FILENAME_FORMATS = {
+    "Tug_Date_BC_Step":      "{TUG}_{DATE}_{BC}_{STEP}.csv",
+    "BC_Tug_Step":           "{BC}_{TUG}_{STEP}.csv",
+    "Date_BC_Tug_Step":      "{DATE}_{BC}_{TUG}_{STEP}.csv",
+    "Date_Tug_BC_Step":      "{DATE}_{TUG}_{BC}_{STEP}.csv",
+    "BC_Date_Tug_Step":      "{BC}_{DATE}_{TUG}_{STEP}.csv",
+    "Tug_BC_Date_Step":      "{TUG}_{BC}_{DATE}_{STEP}.csv",
+}
+DATE_FORMAT = "%Y%m%d_%H%M%S"
+# Radio buttons next to the building code in the GUI
+RADIO_OPTIONS = ["A", "B", "C", "D"]
+
+FIELD_PATTERNS = {
+    'DATE': r'(?P<date>\d{8}_\d{6})',
+    'BC': r'(?P<building>[^_]+?)(?P<radio>[' + ''.join(RADIO_OPTIONS) + r']?)',
+    'TUG': r'(?P<tug>[^_]+)',
+    'STEP': r'(?P<step>.+)',
+}
+
+def layout_pattern(pattern):
+    """Regular expression matching a filename layout (without its extension)."""
+    stem = os.path.splitext(pattern)[0]
+    parts = re.split(r'(\{[A-Z]+\})', stem)
+    return re.compile(''.join(FIELD_PATTERNS[part[1:-1]] if part.startswith('{') else re.escape(part) for part in parts))
+
+LAYOUT_PATTERNS = {label: layout_pattern(pattern) for label, pattern in FILENAME_FORMATS.items()}
+
+def parse_run_name(path, building_codes=(), tugs=(), steps=()):
+    """Split a capture filename into its layout, date, building, radio, tug and step.
+
+    Several layouts can match the same name (a tug and a building code are
+    both just words), so each match is scored by how many of its building,
+    tug and step values appear in the config.yaml lists and the best one
+    wins; ties go to the first layout in FILENAME_FORMATS. Returns a dict,
+    or None if no layout matches.
+    """
+    stem = capture_stem(path)
+    best = None
+    best_score = -1
+    for label, regex in LAYOUT_PATTERNS.items():
+        match = regex.fullmatch(stem)
+        if match is None:
+            continue
+        fields = match.groupdict()
+        if fields['building'] not in building_codes and fields['radio'] and fields['building'] + fields['radio'] in building_codes:
+            # A building code that itself ends in a radio letter
+            fields['building'] += fields['radio']
+            fields['radio'] = ''
+        score = (fields['building'] in building_codes) + (fields['tug'] in tugs) + (fields['step'] in steps)
+        if score > best_score:
+            best, best_score = dict(fields, layout=label), score
+
+    if best is not None:
+        date = best.get('date')
+        try:
+            best['date'] = datetime.strptime(date, DATE_FORMAT) if date else None
+        except ValueError:
+            best['date'] = None
+    return best
@@ -0,0 +1,45 @@
+from collections import namedtuple
+import numpy as np
+
+# Defaults for the pass settings in the event_detection section of config.yaml
+DEFAULT_HYSTERESIS_MM = 25
+DEFAULT_MERGE_GAP_SECONDS = 5.0
+
+# One pass by a door: its number in the capture (from 1), the first and last low reading,
+# the samples in its padded window and the closest reading of every sensor in it
+EventPass = namedtuple('EventPass', ['number', 'start', 'end', 'samples', 'closest_readings', 'closest_times'])
+
+def pass_settings(config):
+    """(hysteresis_mm, merge_gap_seconds) from the event_detection section of config.yaml."""
+    settings = config.get('event_detection') or {}
+    return (settings.get('hysteresis_mm', DEFAULT_HYSTERESIS_MM),
+            settings.get('merge_gap_seconds', DEFAULT_MERGE_GAP_SECONDS))
+
+def find_passes(timestamps, readings, enter_below, exit_below, merge_gap):
+    """(starts, ends) timestamps of every separate pass below the threshold, in time order.
+
+    A pass opens at a reading below enter_below and is kept open by
+    readings below exit_below (the threshold plus the hysteresis), from any
+    sensor; it ends at the last of those once merge_gap goes by without
+    another. Readings between the two thresholds never open a pass on their
+    own, so a sensor hovering at the threshold doesn't split or start one.
+    timestamps must be in time order; merge_gap is in their units (e.g. ms,
+    or a numpy timedelta64 for datetime64 timestamps).
+
+    Linear time: one comparison over the readings, then only the low
+    readings are looked at again.
+    """
+    timestamps = np.asarray(timestamps)
+    readings = np.asarray(readings)
+    low = np.flatnonzero(readings < exit_below)
+    times = timestamps[low]
+    entering = np.flatnonzero(readings[low] < enter_below)
+    if not len(entering):
+        return times[:0], times[:0]
+    # Runs of low readings, split wherever two are more than merge_gap apart
+    run_starts = np.flatnonzero(np.concatenate([[True], np.diff(times) > merge_gap]))
+    run_ends = np.append(run_starts[1:], len(low)) - 1
+    # Only runs that go below enter_below are passes, and they start at the first reading that does
+    runs = np.searchsorted(run_starts, entering, side='right') - 1
+    first = np.flatnonzero(np.diff(runs, prepend=-1))
+    return times[entering[first]], times[run_ends[runs[first]]]
@@ -0,0 +1,212 @@
+import binascii
+import struct
+from collections import Counter
+from captureclock import DeviceClockMapper, default_clock
+
+# Binary frames sent by firmware built with BINARY_FRAMES (see Sensors::sendFrame), little-endian:
+#   sync 0xA5 0x5A | sequence uint16 | millis() uint32 | online mask uint8 |
+#   8 x distance uint16 (NO_READING when a channel has nothing) | CRC-16/CCITT-FALSE uint16
+# The CRC covers everything between the sync word and the CRC itself.
+SYNC = b'\xa5\x5a'
+FRAME_CHANNELS = 8  # Sensors::numSensors in the firmware
+FRAME_STRUCT = struct.Struct(f'<2sHIB{FRAME_CHANNELS}HH')
+FRAME_SIZE = FRAME_STRUCT.size
+NO_READING = 0xFFFF
+SEQUENCE_MODULO = 1 << 16
+
+def frame_crc(payload):
+    return binascii.crc_hqx(payload, 0xFFFF)
+
+def encode_frame(sequence, millis, online_mask, distances):
+    """Build one frame; distances holds one mm value (or None) per channel."""
+    values = [NO_READING if distance is None else distance for distance in distances]
+    body = FRAME_STRUCT.pack(SYNC, sequence % SEQUENCE_MODULO, millis % (1 << 32), online_mask, *values, 0)[:-2]
+    return body + struct.pack('<H', frame_crc(body[len(SYNC):]))
+
+class FrameDecoder:
+    """Incremental decoder for the binary frame stream.
+
+    feed() takes bytes in whatever pieces they arrive and returns the frames
+    completed so far as (sequence, millis, online_mask, distances) tuples.
+    The decoder looks for the sync word and only accepts a frame whose CRC
+    matches; after corrupted or stray bytes (e.g. text the firmware prints at
+    startup) it resumes at the next sync word. Frames missing from the
+    sequence counter are counted in lost_frames, and online channels that
+    had no reading in null_readings.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.skipped_bytes = 0
+        self.lost_frames = 0
+        self.last_sequence = None
+        self.null_readings = Counter()
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        position = 0
+        end = len(buffer)
+        unpack_from = FRAME_STRUCT.unpack_from
+        while True:
+            start = buffer.find(SYNC, position)
+            if start < 0:
+                # Keep a last byte that may be the first half of a sync word
+                keep_from = max(position, end - 1)
+                self.skipped_bytes += keep_from - position
+                position = keep_from
+                break
+            self.skipped_bytes += start - position
+            position = start
+            if end - start < FRAME_SIZE:
+                break
+            fields = unpack_from(buffer, start)
+            if frame_crc(buffer[start + len(SYNC):start + FRAME_SIZE - 2]) != fields[-1]:
+                # Not a frame after all, or a damaged one: look for the next sync word
+                self.crc_errors += 1
+                self.skipped_bytes += 1
+                position = start + 1
+                continue
+
+            sequence = fields[1]
+            if self.last_sequence is not None:
+                self.lost_frames += (sequence - self.last_sequence - 1) % SEQUENCE_MODULO
+            self.last_sequence = sequence
+            frames.append((sequence, fields[2], fields[3], fields[4:-1]))
+            position = start + FRAME_SIZE
+        del buffer[:position]
+        self.frames += len(frames)
+        return frames
+
+    def samples(self, frames, to_timestamp):
+        """(timestamp_ms, sensor_id, mm) for every online channel with a reading."""
+        samples = []
+        for sequence, millis, online_mask, distances in frames:
+            timestamp = to_timestamp(millis)
+            for sensor_id, distance in enumerate(distances):
+                if online_mask >> sensor_id & 1:
+                    if distance != NO_READING:
+                        samples.append((timestamp, sensor_id, distance))
+                    else:
+                        self.null_readings[sensor_id] += 1
+        return samples
+
+class FrameReader:
+    """Reads the binary frame protocol with the same interface as serialreader.SerialLineReader.
+
+    Every frame carries the board's millis(), so samples are stamped through
+    a DeviceClockMapper unless use_device_clock is False.
+    """
+    def __init__(self, ser, chunk_size=4096, clock=None, use_device_clock=True):
+        self.ser = ser
+        self.chunk_size = chunk_size
+        self.clock = clock or default_clock
+        self.device_clock = DeviceClockMapper() if use_device_clock else None
+        self.decoder = FrameDecoder()
+        self.bytes_read = 0
+
+    @property
+    def lines_read(self):
+        return self.decoder.frames
+
+    @property
+    def lost_frames(self):
+        return self.decoder.lost_frames
+
+    @property
+    def parse_failures(self):
+        """Frames rejected by the CRC check."""
+        return self.decoder.crc_errors
+
+    @property
+    def null_readings(self):
+        return self.decoder.null_readings
+
+    def read_samples(self):
+        waiting = self.ser.in_waiting
+        data = self.ser.read(min(waiting, self.chunk_size) if waiting else 1)
+        if not data:
+            return []
+        if not waiting:
+            # Woke up on the first byte of a new burst; take the rest of it too
+            waiting = self.ser.in_waiting
+            if waiting:
+                data += self.ser.read(min(waiting, self.chunk_size))
+        self.bytes_read += len(data)
+        frames = self.decoder.feed(data)
+        if not frames:
+            return []
+
+        arrival_ms = self.clock.now_ms()
+        if self.device_clock is None:
+            return self.decoder.samples(frames, lambda millis: arrival_ms)
+        to_host = self.device_clock.timestamp
+        return self.decoder.samples(frames, lambda millis: to_host(millis, arrival_ms))
+
+    def flush(self):
+        """A partial frame at the end of a capture is discarded."""
+        self.decoder.buffer.clear()
+        return []
+
+def decode_stream(stream, piece_size=None):
+    """Decode a whole byte stream with a fresh FrameDecoder, fed piece_size bytes at a time (all at once by default)."""
+    decoder = FrameDecoder()
+    piece_size = piece_size or max(len(stream), 1)
+    frames = []
+    for offset in range(0, len(stream), piece_size):
+        frames += decoder.feed(bytes(stream[offset:offset + piece_size]))
+    return decoder, frames
+
+def check_decoder():
+    """Assert FrameDecoder's behaviour on synthetic byte streams; raises AssertionError on the first failure.
+
+    Covers resyncing after stray bytes and a false sync word, CRC
+    mismatches, sequence numbers wrapping around and the lost frame count
+    for dropped and damaged frames, each fed whole and one byte at a time.
+    """
+    distances = [100, 200, 300, None, 500, 600, 700, 800]
+
+    def frame(sequence):
+        return encode_frame(sequence, sequence * 125, 0xFF, distances)
+
+    def damaged(sequence):
+        data = bytearray(frame(sequence))
+        data[len(SYNC) + 8] ^= 0x10  # A bit of the first distance
+        return bytes(data)
+
+    for piece_size in (None, 1):
+        # Startup text, a stray sync byte, and a false sync word running into a real frame
+        garbage = [b'Online sensors: 8\r\n\xa5', b'\x00' + SYNC + b'\x01']
+        decoder, frames = decode_stream(garbage[0] + frame(0) + garbage[1] + frame(1), piece_size)
+        assert [sequence for sequence, _, _, _ in frames] == [0, 1], frames
+        assert frames[0][3] == tuple(NO_READING if d is None else d for d in distances)
+        assert decoder.lost_frames == 0 and decoder.skipped_bytes == sum(map(len, garbage)), vars(decoder)
+        assert decoder.crc_errors == 1 and not decoder.buffer
+
+        # A frame whose CRC doesn't match is rejected, counted and shows up as lost
+        decoder, frames = decode_stream(frame(0) + damaged(1) + frame(2), piece_size)
+        assert [sequence for sequence, _, _, _ in frames] == [0, 2], frames
+        assert decoder.crc_errors == 1 and decoder.lost_frames == 1 and decoder.skipped_bytes == FRAME_SIZE
+
+        # The 16-bit sequence counter wraps around without counting lost frames, and gaps across the wrap still count
+        decoder, frames = decode_stream(b''.join(frame(sequence) for sequence in (65534, 65535, 0, 1)), piece_size)
+        assert [sequence for sequence, _, _, _ in frames] == [65534, 65535, 0, 1] and decoder.lost_frames == 0
+        decoder, _ = decode_stream(frame(65535) + frame(1), piece_size)
+        assert decoder.lost_frames == 1
+
+        # Dropped frames never arrive and damaged ones fail the CRC; both are lost frames, only damaged ones CRC errors
+        dropped, corrupted = {3, 6}, {5}
+        stream = b''.join(damaged(sequence) if sequence in corrupted else frame(sequence)
+                          for sequence in range(10) if sequence not in dropped)
+        decoder, frames = decode_stream(stream, piece_size)
+        assert decoder.frames == len(frames) == 10 - len(dropped) - len(corrupted)
+        assert decoder.lost_frames == len(dropped) + len(corrupted) and decoder.crc_errors == len(corrupted)
+
+def main():
+    check_decoder()
+    print("FrameDecoder checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import re
+from collections import Counter
+from captureclock import DeviceClockMapper, default_clock
+
+# Matches one "D<n> (mm): <value>" pair in a Sensors::logReadings line; "null" readings don't match
+PAIR_PATTERN = re.compile(rb'D(\d)\s*\(mm\):\s*(\d+)')
+# Firmware built with LOG_MILLIS starts each line with "T (ms): <millis()>"
+MILLIS_FIELD = b'T (ms):'
+MILLIS_PAIR_PATTERN = re.compile(rb'T \(ms\):\s*(\d+)|D(\d)\s*\(mm\):\s*(\d+)')
+# A sensor that had nothing to report this interval
+NULL_PATTERN = re.compile(rb'D(\d)\s*\(mm\):\s*null')
+READING_FIELD = b'(mm):'
+
+def parse_line(line):
+    """Parse one logReadings line (bytes or str) into a list of (sensor_id, mm) pairs."""
+    if isinstance(line, str):
+        line = line.encode('utf-8', errors='ignore')
+    return [(int(sensor_id), int(value)) for sensor_id, value in PAIR_PATTERN.findall(line)]
+
+class SerialLineReader:
+    """Bulk reader for the Arduino's line protocol.
+
+    Instead of one readline() per line, each read() call pulls everything the
+    port has buffered into a bytearray and complete lines are parsed in place
+    with the compiled byte pattern (no per-line slicing or decoding). When the
+    port is idle read() blocks in the driver for up to the port timeout, so no
+    CPU is spent polling.
+
+    Timestamps come from a CaptureClock (default_clock unless given). Lines
+    that carry the board's millis() are stamped through a DeviceClockMapper
+    unless use_device_clock is False.
+
+    null_readings counts "null" readings per sensor and parse_failures the
+    reading fields that were neither a number nor null (line noise, a
+    garbled or truncated line).
+    """
+    def __init__(self, ser, chunk_size=4096, max_line_length=65536, clock=None, use_device_clock=True):
+        self.ser = ser
+        self.chunk_size = chunk_size
+        self.max_line_length = max_line_length
+        self.clock = clock or default_clock
+        self.device_clock = DeviceClockMapper() if use_device_clock else None
+        self.buffer = bytearray()
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.null_readings = Counter()
+        self.parse_failures = 0
+
+    def fill(self):
+        """Read whatever is waiting (at least one byte, or until the port timeout)."""
+        waiting = self.ser.in_waiting
+        data = self.ser.read(min(waiting, self.chunk_size) if waiting else 1)
+        if data and not waiting:
+            # Woke up on the first byte of a new burst; take the rest of it too
+            waiting = self.ser.in_waiting
+            if waiting:
+                data += self.ser.read(min(waiting, self.chunk_size))
+        if data:
+            self.buffer += data
+            self.bytes_read += len(data)
+        return len(data)
+
+    def complete_lines_end(self):
+        """Fill the buffer and return the index just past the last complete line (0 if there is none)."""
+        self.fill()
+        buffer = self.buffer
+        end = buffer.rfind(b'\n') + 1
+        if not end and len(buffer) > self.max_line_length:
+            # Not our protocol (wrong baud rate, binary noise); don't grow forever
+            buffer.clear()
+        return end
+
+    def read_lines(self):
+        """Read from the port and return the parsed complete lines.
+
+        Returns a list with one list of (sensor_id, mm) pairs per complete
+        line; lines without any readings (debug output, all-null lines)
+        yield an empty list so callers can still count them.
+        """
+        end = self.complete_lines_end()
+        if not end:
+            return []
+
+        buffer = self.buffer
+        findall = PAIR_PATTERN.findall
+        lines = []
+        start = 0
+        while start < end:
+            newline = buffer.find(b'\n', start, end) + 1
+            lines.append([(int(sensor_id), int(value)) for sensor_id, value in findall(buffer, start, newline)])
+            start = newline
+        del buffer[:end]
+        self.lines_read += len(lines)
+        return lines
+
+    def read_samples(self):
+        """Read from the port and return (timestamp_ms, sensor_id, mm) tuples.
+
+        Every line in a read gets the host time of that read, so all complete
+        lines are parsed with a single pass of the pattern over the buffer.
+        Lines with the board's millis() get their own drift-corrected time.
+        """
+        end = self.complete_lines_end()
+        if not end:
+            return []
+
+        timestamp = self.clock.now_ms()
+        buffer = self.buffer
+        if self.device_clock is not None and buffer.find(MILLIS_FIELD, 0, end) >= 0:
+            samples = self.device_samples(timestamp, end)
+        else:
+            samples = [(timestamp, int(sensor_id), int(value)) for sensor_id, value in PAIR_PATTERN.findall(buffer, 0, end)]
+        self.lines_read += buffer.count(b'\n', 0, end)
+        self.count_unread_fields(end, len(samples))
+        del buffer[:end]
+        return samples
+
+    def count_unread_fields(self, end, parsed):
+        """Update null_readings and parse_failures for buffer[:end], which yielded parsed readings."""
+        buffer = self.buffer
+        fields = buffer.count(READING_FIELD, 0, end)
+        if fields == parsed:
+            return
+        nulls = 0
+        if buffer.find(b'null', 0, end) >= 0:
+            for sensor_id in NULL_PATTERN.findall(buffer, 0, end):
+                self.null_readings[int(sensor_id)] += 1
+                nulls += 1
+        self.parse_failures += max(fields - parsed - nulls, 0)
+
+    def device_samples(self, arrival_ms, end):
+        """Parse buffer[:end] stamping each line's readings from its millis() field."""
+        samples = []
+        timestamp = arrival_ms
+        to_host = self.device_clock.timestamp
+        for millis, sensor_id, value in MILLIS_PAIR_PATTERN.findall(self.buffer, 0, end):
+            if millis:
+                timestamp = to_host(int(millis), arrival_ms)
+            else:
+                samples.append((timestamp, int(sensor_id), int(value)))
+        return samples
+
+    def flush(self):
+        """Samples still held by the reader when capture stops; a partial line is discarded."""
+        self.buffer.clear()
+        return []
@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+import numpy as np
+from serialframes import encode_frame
+
+NUM_SENSORS = 8  # Sensors::numSensors in the firmware
+
+def format_line(values, millis=None):
+    """Format one reading the way Sensors::logReadings and Logger::mainOutput send it.
+
+    values holds one entry per sensor channel; None is sent as "null". With
+    millis the line starts with the board time, like firmware built with LOG_MILLIS.
+    """
+    fields = " ".join(f"D{i} (mm): {'null' if value is None else value}" for i, value in enumerate(values))
+    if millis is not None:
+        fields = f"T (ms): {millis} {fields}"
+    return f"[MAIN] {fields}\r\n".encode('ascii')
+
+def replay_capture(path, num_sensors=NUM_SENSORS):
+    """Yield (seconds since start, values) for every logged line of an existing capture.
+
+    Rows that share a timestamp came from the same serial line; channels
+    missing from a line are replayed as null.
+    """
+    import capturefile
+
+    df = capturefile.read_capture(path)
+    timestamps = df['Timestamp (PST)'].to_numpy()
+    if not np.issubdtype(timestamps.dtype, np.number):
+        timestamps = (np.asarray(df['Timestamp (PST)'].astype('datetime64[ns]')).astype(np.int64) // 1_000_000)
+    sensors = df['Sensor Number'].to_numpy()
+    measurements = df['Measurement'].to_numpy()
+    if len(timestamps) == 0:
+        return
+
+    # Split the rows wherever the timestamp changes
+    boundaries = np.flatnonzero(np.diff(timestamps)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(timestamps)]))
+    first = timestamps[0]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        values = [None] * num_sensors
+        for sensor_id, measurement in zip(sensors[start:end].tolist(), measurements[start:end].tolist()):
+            if 0 <= sensor_id < num_sensors:
+                values[sensor_id] = int(measurement)
+        yield (timestamps[start] - first) / 1000, values
+
+def synthetic_passes(rate=8, num_sensors=NUM_SENSORS, pass_period=20, pass_width=2,
+                     far_mm=1500, closest_mm=150, noise_mm=5, null_probability=0.0,
+                     duration=None, seed=0):
+    """Yield (seconds since start, values) for a tug repeatedly approaching and leaving a door.
+
+    Each pass_period seconds the distance on every channel dips from far_mm
+    to about closest_mm and back with a Gaussian profile pass_width seconds
+    wide. Channels are spread by 20 mm so they are told apart in plots.
+    """
+    rng = np.random.default_rng(seed)
+    interval = 1 / rate
+    offsets = np.arange(num_sensors) * 20
+    index = 0
+    while duration is None or index * interval < duration:
+        t = index * interval
+        phase = (t % pass_period) - pass_period / 2
+        distance = far_mm - (far_mm - closest_mm) * math.exp(-(phase / pass_width) ** 2)
+        readings = distance + offsets + rng.normal(0, noise_mm, num_sensors)
+        nulls = rng.random(num_sensors) < null_probability
+        values = [None if is_null else max(0, int(value)) for value, is_null in zip(readings.tolist(), nulls.tolist())]
+        yield t, values
+        index += 1
+
+class SimulatedSerial:
+    """Stand-in for serial.Serial that plays back (seconds, values) lines from a source.
+
+    Lines become readable when their time comes up (divided by speed). Like a
+    real UART the receive buffer is bounded: lines that arrive while it is
+    full are dropped and counted in dropped_lines, which makes it possible
+    to measure how fast a reader has to be. speed=None releases lines as
+    fast as the reader takes them, without drops. send_millis adds the line
+    time in ms, as firmware built with LOG_MILLIS does; binary sends binary
+    frames instead of text lines, as firmware built with BINARY_FRAMES does.
+    """
+    def __init__(self, source, speed=1.0, timeout=1, buffer_size=4096, port='simulated', send_millis=False, binary=False):
+        self.source = iter(source)
+        self.send_millis = send_millis
+        self.binary = binary
+        self.speed = speed
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self.port = port
+        self.is_open = True
+        self.buffer = bytearray()
+        self.lines_sent = 0
+        self.dropped_lines = 0
+        self.exhausted = False
+        self.pending = None
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def due_time(self, seconds):
+        return self.start + seconds / self.speed
+
+    def pump(self):
+        """Move every line that is due into the receive buffer."""
+        now = time.perf_counter()
+        while not self.exhausted:
+            if self.pending is None:
+                try:
+                    self.pending = next(self.source)
+                except StopIteration:
+                    self.exhausted = True
+                    break
+            seconds, values = self.pending
+            if self.binary:
+                # Dropped frames still use up a sequence number, so the reader can count them
+                line = encode_frame(self.lines_sent + self.dropped_lines, int(seconds * 1000), 0xFF, values)
+            else:
+                line = format_line(values, int(seconds * 1000) if self.send_millis else None)
+            if self.speed is None:
+                if len(self.buffer) + len(line) > self.buffer_size:
+                    break
+            elif self.due_time(seconds) > now:
+                break
+            elif len(self.buffer) + len(line) > self.buffer_size:
+                self.dropped_lines += 1
+                self.pending = None
+                continue
+            self.buffer += line
+            self.lines_sent += 1
+            self.pending = None
+
+    def next_due(self):
+        if self.pending is None or self.speed is None:
+            return time.perf_counter()
+        return self.due_time(self.pending[0])
+
+    @property
+    def in_waiting(self):
+        with self.lock:
+            self.pump()
+            return len(self.buffer)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            with self.lock:
+                self.pump()
+                if self.buffer:
+                    data = bytes(self.buffer[:size])
+                    del self.buffer[:size]
+                    return data
+                wake = None if self.exhausted else self.next_due()
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                return b''
+            # Sleep until the next line is due or the timeout, like a blocking read on an idle port
+            if wake is None:
+                wake = deadline if deadline is not None else now + 1
+            elif deadline is not None:
+                wake = min(wake, deadline)
+            time.sleep(max(0, wake - now))
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b'\n'):
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+        return bytes(line)
+
+    def reset_input_buffer(self):
+        with self.lock:
+            self.buffer.clear()
+
+    def close(self):
+        self.is_open = False
+
+def add_simulation_arguments(parser):
+    """Add the --simulate options shared by gather.py and gui.py to an argparse parser."""
+    parser.add_argument('--simulate', metavar='SOURCE', action='append',
+                        help="Read from a simulated Arduino instead of the serial port: 'synthetic' or a capture file to replay "
+                             "(repeat to simulate several boards)")
+    parser.add_argument('--rate', type=float, default=8, help='Line rate in Hz for --simulate synthetic')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed factor for --simulate (0 = as fast as the reader keeps up)')
+    parser.add_argument('--send-millis', action='store_true', help="Start simulated lines with the board's millis(), like firmware built with LOG_MILLIS")
+    parser.add_argument('--binary', action='store_true', help='Send binary frames from the simulated board, like firmware built with BINARY_FRAMES')
+
+def open_simulated_ports(args, timeout=1):
+    """Build the SimulatedSerial ports requested on the command line (an empty list without --simulate)."""
+    ports = []
+    for index, spec in enumerate(args.simulate or []):
+        if spec == 'synthetic':
+            source = synthetic_passes(rate=args.rate, seed=index)
+        else:
+            source = replay_capture(spec)
+        ports.append(SimulatedSerial(source, speed=args.speed or None, timeout=timeout, port=f'simulated{index}',
+                                     send_millis=args.send_millis, binary=args.binary))
+    return ports
@@ -0,0 +1,392 @@
+import argparse
+import csv
+import os
+import queue
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import yaml
+from calibration import apply_calibration, mm_to_inches
+from eventgate import event_settings
+from segments import find_passes, pass_settings
+import capturefile
+
+# Defaults for the watch section of config.yaml
+DEFAULT_QUIET_SECONDS = 60
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_JOBS = 2
+SUMMARY_NAME = 'lowest_readings.csv'
+
+def load_config(config_file='config.yaml'):
+    with open(config_file, 'r') as f:
+        return yaml.safe_load(f)
+
+def watch_settings(config):
+    """(quiet_seconds, poll_interval, jobs) from the watch section of config.yaml."""
+    settings = config.get('watch') or {}
+    return (settings.get('quiet_seconds', DEFAULT_QUIET_SECONDS),
+            settings.get('poll_interval', DEFAULT_POLL_INTERVAL),
+            settings.get('jobs', DEFAULT_JOBS))
+
+def empty_rows():
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+class CaptureTail:
+    """Reads the rows appended to a capture (CSV or binary) since the last read.
+
+    Only whole lines or records are returned; one still being written is
+    kept for the next read. Compressed CSVs are decompressed as they grow.
+    CSVs with date string timestamps raise ValueError, like
+    capturefile.read_capture_arrays.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.binary = capturefile.is_binary_capture(path)
+        compression = capturefile.compression_of(path)
+        self.decompressor = capturefile.StreamDecompressor(compression) if compression else None
+        self.offset = 0
+        self.pending = b''
+        self.columns = None  # CSV positions of the timestamp, sensor and measurement columns
+
+    def read(self):
+        """(timestamps, sensors, measurements) of the rows written since the last call."""
+        if self.binary and self.offset == 0:
+            if os.path.getsize(self.path) < capturefile.HEADER_STRUCT.size:
+                return empty_rows()
+            _, _, self.offset = capturefile.read_binary_header(self.path)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        if self.decompressor is not None:
+            data = self.decompressor.decompress(data)
+        data = self.pending + data
+
+        if self.binary:
+            usable = len(data) // capturefile.RECORD_DTYPE.itemsize * capturefile.RECORD_DTYPE.itemsize
+            records = np.frombuffer(data[:usable], dtype=capturefile.RECORD_DTYPE)
+            self.pending = data[usable:]
+            return (records['timestamp'].astype(np.int64), records['sensor'].astype(np.int64),
+                    records['measurement'].astype(np.int64))
+
+        end = data.rfind(b'\n') + 1
+        lines, self.pending = data[:end].decode('utf-8').splitlines(), data[end:]
+        if self.columns is None and lines:
+            header = next(csv.reader(lines[:1]))
+            missing = [column for column in capturefile.CSV_HEADER if column not in header]
+            if missing:
+                raise KeyError(f"CSV file {self.path} is missing columns: {missing}")
+            self.columns = [header.index(column) for column in capturefile.CSV_HEADER]
+            lines = lines[1:]
+        lines = [line for line in lines if line]
+        if not lines:
+            return empty_rows()
+        data = np.loadtxt(lines, delimiter=',', dtype=np.int64, usecols=self.columns, ndmin=2)
+        return data[:, 0], data[:, 1], data[:, 2]
+
+class PassTracker:
+    """segments.find_passes for a capture that is still being written.
+
+    Rows are added as they are read and every pass is handed back once it
+    is over, with the raw rows of its padded window. Only the rows that can
+    still belong to a pass are kept: from the padding before the open pass,
+    or the last padding and merge gap when there is none, so memory stays
+    flat however long the capture runs.
+    """
+    def __init__(self, config):
+        _, threshold_mm, padding_seconds = event_settings(config)
+        hysteresis_mm, merge_gap_seconds = pass_settings(config)
+        self.calibration_map = config.get('calibration_map')
+        self.enter_below = mm_to_inches(threshold_mm)
+        self.exit_below = mm_to_inches(threshold_mm + hysteresis_mm)
+        self.padding_ms = int(padding_seconds * 1000)
+        self.merge_gap_ms = int(merge_gap_seconds * 1000)
+        self.timestamps, self.sensors, self.measurements = empty_rows()
+        self.inches = np.empty(0)
+        self.done_until = None  # Last low reading of the last pass handed back
+        self.passes = 0
+
+    def add(self, timestamps, sensors, measurements):
+        if not len(timestamps):
+            return
+        inches = mm_to_inches(apply_calibration(measurements, sensors, self.calibration_map))
+        self.timestamps = np.concatenate([self.timestamps, timestamps])
+        self.sensors = np.concatenate([self.sensors, sensors])
+        self.measurements = np.concatenate([self.measurements, measurements])
+        self.inches = np.concatenate([self.inches, inches])
+
+    def take_passes(self, final=False):
+        """Passes that are over, as (number, start_ms, end_ms, timestamps, sensors, measurements).
+
+        A pass is over once the readings have gone on for the merge gap and
+        the padding past its last low reading. final hands back the open
+        pass too, for a capture that has closed or gone quiet.
+        """
+        if not len(self.timestamps):
+            return []
+        times = self.timestamps
+        rows = slice(None) if self.done_until is None else slice(np.searchsorted(times, self.done_until, side='right'), None)
+        starts, ends = find_passes(times[rows], self.inches[rows], self.enter_below, self.exit_below, self.merge_gap_ms)
+        over = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if not final and times[-1] <= end + max(self.merge_gap_ms, self.padding_ms):
+                break
+            low = np.searchsorted(times, start - self.padding_ms, side='left')
+            high = np.searchsorted(times, end + self.padding_ms, side='right')
+            self.passes += 1
+            over.append((self.passes, start, end, times[low:high], self.sensors[low:high], self.measurements[low:high]))
+            self.done_until = end
+
+        if len(starts) > len(over):
+            keep_from = starts[len(over)] - self.padding_ms
+        else:
+            keep_from = times[-1] - max(self.merge_gap_ms, self.padding_ms)
+        first = np.searchsorted(times, keep_from, side='left')
+        if first:
+            self.timestamps, self.sensors = self.timestamps[first:], self.sensors[first:]
+            self.measurements, self.inches = self.measurements[first:], self.inches[first:]
+        return over
+
+class WatchedCapture:
+    """A capture being written: its tail, pass tracker and when it last grew."""
+    def __init__(self, path, config):
+        self.path = path
+        self.tail = CaptureTail(path)
+        self.tracker = PassTracker(config)
+        self.size = 0
+        self.changed_at = time.monotonic()
+        self.settled = False  # Passes handed back since it last grew
+        self.whole_file = False  # Can't be tailed (e.g. date string timestamps); plot it whole once closed
+
+def init_worker():
+    import plot  # Loads config.yaml and the plotting stack, so only in the worker processes
+    plot.init_worker()
+
+def plot_pass_rows(capture_path, number, start_ms, end_ms, timestamps, sensors, measurements):
+    """Worker: plot one pass of a capture to <capture>_pass<n>_trimmed.png and return its lowest_readings.csv row."""
+    import pandas as pd
+    import plot
+    from captureclock import to_display_time
+    from segments import EventPass
+    df = plot.prepare_capture(pd.DataFrame({'Timestamp (PST)': timestamps, 'Sensor Number': sensors,
+                                            'Measurement': measurements}), capture_path)
+    plot.plot_pass(df, plot.pass_png_path(capture_path, number, None))
+    per_sensor, _ = plot.find_extremes(df, count=1)
+    closest_readings, closest_times = plot.closest_series(per_sensor)
+    start, end = to_display_time(pd.Series([start_ms, end_ms]))
+    event_pass = EventPass(number, start, end, len(df), closest_readings, closest_times)
+    return [plot.summary_row(os.path.basename(capture_path), event_pass)]
+
+def plot_capture_rows(capture_path):
+    """Worker: plot a whole capture like plot.py does and return its lowest_readings.csv rows."""
+    import plot
+    return [plot.summary_row(os.path.basename(capture_path), event_pass)
+            for event_pass in plot.process_and_plot(capture_path)]
+
+def start_observer(directory, changes):
+    """Watch directory with watchdog (inotify on Linux) and put changed paths on changes.
+
+    Returns the observer, or None when watchdog isn't installed and the
+    directory has to be polled.
+    """
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if not event.is_directory:
+                changes.put(getattr(event, 'dest_path', None) or event.src_path)
+
+    observer = Observer()
+    observer.schedule(Handler(), directory, recursive=True)
+    observer.start()
+    return observer
+
+class CaptureWatcher:
+    """Plots every pass of the captures written under a directory as soon as it is over.
+
+    New and growing captures are noticed through watchdog's file events
+    (inotify on Linux) or, without watchdog, by scanning the directory every
+    poll_interval. Each capture is tailed: only the new rows are parsed,
+    and each finished pass is handed to a worker process that draws its
+    PNG and returns its lowest_readings.csv row, appended in the order
+    the passes finished. A capture is done once its logger leaves a
+    <capture>.closed marker (watch: close_markers in config.yaml). One
+    that hasn't grown for quiet_seconds is only checked for growth from
+    then on: gated loggers write nothing between passes, so it is taken
+    up again, with its pass numbering, as soon as it grows. Captures with
+    date string timestamps can't be tailed and are plotted whole once
+    they go quiet.
+    """
+    def __init__(self, directory, config, jobs=DEFAULT_JOBS, quiet_seconds=DEFAULT_QUIET_SECONDS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, existing=False, use_events=True):
+        self.directory = directory
+        self.config = config
+        self.quiet_seconds = quiet_seconds
+        self.poll_interval = poll_interval
+        self.existing = existing
+        self.settle_seconds = pass_settings(config)[1] + poll_interval
+        self.active = {}
+        self.idle = {}  # Quiet captures without a close marker, which may still grow
+        self.done = set()
+        self.results = deque()  # Futures in the order the passes finished
+        self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker)
+        self.changes = queue.SimpleQueue()
+        self.observer = start_observer(directory, self.changes) if use_events else None
+
+    def scan(self, startup=False):
+        """Start watching captures under the directory that aren't watched or done yet."""
+        for path in capturefile.find_capture_files(self.directory):
+            self.notice(path, startup)
+
+    def notice(self, path, startup=False):
+        if path.endswith(capturefile.CLOSE_MARKER_SUFFIX):
+            path = path[:-len(capturefile.CLOSE_MARKER_SUFFIX)]
+        if path in self.idle:
+            capture = self.idle[path]
+            try:
+                grown = os.path.getsize(path) != capture.size
+            except OSError:
+                del self.idle[path]
+                return
+            if grown or os.path.exists(capturefile.close_marker_path(path)):
+                print(f"Watching {path} again")
+                self.active[path] = self.idle.pop(path)
+            return
+        if (path in self.active or path in self.done or not capturefile.is_capture_file(path) or
+                os.path.basename(path) == SUMMARY_NAME or not os.path.isfile(path)):
+            return
+        if startup and not self.existing and time.time() - os.path.getmtime(path) > self.quiet_seconds:
+            # Finished before the watcher started; plot.py <directory> covers those
+            self.done.add(path)
+            return
+        print(f"Watching {path}")
+        self.active[path] = WatchedCapture(path, self.config)
+
+    def submit_passes(self, capture, final=False):
+        for number, start, end, timestamps, sensors, measurements in capture.tracker.take_passes(final):
+            print(f"{capture.path}: pass {number} is over, plotting it")
+            self.results.append(self.executor.submit(plot_pass_rows, capture.path, number, start, end,
+                                                     timestamps, sensors, measurements))
+
+    def update(self, capture):
+        """Read what the capture gained and hand over the passes that are over.
+
+        Returns 'closed' once it is done for good, 'quiet' once it hasn't
+        grown for quiet_seconds, else None.
+        """
+        size = os.path.getsize(capture.path)
+        if size < capture.size:
+            print(f"{capture.path} got shorter; reading it again from the start")
+            self.active[capture.path] = capture = WatchedCapture(capture.path, self.config)
+        if size != capture.size:
+            capture.size = size
+            capture.changed_at = time.monotonic()
+            capture.settled = False
+            if not capture.whole_file:
+                try:
+                    capture.tracker.add(*capture.tail.read())
+                except (ValueError, KeyError) as e:
+                    print(f"Can't tail {capture.path} ({e}); it will be plotted whole once it is closed")
+                    capture.whole_file = True
+            if not capture.whole_file:
+                self.submit_passes(capture)
+
+        quiet = time.monotonic() - capture.changed_at
+        closed = os.path.exists(capturefile.close_marker_path(capture.path))
+        if capture.whole_file:
+            if closed or quiet >= self.quiet_seconds:
+                self.results.append(self.executor.submit(plot_capture_rows, capture.path))
+                return 'closed'
+            return None
+        if closed or (quiet >= min(self.settle_seconds, self.quiet_seconds) and not capture.settled):
+            # Nothing was written for a merge gap, so no low reading can still extend the open pass
+            self.submit_passes(capture, final=True)
+            capture.settled = True
+        if closed:
+            return 'closed'
+        return 'quiet' if quiet >= self.quiet_seconds else None
+
+    def write_results(self, wait=False):
+        """Append the rows of the passes plotted so far to lowest_readings.csv, oldest first."""
+        rows = []
+        while self.results and (wait or self.results[0].done()):
+            try:
+                rows.extend(self.results.popleft().result())
+            except Exception as e:
+                print(f"Failed to plot a pass: {e}")
+        if rows:
+            with open(os.path.join(self.directory, SUMMARY_NAME), 'a') as f:
+                f.writelines(rows)
+
+    def tick(self):
+        if self.observer is None:
+            self.scan()
+        else:
+            while not self.changes.empty():
+                self.notice(self.changes.get())
+        for path, capture in list(self.active.items()):
+            try:
+                state = self.update(capture)
+            except OSError as e:
+                print(f"Stopped watching {path}: {e}")
+                state = 'closed'
+            if state == 'quiet':
+                print(f"{path} has gone quiet; it will be watched again if it grows")
+                self.idle[path] = self.active.pop(path)
+            elif state == 'closed':
+                print(f"{path} is closed")
+                del self.active[path]
+                self.done.add(path)
+                try:
+                    os.remove(capturefile.close_marker_path(path))
+                except OSError:
+                    pass
+        self.write_results()
+
+    def run(self):
+        self.scan(startup=True)
+        print(f"Watching {self.directory} ({'file events' if self.observer else 'polling'}); Ctrl+C to stop")
+        try:
+            while True:
+                self.tick()
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        for path in self.active:
+            print(f"{path} was still being written; run plot.py on it once it is complete")
+        self.write_results(wait=True)
+        self.executor.shutdown()
+
+def main():
+    config = load_config()
+    quiet_seconds, poll_interval, jobs = watch_settings(config)
+    parser = argparse.ArgumentParser(description='Watch a capture directory and plot every pass as soon as it is over.')
+    parser.add_argument('directory', type=str, help='Directory the loggers write captures to')
+    parser.add_argument('--jobs', '-j', type=int, default=jobs, help='Worker processes that draw the plots')
+    parser.add_argument('--quiet', type=float, default=quiet_seconds, help='Seconds without growth after which a capture is only checked for growth or a close marker (it is picked up again when it grows)')
+    parser.add_argument('--poll', type=float, default=poll_interval, help='Seconds between checks of the watched captures')
+    parser.add_argument('--existing', action='store_true', help='Also process captures that were already complete when the watcher started')
+    parser.add_argument('--no-events', action='store_true', help='Scan the directory instead of using file events, even if watchdog is installed')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Invalid input: {args.directory}. Please provide a valid directory.")
+        return
+    watcher = CaptureWatcher(args.directory, config, jobs=args.jobs, quiet_seconds=args.quiet,
+                             poll_interval=args.poll, existing=args.existing, use_events=not args.no_events)
+    watcher.run()
+
+if __name__ == "__main__":
+    main()